@@ -0,0 +1,306 @@
+"""
+Бенчмарк ML ранжирования: синтетические пулы анкет разного размера, JSON и бинарный формат,
+отдельные замеры холодного старта, импорта, загрузки модели, разбора запроса, признаков, predict и сериализации ответа.
+
+    python3 bench_ranker.py --sizes 100 1000 10000 100000 --engines lightgbm numpy --output bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import binary_format
+import rank_profiles
+
+# Крупные города встречаются чаще: веса убывают по Ципфу
+CITIES = [
+    "Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург", "Казань", "Нижний Новгород",
+    "Челябинск", "Самара", "Омск", "Ростов-на-Дону", "Уфа", "Красноярск", "Воронеж", "Пермь",
+    "Волгоград", "Краснодар", "Саратов", "Тюмень", "Тольятти", "Ижевск",
+]
+CITY_WEIGHTS = [1 / (rank + 1) ** 1.1 for rank in range(len(CITIES))]
+
+# Варианты целей из анкеты (site/src/components/profile/EditGoalsModal.tsx)
+GOALS = ["секс", "обмен фото", "отношения на расстоянии", "отношения локально", "общение"]
+GOAL_WEIGHTS = [0.3, 0.15, 0.15, 0.15, 0.25]
+
+
+def make_profile(rng, index):
+    age = int(rng.triangular(18, 21, 45))
+    goals = set(rng.choices(GOALS, GOAL_WEIGHTS, k=rng.randint(1, 3)))
+    return {
+        "id": f"cm{index:023d}",
+        "city": rng.choices(CITIES, CITY_WEIGHTS)[0],
+        "birthYear": str(2025 - age),
+        "goals": sorted(goals),
+        "isVerified": rng.random() < 0.25,
+        "likesReceived": int(rng.expovariate(1 / 5)),
+    }
+
+
+def make_request(size, seed):
+    rng = random.Random(seed)
+    user = make_profile(rng, -1)
+    user = {"city": user["city"], "birthYear": user["birthYear"], "goals": user["goals"],
+            "trustScore": rng.randint(20, 80)}
+    return {"user": user, "profiles": [make_profile(rng, i) for i in range(size)]}
+
+
+def percentiles(samples):
+    values = np.array(samples) * 1000
+    return {
+        "mean": float(values.mean()),
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+    }
+
+
+def measure_imports(repeat):
+    """Время импорта модулей в свежем процессе, мс."""
+    results = {}
+    for module in ["numpy", "lightgbm"]:
+        code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+        samples = []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+            if out.returncode != 0:
+                break
+            samples.append(float(out.stdout))
+        results[module] = percentiles(samples) if samples else None
+    return results
+
+
+def measure_cold_start(engine, repeat):
+    """Полное время разового запуска rank_profiles.py на маленьком запросе, мс."""
+    payload = json.dumps(make_request(10, 0))
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rank_profiles.py")
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, script, "--engine", engine], input=payload,
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            return None
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def measure_model_load(engine, repeat):
+    # Первый вызов не считаем: в нём ещё импортируется lightgbm, импорт меряется отдельно
+    rank_profiles.load_model(engine)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model = rank_profiles.load_model(engine)
+        samples.append(time.perf_counter() - start)
+    return model, percentiles(samples)
+
+
+def run_json(payload, model):
+    stages = {}
+    start = time.perf_counter()
+    data = json.loads(payload)
+    stages["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    features = rank_profiles.compute_features(data["profiles"], data["user"])
+    stages["features"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = model.predict(features)
+    stages["predict"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    json.dumps([{"id": p["id"], "score": s} for p, s in zip(data["profiles"], scores.tolist())])
+    stages["serialize"] = time.perf_counter() - start
+    return stages
+
+
+def run_binary(payload, model):
+    stages = {}
+    start = time.perf_counter()
+    header, columns = binary_format.decode_request(payload)
+    stages["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    features = rank_profiles.compute_column_features(header, columns)
+    stages["features"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scores = model.predict(features)
+    stages["predict"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    binary_format.encode_reply(scores)
+    stages["serialize"] = time.perf_counter() - start
+    return stages
+
+
+RUNNERS = {"json": run_json, "binary": run_binary}
+
+
+def bench_case(model, request, fmt, repeat, warmup):
+    if fmt == "json":
+        payload = json.dumps(request)
+    else:
+        payload = binary_format.encode_request(request["profiles"], request["user"])
+
+    samples = {"parse": [], "features": [], "predict": [], "serialize": [], "total": []}
+    for i in range(warmup + repeat):
+        stages = RUNNERS[fmt](payload, model)
+        if i < warmup:
+            continue
+        for name, seconds in stages.items():
+            samples[name].append(seconds)
+        samples["total"].append(sum(stages.values()))
+
+    size = len(request["profiles"])
+    total_p50 = float(np.percentile(samples["total"], 50))
+    return {
+        "requestBytes": len(payload),
+        "stagesMs": {name: percentiles(values) for name, values in samples.items()},
+        "profilesPerSecond": size / total_p50 if total_p50 > 0 else None,
+        "requestsPerSecond": 1 / total_p50 if total_p50 > 0 else None,
+    }
+
+
+def bench_parallel(engine, model, sizes, worker_counts, repeat, seed):
+    """
+    predict одной матрицы признаков: в текущем потоке и пулом parallel_scoring из N процессов.
+    Ускорение = p50 одного потока / p50 пула; выше числа ядер машины оно не растёт.
+    """
+    import parallel_scoring
+
+    features = {}
+    for size in sizes:
+        request = make_request(size, seed + size)
+        features[size] = rank_profiles.compute_features(request["profiles"], request["user"])
+
+    results = []
+    single = {}
+    for size, matrix in features.items():
+        model.predict(matrix)
+        local = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model.predict(matrix)
+            local.append(time.perf_counter() - start)
+        single[size] = percentiles(local)
+        results.append({"size": size, "workers": 0, "predictMs": single[size], "speedup": 1.0})
+
+    for workers in worker_counts:
+        pool = parallel_scoring.ScoringPool(engine, workers)
+        try:
+            pool.load(rank_profiles.model_path)
+            for size, matrix in features.items():
+                pool.predict(rank_profiles.model_path, matrix)
+                samples = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    pool.predict(rank_profiles.model_path, matrix)
+                    samples.append(time.perf_counter() - start)
+                stats = percentiles(samples)
+                results.append({"size": size, "workers": workers, "predictMs": stats,
+                                "speedup": single[size]["p50"] / stats["p50"]})
+        finally:
+            pool.close()
+
+    for r in sorted(results, key=lambda r: (r["size"], r["workers"])):
+        label = "1 поток" if r["workers"] == 0 else f"пул x{r['workers']}"
+        print(f"[bench] {engine:8} parallel n={r['size']:<7} {label:9} p50={r['predictMs']['p50']:9.2f}ms "
+              f"ускорение {r['speedup']:.2f}x", file=sys.stderr)
+    return results
+
+
+def find_regressions(report, baseline, tolerance):
+    """Сравнивает p50 каждой стадии с прошлым отчётом; возвращает список замедлений больше tolerance."""
+    previous = {(c["engine"], c["format"], c["size"]): c for c in baseline["cases"]}
+    regressions = []
+    for case in report["cases"]:
+        old = previous.get((case["engine"], case["format"], case["size"]))
+        if old is None:
+            continue
+        for stage, stats in case["stagesMs"].items():
+            before = old["stagesMs"].get(stage, {}).get("p50")
+            # Доли миллисекунды слишком шумные, чтобы считать их регрессией
+            if before and stats["p50"] > before * (1 + tolerance) and stats["p50"] - before > 0.5:
+                regressions.append(f"{case['engine']}/{case['format']}/n={case['size']} {stage}: "
+                                   f"{before:.2f}ms -> {stats['p50']:.2f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк rank_profiles.py")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--engines", nargs="+", choices=["lightgbm", "numpy"], default=["lightgbm", "numpy"])
+    parser.add_argument("--formats", nargs="+", choices=list(RUNNERS), default=list(RUNNERS))
+    parser.add_argument("--repeat", type=int, default=20, help="замеров на каждый случай")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="прошлый отчёт: выйти с кодом 1, если какая-то стадия замедлилась")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое замедление p50, доля")
+    parser.add_argument("--parallel", type=int, nargs="*", metavar="WORKERS",
+                        help="замерить параллельный скоринг с указанным числом процессов "
+                             "(без значений — 1, 2, 4 … до числа ядер)")
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpuCount": os.cpu_count(),
+        "importMs": measure_imports(min(args.repeat, 5)),
+        "coldStartMs": {},
+        "modelLoadMs": {},
+        "cases": [],
+    }
+    requests = {size: make_request(size, args.seed + size) for size in args.sizes}
+
+    for engine in args.engines:
+        try:
+            model, report["modelLoadMs"][engine] = measure_model_load(engine, min(args.repeat, 5))
+            report["coldStartMs"][engine] = measure_cold_start(engine, min(args.repeat, 5))
+        except ImportError as e:
+            print(f"[bench] {engine}: пропущен ({e})", file=sys.stderr)
+            continue
+
+        for size, request in requests.items():
+            for fmt in args.formats:
+                case = {"engine": engine, "format": fmt, "size": size}
+                case.update(bench_case(model, request, fmt, args.repeat, args.warmup))
+                report["cases"].append(case)
+
+                total = case["stagesMs"]["total"]
+                print(f"[bench] {engine:8} {fmt:6} n={size:<7} p50={total['p50']:9.2f}ms "
+                      f"p99={total['p99']:9.2f}ms {case['profilesPerSecond']:12.0f} анкет/с", file=sys.stderr)
+
+        if args.parallel is not None:
+            import parallel_scoring
+
+            cores = parallel_scoring.default_workers()
+            worker_counts = args.parallel or sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+            report.setdefault("parallel", {})[engine] = bench_parallel(
+                engine, model, args.sizes, worker_counts, args.repeat, args.seed)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[bench] результаты записаны в {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"[bench] регрессия: {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Компактный бинарный формат запросов и ответов rank_profiles.py (--format binary).
+
+Запрос: b"RKQ1", длина заголовка uint32, JSON-заголовок
+{"count", "cities", "goals", "user", "columns", "top_k"}, затем колонки анкет
+в порядке "columns", каждая с выравниванием на 8 байт:
+city int32 (код в "cities"), birthYear int32, goals uint64 (битовая маска по "goals"),
+isVerified uint8, likesReceived float32 и необязательный scoreMultiplier float32.
+
+Ответ: b"RKS1", count uint32, flags uint32, при flags & HAS_INDICES — int32 индексы
+анкет, затем float32 скоры, при flags & HAS_MODEL — длина uint32 и JSON
+{"version", "scoringMs"} версии модели, посчитавшей ответ. Ошибка: b"RKE1" и текст в UTF-8.
+
+В режиме --serve каждое сообщение обёрнуто в кадр: длина uint32 и ID запроса uint32.
+Все числа little-endian.
+"""
+import json
+import struct
+
+import numpy as np
+
+REQUEST_MAGIC = b"RKQ1"
+REPLY_MAGIC = b"RKS1"
+ERROR_MAGIC = b"RKE1"
+
+HAS_INDICES = 1
+HAS_MODEL = 2
+
+COLUMN_TYPES = {
+    "city": np.dtype("<i4"),
+    "birthYear": np.dtype("<i4"),
+    "goals": np.dtype("<u8"),
+    "isVerified": np.dtype("u1"),
+    "likesReceived": np.dtype("<f4"),
+    "scoreMultiplier": np.dtype("<f4"),
+}
+REQUIRED_COLUMNS = ["city", "birthYear", "goals", "isVerified", "likesReceived"]
+
+_PREFIX = struct.Struct("<4sI")
+_REPLY_HEADER = struct.Struct("<4sII")
+_FRAME = struct.Struct("<II")
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def encode_request(profiles, user, top_k=None):
+    """Упаковывает анкеты в колонки; ID анкет не передаются, ответ ссылается на позиции."""
+    n = len(profiles)
+    cities, goals = {}, {}
+
+    goal_masks = np.zeros(n, dtype=COLUMN_TYPES["goals"])
+    for i, p in enumerate(profiles):
+        mask = 0
+        for goal in set(p.get("goals", [])):
+            code = goals.setdefault(goal, len(goals))
+            if code >= 64:
+                raise ValueError("Binary format supports at most 64 distinct goals")
+            mask |= 1 << code
+        goal_masks[i] = mask
+
+    columns = {
+        "city": np.fromiter((cities.setdefault(p["city"], len(cities)) for p in profiles),
+                            dtype=COLUMN_TYPES["city"], count=n),
+        "birthYear": np.fromiter((int(p["birthYear"]) for p in profiles), dtype=COLUMN_TYPES["birthYear"], count=n),
+        "goals": goal_masks,
+        "isVerified": np.fromiter((bool(p.get("isVerified", False)) for p in profiles),
+                                  dtype=COLUMN_TYPES["isVerified"], count=n),
+        "likesReceived": np.fromiter((p.get("likesReceived", 0) for p in profiles),
+                                     dtype=COLUMN_TYPES["likesReceived"], count=n),
+    }
+    if any("scoreMultiplier" in p for p in profiles):
+        columns["scoreMultiplier"] = np.fromiter((p.get("scoreMultiplier", 1.0) for p in profiles),
+                                                 dtype=COLUMN_TYPES["scoreMultiplier"], count=n)
+
+    header = json.dumps({
+        "count": n,
+        "cities": list(cities),
+        "goals": list(goals),
+        "user": user,
+        "columns": list(columns),
+        "top_k": top_k,
+    }).encode()
+
+    parts = [_PREFIX.pack(REQUEST_MAGIC, len(header)), header]
+    offset = _PREFIX.size + len(header)
+    for column in columns.values():
+        padding = _align(offset) - offset
+        parts.append(b"\0" * padding)
+        parts.append(column.tobytes())
+        offset += padding + column.nbytes
+    return b"".join(parts)
+
+
+def decode_request(buffer):
+    """Возвращает (заголовок, {колонка: массив}); массивы — представления над buffer без копирования."""
+    if len(buffer) < _PREFIX.size or bytes(buffer[:4]) != REQUEST_MAGIC:
+        raise ValueError("Not a binary ranking request")
+    _, header_size = _PREFIX.unpack_from(buffer, 0)
+
+    offset = _PREFIX.size
+    header = json.loads(bytes(buffer[offset:offset + header_size]))
+    offset += header_size
+
+    missing = set(REQUIRED_COLUMNS) - set(header["columns"])
+    if missing:
+        raise ValueError(f"Missing columns: {sorted(missing)}")
+
+    n = header["count"]
+    columns = {}
+    for name in header["columns"]:
+        dtype = COLUMN_TYPES[name]
+        offset = _align(offset)
+        columns[name] = np.frombuffer(buffer, dtype=dtype, count=n, offset=offset)
+        offset += n * dtype.itemsize
+    return header, columns
+
+
+def encode_reply(scores, indices=None, model=None):
+    scores = np.asarray(scores, dtype="<f4")
+    flags = (HAS_INDICES if indices is not None else 0) | (HAS_MODEL if model is not None else 0)
+    parts = [_REPLY_HEADER.pack(REPLY_MAGIC, len(scores), flags)]
+    if indices is not None:
+        parts.append(np.asarray(indices, dtype="<i4").tobytes())
+    parts.append(scores.tobytes())
+    if model is not None:
+        info = json.dumps(model).encode()
+        parts += [struct.pack("<I", len(info)), info]
+    return b"".join(parts)
+
+
+def decode_reply(buffer):
+    """Возвращает (индексы или None, скоры float32); при ответе-ошибке бросает RuntimeError."""
+    if bytes(buffer[:4]) == ERROR_MAGIC:
+        raise RuntimeError(bytes(buffer[4:]).decode())
+
+    magic, count, flags = _REPLY_HEADER.unpack_from(buffer, 0)
+    if magic != REPLY_MAGIC:
+        raise ValueError("Not a binary ranking reply")
+
+    offset = _REPLY_HEADER.size
+    indices = None
+    if flags & HAS_INDICES:
+        indices = np.frombuffer(buffer, dtype="<i4", count=count, offset=offset)
+        offset += 4 * count
+    return indices, np.frombuffer(buffer, dtype="<f4", count=count, offset=offset)
+
+
+def decode_reply_model(buffer):
+    """Версия модели и время скоринга из ответа ({"version", "scoringMs"}) или None."""
+    magic, count, flags = _REPLY_HEADER.unpack_from(buffer, 0)
+    if magic != REPLY_MAGIC or not flags & HAS_MODEL:
+        return None
+    offset = _REPLY_HEADER.size + (8 if flags & HAS_INDICES else 4) * count
+    (size,) = struct.unpack_from("<I", buffer, offset)
+    return json.loads(bytes(buffer[offset + 4:offset + 4 + size]))
+
+
+def encode_error(message):
+    return ERROR_MAGIC + message.encode()
+
+
+def read_frame(stream):
+    """Читает кадр (ID запроса, payload) из бинарного потока; None в конце потока."""
+    prefix = stream.read(_FRAME.size)
+    if len(prefix) < _FRAME.size:
+        return None
+    size, request_id = _FRAME.unpack(prefix)
+    payload = stream.read(size)
+    if len(payload) < size:
+        return None
+    return request_id, payload
+
+
+def write_frame(stream, request_id, payload):
+    stream.write(_FRAME.pack(len(payload), request_id))
+    stream.write(payload)
+    stream.flush()
@@ -0,0 +1,377 @@
+"""
+Версии модели для режима --serve: каталог models/<версия>/model.txt, фоновая
+загрузка и прогрев новой версии, атомарное переключение и откат на предыдущую.
+
+Новая версия публикуется атомарно: файлы копируются во временный каталог и он
+переименовывается в models/<версия> (так делает `python3 model_registry.py publish`),
+поэтому процесс никогда не читает недописанный model.txt. Активной становится
+последняя по имени версия; имена сортируются «естественно» (v2 < v10), удобно
+называть их датой: 20250723-1200.
+
+Откаченные и не загрузившиеся версии записываются в models/.rejected, чтобы
+разовые запуски rank_profiles.py и перезапущенный --serve выбирали ту же
+версию, что и работающий процесс.
+
+    python3 model_registry.py publish path/to/model.txt [--version 20250723-1200]
+    python3 model_registry.py list
+"""
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+MODEL_FILE = "model.txt"
+
+# Список отклонённых версий в каталоге версий, по одной на строку
+REJECTED_FILE = ".rejected"
+
+# Версия для model.txt рядом со скриптом, если каталога версий нет
+BUILTIN_VERSION = "builtin"
+
+# Сколько последних замеров держать на версию для перцентилей
+LATENCY_WINDOW = 1024
+
+
+def version_key(name):
+    """Естественная сортировка: числа внутри имени сравниваются как числа."""
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", name) if part]
+
+
+def list_versions(models_dir):
+    """Опубликованные версии по возрастанию; служебные и временные каталоги (.*) пропускаются."""
+    try:
+        entries = os.listdir(models_dir)
+    except FileNotFoundError:
+        return []
+    versions = [name for name in entries
+                if not name.startswith(".") and os.path.isfile(os.path.join(models_dir, name, MODEL_FILE))]
+    return sorted(versions, key=version_key)
+
+
+def read_rejected(models_dir):
+    try:
+        with open(os.path.join(models_dir, REJECTED_FILE), encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def write_rejected(models_dir, rejected):
+    """Атомарно перезаписывает models/.rejected: читатели видят либо старый, либо новый список."""
+    path = os.path.join(models_dir, REJECTED_FILE)
+    if not rejected and not os.path.exists(path):
+        return
+    os.makedirs(models_dir, exist_ok=True)
+    staging = f"{path}.{os.getpid()}.tmp"
+    with open(staging, "w", encoding="utf-8") as f:
+        f.writelines(f"{version}\n" for version in sorted(rejected, key=version_key))
+    os.replace(staging, path)
+
+
+def load_latest(load, models_dir, builtin_path=None, log=None):
+    """
+    (версия, модель) последней неотклонённой версии, которая загружается; если
+    таких нет — встроенный model.txt. Так выбирает версию разовый запуск.
+    """
+    rejected = read_rejected(models_dir)
+    for version in reversed(list_versions(models_dir)):
+        if version in rejected:
+            continue
+        try:
+            return version, load(os.path.join(models_dir, version, MODEL_FILE))
+        except Exception as e:
+            if log is not None:
+                log(f"версия {version} не загрузилась: {e}")
+    if builtin_path is None:
+        raise FileNotFoundError(f"Нет ни одной рабочей версии модели в {models_dir}")
+    return BUILTIN_VERSION, load(builtin_path)
+
+
+class ModelVersion:
+    """Загруженная модель одной версии и её задержки скоринга."""
+
+    def __init__(self, version, model, load_seconds):
+        self.version = version
+        self.model = model
+        self.load_seconds = load_seconds
+        self.requests = 0
+        self.total_seconds = 0.0
+        self._recent = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.requests += 1
+            self.total_seconds += seconds
+            self._recent.append(seconds)
+
+    def stats(self):
+        with self._lock:
+            recent = np.array(self._recent) * 1000 if self._recent else None
+            return {
+                "requests": self.requests,
+                "loadMs": round(self.load_seconds * 1000, 2),
+                "meanMs": round(self.total_seconds / self.requests * 1000, 3) if self.requests else None,
+                "p50Ms": round(float(np.percentile(recent, 50)), 3) if recent is not None else None,
+                "p99Ms": round(float(np.percentile(recent, 99)), 3) if recent is not None else None,
+            }
+
+
+class ModelRegistry:
+    """
+    Активная и предыдущая версии модели.
+
+    Обработчик запроса один раз читает registry.active и считает весь запрос этой
+    версией — переключение не смешивает скоры двух моделей в одном ответе.
+    Новая версия загружается и прогревается в фоне, затем подменяет active одним
+    присваиванием; предыдущая остаётся в памяти для мгновенного rollback().
+    Откаченная версия и версии, которые не загрузились, больше автоматически не
+    подхватываются, пока не появится версия новее; этот список хранится в
+    models/.rejected и переживает перезапуск. Явный activate() более старой
+    версии закрепляет её тем же способом: все опубликованные версии новее неё
+    отклоняются, поэтому наблюдатель и разовые запуски остаются на ней, пока не
+    будет опубликована ещё более новая версия.
+
+    on_switch(старая, новая) вызывается после каждого переключения — например,
+    чтобы очистить кэш скоров.
+    """
+
+    def __init__(self, load, models_dir, builtin_path=None, on_switch=None, log=None):
+        self.load = load
+        self.models_dir = models_dir
+        self.builtin_path = builtin_path
+        self.on_switch = on_switch
+        self.log = log or (lambda message: print(f"[model_registry] {message}", file=sys.stderr))
+        self.active = None
+        self.previous = None
+        self._rejected = read_rejected(models_dir)
+        self._switch_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def start(self):
+        """
+        Синхронно загружает последнюю рабочую неотклонённую версию (или встроенный
+        model.txt); без модели процесс не стартует.
+        """
+        for version in reversed(list_versions(self.models_dir)):
+            if version in self._rejected:
+                continue
+            try:
+                self._activate(self._prepare(version))
+                return self.active
+            except Exception as e:
+                self._reject(version)
+                self.log(f"версия {version} не загрузилась: {e}")
+
+        if self.builtin_path is None:
+            raise FileNotFoundError(f"Нет ни одной рабочей версии модели в {self.models_dir}")
+        self._activate(self._prepare(BUILTIN_VERSION, self.builtin_path))
+        return self.active
+
+    def watch(self, interval=5.0):
+        """Фоновый поток, который раз в interval секунд ищет новую версию."""
+        self._watcher = threading.Thread(target=self._watch_loop, args=(interval,), name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self):
+        """Один проход наблюдателя: загружает и включает новую версию, если она есть. Возвращает её имя или None."""
+        candidate = self._newest_candidate()
+        if candidate is None:
+            return None
+        try:
+            prepared = self._prepare(candidate)
+        except Exception as e:
+            self._reject(candidate)
+            self.log(f"версия {candidate} не загрузилась, остаёмся на {self.active.version}: {e}")
+            return None
+        self._activate(prepared)
+        return candidate
+
+    def activate(self, version):
+        """
+        Явно загружает и включает указанную версию (в том числе ранее откаченную)
+        и закрепляет её: версии новее неё отклоняются.
+        """
+        if self.active is not None and self.active.version == version:
+            prepared = self.active
+        elif self.previous is not None and self.previous.version == version:
+            prepared = self.previous
+        elif version == BUILTIN_VERSION and self.builtin_path is not None:
+            prepared = self._prepare(version, self.builtin_path)
+        else:
+            prepared = self._prepare(version)
+
+        newer = {v for v in list_versions(self.models_dir)
+                 if version == BUILTIN_VERSION or version_key(v) > version_key(version)}
+        rejected = (self._rejected | newer) - {version}
+        if rejected != self._rejected:
+            self._rejected = rejected
+            self._save_rejected()
+        self._activate(prepared)
+        self._drop_rejected_previous()
+        return prepared
+
+    def rollback(self):
+        """
+        Мгновенно возвращает предыдущую версию; текущая помечается как отклонённая
+        и выгружается, поэтому повторный откат без новой версии невозможен.
+        """
+        with self._switch_lock:
+            if self.previous is None or self.previous.version in self._rejected:
+                raise RuntimeError("Нет предыдущей версии модели для отката")
+            old, new = self.active, self.previous
+            self.active, self.previous = new, None
+        self._reject(old.version)
+        self.log(f"откат {old.version} → {new.version}")
+        self._notify(old, new)
+        return new
+
+    def stats(self):
+        versions = {}
+        for loaded in (self.previous, self.active):
+            if loaded is not None:
+                versions[loaded.version] = loaded.stats()
+        return {
+            "active": self.active.version if self.active else None,
+            "previous": self.previous.version if self.previous else None,
+            "available": list_versions(self.models_dir),
+            "rejected": sorted(self._rejected, key=version_key),
+            "versions": versions,
+        }
+
+    def _drop_rejected_previous(self):
+        # Откат на отклонённую версию разошёлся бы с разовыми запусками, которые её пропускают
+        with self._switch_lock:
+            if self.previous is not None and self.previous.version in self._rejected:
+                self.previous = None
+
+    def _reject(self, version):
+        if version != BUILTIN_VERSION:
+            self._rejected.add(version)
+            self._save_rejected()
+
+    def _save_rejected(self):
+        try:
+            write_rejected(self.models_dir, self._rejected)
+        except OSError as e:
+            self.log(f"не удалось сохранить список отклонённых версий: {e}")
+
+    def _newest_candidate(self):
+        versions = [v for v in list_versions(self.models_dir) if v not in self._rejected]
+        if not versions:
+            return None
+        newest = versions[-1]
+        current = self.active.version if self.active else None
+        if newest == current:
+            return None
+        # Встроенный model.txt уступает любой опубликованной версии, иначе нужна версия новее текущей
+        if current not in (None, BUILTIN_VERSION) and version_key(newest) <= version_key(current):
+            return None
+        return newest
+
+    def _prepare(self, version, path=None):
+        """Загружает модель и прогревает её до того, как на неё пойдут запросы."""
+        path = path or os.path.join(self.models_dir, version, MODEL_FILE)
+        started = time.perf_counter()
+        model = self.load(path)
+        warm_up(model)
+        loaded = ModelVersion(version, model, time.perf_counter() - started)
+        self.log(f"версия {version} загружена и прогрета за {loaded.load_seconds * 1000:.0f} мс")
+        return loaded
+
+    def _activate(self, loaded):
+        with self._switch_lock:
+            old = self.active
+            self.active = loaded
+            if old is not None and old is not loaded:
+                self.previous = old
+        if old is not None and old is not loaded:
+            self.log(f"переключено {old.version} → {loaded.version}")
+            self._notify(old, loaded)
+
+    def _notify(self, old, new):
+        if self.on_switch is not None:
+            try:
+                self.on_switch(old, new)
+            except Exception as e:
+                self.log(f"ошибка обработчика переключения: {e}")
+
+    def _watch_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.log(f"ошибка проверки новых версий: {e}")
+
+
+def warm_up(model, rows=512, seed=0):
+    """
+    Прогоняет модель на синтетических признаках: первые вызовы predict медленнее
+    (аллокации, ленивые структуры LightGBM), а заодно проверяет, что скоры конечны.
+    """
+    rng = np.random.default_rng(seed)
+    features = np.column_stack([
+        rng.integers(0, 2, rows),
+        rng.integers(0, 30, rows),
+        rng.integers(0, 4, rows),
+        rng.integers(0, 100, rows),
+        rng.integers(0, 2, rows),
+        rng.exponential(5, rows),
+    ]).astype(np.float32)
+    for size in (1, 16, rows):
+        scores = np.asarray(model.predict(features[:size]))
+        if scores.shape != (size,) or not np.all(np.isfinite(scores)):
+            raise ValueError("модель вернула некорректные скоры на прогреве")
+
+
+def publish(source, models_dir, version=None):
+    """Копирует model.txt в models/<версия> атомарным переименованием временного каталога."""
+    import shutil
+    import tempfile
+
+    version = version or time.strftime("%Y%m%d-%H%M%S")
+    target = os.path.join(models_dir, version)
+    if os.path.exists(target):
+        raise FileExistsError(f"Версия {version} уже существует")
+
+    os.makedirs(models_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=models_dir)
+    try:
+        shutil.copyfile(source, os.path.join(staging, MODEL_FILE))
+        os.rename(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return version
+
+
+def main():
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+    parser = argparse.ArgumentParser(description="Версии модели ранжирования")
+    parser.add_argument("--models-dir", default=default_dir)
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish_parser = commands.add_parser("publish", help="опубликовать model.txt новой версией")
+    publish_parser.add_argument("source")
+    publish_parser.add_argument("--version", help="имя версии (по умолчанию — текущие дата и время)")
+    commands.add_parser("list", help="показать опубликованные версии (отклонённые помечены)")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        print(publish(args.source, args.models_dir, args.version))
+    else:
+        rejected = read_rejected(args.models_dir)
+        for version in list_versions(args.models_dir):
+            print(f"{version}\tотклонена" if version in rejected else version)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Параллельный скоринг больших пулов анкет для режима --serve: постоянный пул
+процессов, у каждого своя копия модели, признаки и скоры передаются через
+общую память (multiprocessing.shared_memory), а не сериализуются.
+
+Матрица признаков копируется один раз в общий буфер, каждый процесс считает
+свой непрерывный диапазон строк и пишет скоры в общий выходной буфер; по каналу
+уходят только смещения. Пулы меньше min_rows считаются в текущем потоке: для них
+пересылка команд дороже самого predict.
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Ниже этого числа строк параллельный скоринг не окупается (замерено bench_ranker.py --parallel)
+DEFAULT_MIN_ROWS = 20000
+
+# Сколько ждать ответа процессов пула на одну команду, секунд; завис — пул перезапускается
+DEFAULT_TIMEOUT = 30.0
+
+# Сколько версий модели держит каждый процесс пула: активная и предыдущая для отката
+_WORKER_MODELS = 2
+
+
+def _attach(name, cache):
+    """
+    Подключает общий буфер по имени; буферы пересоздаются только при росте, поэтому кэшируются.
+    resource_tracker у процессов пула общий с родителем (spawn передаёт его дескриптор),
+    так что повторная регистрация безвредна, а удаляет буфер только родитель.
+    """
+    shm = cache.get(name)
+    if shm is None:
+        shm = cache[name] = shared_memory.SharedMemory(name=name)
+    return shm
+
+
+def _worker(conn, engine):
+    # Один процесс — одно ядро: внутренние потоки OpenMP в LightGBM только мешали бы соседям
+    os.environ["OMP_NUM_THREADS"] = "1"
+    import rank_profiles
+
+    models = {}
+    buffers = {}
+
+    def model_for(path):
+        if path not in models:
+            models[path] = rank_profiles.load_model(engine, path)
+            while len(models) > _WORKER_MODELS:
+                models.pop(next(iter(models)))
+        return models[path]
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        command = message[0]
+        try:
+            if command == "load":
+                model_for(message[1])
+                conn.send(("ok",))
+            elif command == "score":
+                _, path, in_name, out_name, rows, cols, start, stop = message
+                features = np.ndarray((rows, cols), dtype=np.float32, buffer=_attach(in_name, buffers).buf)
+                scores = np.ndarray((rows,), dtype=np.float64, buffer=_attach(out_name, buffers).buf)
+                scores[start:stop] = model_for(path).predict(features[start:stop])
+                conn.send(("ok",))
+            elif command == "release":
+                for name in message[1]:
+                    shm = buffers.pop(name, None)
+                    if shm is not None:
+                        shm.close()
+                conn.send(("ok",))
+            elif command == "stop":
+                return
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class ScoringPool:
+    """
+    Постоянные процессы для скоринга. Процессы запускаются через spawn: в
+    режиме --serve уже работают потоки, и fork мог бы унаследовать занятые блокировки.
+    Одновременно пул обслуживает один большой запрос — он и так занимает все ядра,
+    маленькие запросы в это время считаются в своих потоках.
+
+    Если процесс пула упал или не ответил за timeout секунд, следующая команда
+    перезапускает все процессы; модели в новых процессах загружаются при первом скоринге.
+    """
+
+    def __init__(self, engine, workers, timeout=DEFAULT_TIMEOUT):
+        self.engine = engine
+        self.workers = workers
+        self.timeout = timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._conns = []
+        self._processes = []
+        self._lock = threading.Lock()
+        self._input = None
+        self._output = None
+        self._broken = False
+        self._spawn()
+
+    def _spawn(self):
+        for _ in range(self.workers):
+            parent, child = self._context.Pipe()
+            process = self._context.Process(target=_worker, args=(child, self.engine), daemon=True)
+            process.start()
+            child.close()
+            self._conns.append(parent)
+            self._processes.append(process)
+
+    def _restart(self):
+        print("[parallel_scoring] процесс пула упал или завис, перезапускаю пул", file=sys.stderr)
+        for process in self._processes:
+            process.kill()
+            process.join(timeout=5)
+        for conn in self._conns:
+            conn.close()
+        self._conns = []
+        self._processes = []
+        self._spawn()
+        self._broken = False
+
+    def load(self, path):
+        """Загружает версию модели во все процессы заранее, чтобы первый большой запрос не ждал."""
+        with self._lock:
+            self._broadcast([("load", path)] * self.workers)
+
+    def predict(self, path, features):
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        rows, cols = features.shape
+        with self._lock:
+            self._ensure_capacity(features.nbytes, rows * 8)
+            np.ndarray(features.shape, dtype=np.float32, buffer=self._input.buf)[:] = features
+
+            bounds = np.linspace(0, rows, self.workers + 1).astype(int)
+            self._broadcast([
+                ("score", path, self._input.name, self._output.name, rows, cols, int(start), int(stop))
+                for start, stop in zip(bounds[:-1], bounds[1:])
+            ])
+            return np.ndarray((rows,), dtype=np.float64, buffer=self._output.buf).copy()
+
+    def close(self):
+        with self._lock:
+            for conn in self._conns:
+                try:
+                    conn.send(("stop",))
+                except OSError:
+                    pass
+            for process in self._processes:
+                process.join(timeout=5)
+            for shm in (self._input, self._output):
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+            self._input = self._output = None
+
+    def _ensure_capacity(self, input_bytes, output_bytes):
+        if self._input is not None and self._input.size >= input_bytes and self._output.size >= output_bytes:
+            return
+        old = [shm for shm in (self._input, self._output) if shm is not None]
+        # С запасом, чтобы пул чуть большего размера не пересоздавал буферы каждый раз
+        self._input = shared_memory.SharedMemory(create=True, size=max(int(input_bytes * 1.5), 1))
+        self._output = shared_memory.SharedMemory(create=True, size=max(int(output_bytes * 1.5), 1))
+        if old:
+            self._broadcast([("release", [shm.name for shm in old])] * self.workers)
+            for shm in old:
+                shm.close()
+                shm.unlink()
+
+    def _broadcast(self, messages):
+        # Если процесс пула умер, ответы остальных уже не сопоставить с командами — пул пересоздаётся целиком
+        if self._broken:
+            self._restart()
+        try:
+            for conn, message in zip(self._conns, messages):
+                conn.send(message)
+            deadline = time.monotonic() + self.timeout
+            replies = []
+            for conn in self._conns[:len(messages)]:
+                if not conn.poll(max(0.0, deadline - time.monotonic())):
+                    raise TimeoutError(f"процесс пула не ответил за {self.timeout:g} с")
+                replies.append(conn.recv())
+        except (OSError, EOFError):
+            self._broken = True
+            raise
+        errors = [reply[1] for reply in replies if reply[0] != "ok"]
+        if errors:
+            raise RuntimeError(f"Ошибка процесса скоринга: {errors[0]}")
+
+
+class ParallelModel:
+    """
+    Модель с тем же predict(features): большие матрицы считаются пулом,
+    маленькие — локальной копией модели в текущем потоке. Если пул сломался
+    (процесс упал), запрос досчитывается локально. Сбой пула не мешает загрузить
+    версию модели: реестр не должен отклонять исправную версию из-за пула.
+    """
+
+    def __init__(self, model, path, pool, min_rows=DEFAULT_MIN_ROWS):
+        self.model = model
+        self.path = path
+        self.pool = pool
+        self.min_rows = min_rows
+        try:
+            pool.load(path)
+        except (OSError, EOFError, RuntimeError) as e:
+            print(f"[parallel_scoring] не удалось загрузить модель в пул, загрузится при первом скоринге: {e}",
+                  file=sys.stderr)
+
+    def predict(self, features):
+        if len(features) < max(self.min_rows, self.pool.workers):
+            return self.model.predict(features)
+        try:
+            return self.pool.predict(self.path, features)
+        except (OSError, EOFError, RuntimeError) as e:
+            print(f"[parallel_scoring] пул недоступен, считаю в текущем потоке: {e}", file=sys.stderr)
+            return self.model.predict(features)
+
+
+def default_workers():
+    """Число доступных процессу ядер (с учётом cpu affinity в контейнере)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
@@ -1,33 +1,459 @@
-import pandas as pd
-import lightgbm as lgb
-import json
-import sys
-import os
-
-# Получаем абсолютный путь к директории скрипта
-script_dir = os.path.dirname(os.path.abspath(__file__))
-model_path = os.path.join(script_dir, "model.txt")
-
-data = json.load(sys.stdin)
-profiles = pd.DataFrame(data["profiles"])
-user = data["user"]
-
-def compute_features(profile):
-    return {
-        "profileId": profile["id"],
-        "sameCity": int(profile["city"] == user["city"]),
-        "ageDiff": abs(int(profile["birthYear"]) - int(user["birthYear"])),
-        "goalsMatchCount": len(set(profile.get("goals", [])) & set(user.get("goals", []))),
-        "trustScore": user.get("trustScore", 40),
-        "isVerified": int(profile.get("isVerified", False)),
-        "likesReceived": profile.get("likesReceived", 0),
-    }
-
-features = pd.DataFrame([compute_features(p) for p in data["profiles"]])
-profile_ids = features.pop("profileId")
-
-model = lgb.Booster(model_file=model_path)
-scores = model.predict(features)
-
-result = [{"id": pid, "score": s} for pid, s in zip(profile_ids, scores)]
-print(json.dumps(result))
+import time
+
+# Момент запуска скрипта для --timing, до остальных импортов
+started_at = time.perf_counter()
+
+import argparse
+import json
+import sys
+import os
+
+import numpy as np
+
+# Получаем абсолютный путь к директории скрипта
+script_dir = os.path.dirname(os.path.abspath(__file__))
+model_path = os.path.join(script_dir, "model.txt")
+# Предрасчитанный снимок деревьев для --engine numpy, пересобирается при изменении model.txt
+snapshot_path = os.path.join(script_dir, "model.npz")
+# Опубликованные версии модели (model_registry.py); без них используется model.txt
+models_dir = os.path.join(script_dir, "models")
+
+
+# Порядок колонок совпадает с feature_names в model.txt
+FEATURE_NAMES = ["sameCity", "ageDiff", "goalsMatchCount", "trustScore", "isVerified", "likesReceived"]
+
+
+def _goal_indicators(goal_lists, goal_index):
+    """Индикаторная матрица (строки, цели) float32 по словарю целей goal_index."""
+    rows, cols = [], []
+    for row, goals in enumerate(goal_lists):
+        for goal in goals:
+            col = goal_index.get(goal)
+            if col is not None:
+                rows.append(row)
+                cols.append(col)
+
+    indicators = np.zeros((len(goal_lists), len(goal_index)), dtype=np.float32)
+    indicators[rows, cols] = 1
+    return indicators
+
+
+def compute_pair_features(profiles, users, user_index, profile_index):
+    """
+    Строит матрицу признаков float32 (пары, 6) для пар (users[user_index[i]], profiles[profile_index[i]]).
+
+    Колонки анкет и пользователей кодируются один раз: города — целочисленными кодами,
+    цели — индикаторными матрицами по словарю целей пользователей, поэтому
+    goalsMatchCount — скалярное произведение строк индикаторов.
+    """
+    n_profiles, n_users = len(profiles), len(users)
+    city_codes = {}
+    profile_city = np.fromiter((city_codes.setdefault(p["city"], len(city_codes)) for p in profiles),
+                               dtype=np.int64, count=n_profiles)
+    user_city = np.fromiter((city_codes.setdefault(u["city"], len(city_codes)) for u in users),
+                            dtype=np.int64, count=n_users)
+
+    profile_birth = np.fromiter((int(p["birthYear"]) for p in profiles), dtype=np.int64, count=n_profiles)
+    user_birth = np.fromiter((int(u["birthYear"]) for u in users), dtype=np.int64, count=n_users)
+
+    goal_index = {}
+    for u in users:
+        for goal in u.get("goals", []):
+            goal_index.setdefault(goal, len(goal_index))
+    # set() убирает повторы целей внутри анкеты, как в пересечении множеств
+    profile_goals = _goal_indicators([set(p.get("goals", [])) for p in profiles], goal_index)
+    user_goals = _goal_indicators([set(u.get("goals", [])) for u in users], goal_index)
+
+    verified = np.fromiter((bool(p.get("isVerified", False)) for p in profiles), dtype=bool, count=n_profiles)
+    likes = np.fromiter((p.get("likesReceived", 0) for p in profiles), dtype=np.float64, count=n_profiles)
+    trust = np.fromiter((u.get("trustScore", 40) for u in users), dtype=np.float64, count=n_users)
+
+    features = np.empty((len(profile_index), len(FEATURE_NAMES)), dtype=np.float32)
+    features[:, 0] = profile_city[profile_index] == user_city[user_index]
+    features[:, 1] = np.abs(profile_birth[profile_index] - user_birth[user_index])
+    features[:, 2] = np.einsum("ij,ij->i", profile_goals[profile_index], user_goals[user_index])
+    features[:, 3] = trust[user_index]
+    features[:, 4] = verified[profile_index]
+    features[:, 5] = likes[profile_index]
+    return features
+
+
+def compute_features(profiles, user):
+    """Матрица признаков (n, 6) float32 для всех анкет одного пользователя."""
+    n = len(profiles)
+    return compute_pair_features(profiles, [user], np.zeros(n, dtype=np.intp), np.arange(n))
+
+
+def compute_column_features(header, columns):
+    """Матрица признаков для бинарного запроса: колонки уже закодированы, анкеты не разбираются по одной."""
+    user = header["user"]
+    city_code = {city: code for code, city in enumerate(header["cities"])}.get(user["city"], -1)
+    user_goals = set(user.get("goals", []))
+    goal_bits = [np.uint64(1 << code) for code, goal in enumerate(header["goals"]) if goal in user_goals]
+
+    features = np.empty((header["count"], len(FEATURE_NAMES)), dtype=np.float32)
+    features[:, 0] = columns["city"] == city_code
+    features[:, 1] = np.abs(columns["birthYear"].astype(np.int64) - int(user["birthYear"]))
+    features[:, 2] = sum(((columns["goals"] & bit) != 0 for bit in goal_bits), np.zeros(header["count"]))
+    features[:, 3] = user.get("trustScore", 40)
+    features[:, 4] = columns["isVerified"]
+    features[:, 5] = columns["likesReceived"]
+    return features
+
+
+def load_model(engine="lightgbm", path=None):
+    """
+    lightgbm — стандартный Booster; numpy — собственный инференс деревьев из tree_ensemble.py,
+    которому нужен только NumPy. path — model.txt конкретной версии, снимок лежит рядом с ним.
+    """
+    path = path or model_path
+    if engine == "numpy":
+        from tree_ensemble import load_ensemble
+        return load_ensemble(path, os.path.splitext(path)[0] + ".npz")
+
+    import lightgbm as lgb
+    return lgb.Booster(model_file=path)
+
+
+def load_latest_model(engine, directory=None):
+    """
+    (версия, модель) для разового запуска: та же версия, что выбрал бы --serve —
+    последняя опубликованная, кроме откаченных и не загрузившихся, иначе встроенный model.txt.
+    """
+    from model_registry import load_latest
+
+    return load_latest(lambda path: load_model(engine, path), directory or models_dir, model_path,
+                       log=lambda message: print(f"[rank_profiles] {message}", file=sys.stderr))
+
+
+def top_k_indices(scores, k):
+    """Индексы k лучших скоров по убыванию: argpartition за O(n) и сортировка только k элементов."""
+    k = max(0, min(int(k), len(scores)))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+
+    best = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def apply_multipliers(profiles, profile_index, scores):
+    """Умножает скоры на необязательный scoreMultiplier анкеты (пользовательские модификаторы из search.ts)."""
+    if not any("scoreMultiplier" in p for p in profiles):
+        return scores
+
+    multipliers = np.fromiter((p.get("scoreMultiplier", 1.0) for p in profiles), dtype=np.float64,
+                              count=len(profiles))
+    return scores * multipliers[profile_index]
+
+
+def predict_scores(profiles, user, model, cache=None, candidates_version=None, model_version=None):
+    """Сырые скоры модели; с кэшем модель считает только анкеты, которых в нём нет."""
+    if cache is None:
+        return model.predict(compute_features(profiles, user))
+
+    key = cache.key(user, candidates_version, model_version)
+    profile_ids = [p["id"] for p in profiles]
+    scores, missing = cache.lookup(key, profile_ids)
+    if missing:
+        fresh = model.predict(compute_features([profiles[i] for i in missing], user))
+        scores[missing] = fresh
+        cache.store(key, [profile_ids[i] for i in missing], fresh.tolist())
+    return scores
+
+
+def rank(data, model, cache=None, model_version=None):
+    """
+    Считает скоры для одного запроса {"user": ..., "profiles": [...]}.
+    Необязательные поля: "exclude" — ID анкет, которые не нужно ранжировать,
+    "top_k" — вернуть только k лучших анкет по убыванию скора вместо всех в исходном порядке,
+    "candidatesVersion" — версия пула анкет для ключа кэша в режиме --serve.
+    model_version входит в ключ кэша, чтобы скоры разных версий модели не смешивались.
+    """
+    profiles = data["profiles"]
+    exclude = set(data.get("exclude") or ())
+    if exclude:
+        profiles = [p for p in profiles if p["id"] not in exclude]
+    if not profiles:
+        return []
+
+    scores = predict_scores(profiles, data["user"], model, cache, data.get("candidatesVersion"), model_version)
+    scores = apply_multipliers(profiles, np.arange(len(profiles)), scores)
+
+    if data.get("top_k") is None:
+        return [{"id": p["id"], "score": s} for p, s in zip(profiles, scores.tolist())]
+
+    best = top_k_indices(scores, data["top_k"])
+    return [{"id": profiles[i]["id"], "score": s} for i, s in zip(best.tolist(), scores[best].tolist())]
+
+
+def rank_batch(data, model):
+    """
+    Ранжирует анкеты сразу для многих пользователей:
+    {"users": [{"id": ..., "city": ..., ..., "candidates": [индексы в profiles], "exclude": [ID]}],
+     "profiles": [...], "top_k": k}.
+    Без "candidates" пользователю ранжируется вся таблица анкет, "exclude" и "top_k" необязательны.
+    Возвращает {"results": [{"userId": ..., "ranked": [{"id", "score"}, ...]}]}, анкеты по убыванию скора.
+    """
+    profiles, users = data["profiles"], data["users"]
+    top_k = data.get("top_k")
+
+    candidates = []
+    for u in users:
+        indices = u["candidates"] if "candidates" in u else range(len(profiles))
+        exclude = set(u.get("exclude") or ())
+        if exclude:
+            indices = [i for i in indices if profiles[i]["id"] not in exclude]
+        candidates.append(np.asarray(indices, dtype=np.intp))
+
+    counts = np.array([len(c) for c in candidates], dtype=np.intp)
+    user_index = np.repeat(np.arange(len(users)), counts)
+    profile_index = np.concatenate(candidates) if candidates else np.empty(0, dtype=np.intp)
+
+    if len(profile_index):
+        scores = model.predict(compute_pair_features(profiles, users, user_index, profile_index))
+        scores = apply_multipliers(profiles, profile_index, scores)
+    else:
+        scores = np.empty(0)
+
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    if top_k is None:
+        # Одна сортировка на весь батч: по пользователю, внутри — по убыванию скора
+        order = np.lexsort((-scores, user_index))
+        selected = [order[bounds[i]:bounds[i + 1]] for i in range(len(users))]
+    else:
+        selected = [bounds[i] + top_k_indices(scores[bounds[i]:bounds[i + 1]], top_k) for i in range(len(users))]
+
+    results = []
+    for u, positions in zip(users, selected):
+        results.append({
+            "userId": u.get("id"),
+            "ranked": [{"id": profiles[j]["id"], "score": s}
+                       for j, s in zip(profile_index[positions].tolist(), scores[positions].tolist())],
+        })
+    return {"results": results}
+
+
+def rank_binary(payload, model, model_info=None):
+    """
+    Бинарный запрос (binary_format.py) → бинарный ответ с float32 скорами в порядке анкет или top-K.
+    model_info() вызывается после скоринга и возвращает {"version", "scoringMs"} для ответа.
+    """
+    import binary_format
+
+    header, columns = binary_format.decode_request(payload)
+    if header["count"] == 0:
+        return binary_format.encode_reply(np.empty(0), model=model_info() if model_info else None)
+
+    scores = model.predict(compute_column_features(header, columns))
+    if "scoreMultiplier" in columns:
+        scores = scores * columns["scoreMultiplier"]
+
+    if header.get("top_k") is None:
+        return binary_format.encode_reply(scores, model=model_info() if model_info else None)
+
+    best = top_k_indices(scores, header["top_k"])
+    return binary_format.encode_reply(scores[best], best, model=model_info() if model_info else None)
+
+
+def handle_request(data, model, cache=None, model_version=None):
+    return rank_batch(data, model) if "users" in data else rank(data, model, cache, model_version)
+
+
+def handle_control(request, cache, registry=None):
+    """
+    Служебные сообщения режима --serve:
+    {"invalidate": {"profileIds": [...]}} — анкеты изменились, {"invalidate": {"all": true}} — сбросить весь кэш,
+    {"model": {"rollback": true}} — вернуть предыдущую версию модели, {"model": {"activate": "<версия>"}} —
+    включить конкретную версию, {"model": {"check": true}} — сразу поискать новую версию,
+    {"stats": true} — счётчики кэша и задержки по версиям модели.
+    """
+    if "model" in request:
+        if registry is None:
+            raise ValueError("Версии модели доступны только в режиме --serve")
+        command = request["model"]
+        if command.get("rollback"):
+            registry.rollback()
+        elif command.get("activate"):
+            registry.activate(str(command["activate"]))
+        elif command.get("check"):
+            registry.check()
+        return {"model": registry.stats()}
+
+    if "invalidate" in request:
+        target = request["invalidate"]
+        if cache is None:
+            return {"invalidated": 0}
+        if target.get("all"):
+            return {"invalidated": cache.clear()}
+        return {"invalidated": cache.invalidate_profiles(target.get("profileIds", []))}
+
+    return {
+        "cache": cache.stats() if cache is not None else None,
+        "model": registry.stats() if registry is not None else None,
+    }
+
+
+def serve(registry, workers, cache=None):
+    """
+    Долгоживущий режим: один JSON-запрос на строку stdin, один JSON-ответ на строку stdout.
+    Модель загружается один раз, запросы обрабатываются параллельно,
+    поэтому ответы сопоставляются с запросами по полю "id".
+    Каждый ответ несёт "model": {"version", "scoringMs"} — версию, посчитавшую весь запрос.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    write_lock = threading.Lock()
+
+    def reply(message):
+        line = json.dumps(message)
+        with write_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    def handle(line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            if "invalidate" in request or "model" in request or request.get("stats"):
+                reply({"id": request_id, "result": handle_control(request, cache, registry)})
+            else:
+                loaded = registry.active
+                started = time.perf_counter()
+                result = handle_request(request, loaded.model, cache, loaded.version)
+                elapsed = time.perf_counter() - started
+                loaded.observe(elapsed)
+                reply({"id": request_id, "result": result,
+                       "model": {"version": loaded.version, "scoringMs": round(elapsed * 1000, 3)}})
+        except Exception as e:
+            reply({"id": request_id, "error": str(e)})
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for line in sys.stdin:
+            if line.strip():
+                pool.submit(handle, line)
+
+
+def serve_binary(registry, workers):
+    """Как serve, но запросы и ответы — бинарные кадры (ID запроса, payload) из binary_format.py."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    import binary_format
+
+    write_lock = threading.Lock()
+
+    def handle(request_id, payload):
+        loaded = registry.active
+        started = time.perf_counter()
+
+        def model_info():
+            elapsed = time.perf_counter() - started
+            loaded.observe(elapsed)
+            return {"version": loaded.version, "scoringMs": round(elapsed * 1000, 3)}
+
+        try:
+            result = rank_binary(payload, loaded.model, model_info)
+        except Exception as e:
+            result = binary_format.encode_error(str(e))
+        with write_lock:
+            binary_format.write_frame(sys.stdout.buffer, request_id, result)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while (frame := binary_format.read_frame(sys.stdin.buffer)) is not None:
+            pool.submit(handle, *frame)
+
+
+def report_timing(**stages):
+    """Печатает в stderr длительность стадий и общее время от запуска скрипта, мс."""
+    stages["total"] = time.perf_counter() - started_at
+    print(json.dumps({"timingMs": {name: round(seconds * 1000, 2) for name, seconds in stages.items()}}),
+          file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ранжирование анкет LightGBM моделью")
+    parser.add_argument("--serve", action="store_true",
+                        help="постоянный режим: построчный JSON через stdin/stdout")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="число параллельных запросов в режиме --serve")
+    parser.add_argument("--engine", choices=["lightgbm", "numpy"], default="lightgbm",
+                        help="движок инференса модели")
+    parser.add_argument("--format", choices=["json", "binary"], default="json",
+                        help="формат запросов и ответов (binary — см. binary_format.py)")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="число пользователей в кэше скоров режима --serve (0 — без кэша)")
+    parser.add_argument("--cache-ttl", type=float, default=60.0,
+                        help="время жизни записи кэша скоров, секунд")
+    parser.add_argument("--models-dir", default=models_dir,
+                        help="каталог версий модели (model_registry.py); без версий — model.txt рядом со скриптом")
+    parser.add_argument("--reload-interval", type=float, default=5.0,
+                        help="как часто в режиме --serve искать новую версию модели, секунд (0 — не искать)")
+    parser.add_argument("--scoring-workers", type=int, default=0,
+                        help="процессов для параллельного скоринга больших пулов в режиме --serve "
+                             "(0 — без пула, -1 — по числу ядер)")
+    parser.add_argument("--parallel-min-rows", type=int, default=None,
+                        help="с какого числа строк признаков считать пулом (по умолчанию 20000)")
+    parser.add_argument("--timing", action="store_true",
+                        help="вывести в stderr время импортов, загрузки модели и обработки запроса")
+    args = parser.parse_args()
+
+    imports_done = time.perf_counter()
+    if args.serve:
+        from model_registry import ModelRegistry
+
+        cache = None
+        if args.format == "json" and args.cache_size > 0:
+            from ranking_cache import RankingCache
+            cache = RankingCache(args.cache_size, args.cache_ttl)
+
+        load = lambda path: load_model(args.engine, path)
+        pool = None
+        if args.scoring_workers:
+            import parallel_scoring
+
+            workers = args.scoring_workers if args.scoring_workers > 0 else parallel_scoring.default_workers()
+            min_rows = args.parallel_min_rows or parallel_scoring.DEFAULT_MIN_ROWS
+            pool = parallel_scoring.ScoringPool(args.engine, workers)
+            load = lambda path: parallel_scoring.ParallelModel(load_model(args.engine, path), path, pool, min_rows)
+
+        # Скоры старой версии в кэше больше не нужны: версия входит в ключ, очистка только освобождает память
+        registry = ModelRegistry(load, args.models_dir,
+                                 builtin_path=model_path,
+                                 on_switch=lambda old, new: cache.clear() if cache is not None else None)
+        registry.start()
+        if args.reload_interval > 0:
+            registry.watch(args.reload_interval)
+        if args.timing:
+            report_timing(imports=imports_done - started_at, modelLoad=time.perf_counter() - imports_done)
+
+        try:
+            if args.format == "binary":
+                serve_binary(registry, args.workers)
+            else:
+                serve(registry, args.workers, cache)
+        finally:
+            if pool is not None:
+                pool.close()
+        return
+
+    # Разовый режим берёт ту же версию, что и постоянный процесс, с учётом откатов
+    _, model = load_latest_model(args.engine, args.models_dir)
+    model_loaded = time.perf_counter()
+
+    # Разовый режим: один запрос из stdin, результат в stdout
+    if args.format == "binary":
+        sys.stdout.buffer.write(rank_binary(sys.stdin.buffer.read(), model))
+    else:
+        data = json.load(sys.stdin)
+        print(json.dumps(handle_request(data, model)))
+
+    if args.timing:
+        sys.stdout.flush()
+        report_timing(imports=imports_done - started_at, modelLoad=model_loaded - imports_done,
+                      request=time.perf_counter() - model_loaded)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+
+class _Entry:
+    __slots__ = ("expires_at", "scores")
+
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+        self.scores = {}
+
+
+class RankingCache:
+    """
+    LRU/TTL кэш скоров модели для режима --serve.
+
+    Ключ — хэш признаков пользователя (city, birthYear, goals, trustScore),
+    необязательной версии набора кандидатов из запроса и версии модели, значение — словарь
+    ID анкеты → сырой скор модели. Анкеты, которых нет в записи, досчитываются и
+    дописываются, поэтому повторные свайпы по тому же пулу не гоняют модель.
+    Скор не зависит от scoreMultiplier/top_k/exclude, они применяются после кэша.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_profile = defaultdict(set)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(user, candidates_version=None, model_version=None):
+        features = [
+            user["city"],
+            int(user["birthYear"]),
+            sorted(set(user.get("goals", []))),
+            user.get("trustScore", 40),
+            candidates_version,
+            model_version,
+        ]
+        return hashlib.blake2b(json.dumps(features).encode(), digest_size=16).hexdigest()
+
+    def lookup(self, key, profile_ids):
+        """Возвращает массив скоров (NaN там, где скора нет) и индексы анкет без скора."""
+        scores = np.full(len(profile_ids), np.nan)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._drop(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return scores, list(range(len(profile_ids)))
+
+            self._entries.move_to_end(key)
+            missing = []
+            for i, pid in enumerate(profile_ids):
+                score = entry.scores.get(pid)
+                if score is None:
+                    missing.append(i)
+                else:
+                    scores[i] = score
+
+            if not missing:
+                self.hits += 1
+            elif len(missing) < len(profile_ids):
+                self.partial_hits += 1
+            else:
+                self.misses += 1
+            return scores, missing
+
+    def store(self, key, profile_ids, scores):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry(time.monotonic() + self.ttl)
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._drop(next(iter(self._entries)))
+                    self.evictions += 1
+            self._entries.move_to_end(key)
+
+            for pid, score in zip(profile_ids, scores):
+                entry.scores[pid] = score
+                self._keys_by_profile[pid].add(key)
+
+    def invalidate_profiles(self, profile_ids):
+        """Удаляет скоры изменившихся анкет из всех записей. Возвращает число удалённых скоров."""
+        removed = 0
+        with self._lock:
+            for pid in profile_ids:
+                for key in self._keys_by_profile.pop(pid, ()):
+                    entry = self._entries.get(key)
+                    if entry is not None and entry.scores.pop(pid, None) is not None:
+                        removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        """Полная очистка (например, при смене модели). Возвращает число удалённых записей."""
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._keys_by_profile.clear()
+            self.invalidations += removed
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "partialHits": self.partial_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        for pid in entry.scores:
+            keys = self._keys_by_profile.get(pid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_profile[pid]
@@ -0,0 +1,130 @@
+"""
+Векторизованные признаки против исходного построчного построения через DataFrame:
+признаки и скоры lgb.Booster.predict должны совпадать побитно. Кроме requirements.txt нужны
+pytest и pandas (только для эталонной реализации).
+
+    python3 -m pytest test_features.py
+"""
+import random
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pytest
+
+import binary_format
+import rank_profiles
+
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Новосибирск", "Сочи"]
+GOALS = ["секс", "общение", "отношения", "фото", "дружба", "путешествия"]
+
+
+def legacy_features(profiles, user):
+    """Признаки так, как их строил rank_profiles.py до векторизации (dict на анкету → DataFrame)."""
+    def compute_features(profile):
+        return {
+            "profileId": profile["id"],
+            "sameCity": int(profile["city"] == user["city"]),
+            "ageDiff": abs(int(profile["birthYear"]) - int(user["birthYear"])),
+            "goalsMatchCount": len(set(profile.get("goals", [])) & set(user.get("goals", []))),
+            "trustScore": user.get("trustScore", 40),
+            "isVerified": int(profile.get("isVerified", False)),
+            "likesReceived": profile.get("likesReceived", 0),
+        }
+
+    features = pd.DataFrame([compute_features(p) for p in profiles])
+    features.pop("profileId")
+    return features
+
+
+def random_profile(rng, i):
+    """Анкета с повторами целей и случайно пропущенными необязательными полями."""
+    profile = {"id": f"p{i}", "city": rng.choice(CITIES), "birthYear": str(rng.randint(1975, 2007))}
+    if rng.random() < 0.8:
+        profile["goals"] = [rng.choice(GOALS) for _ in range(rng.randint(0, 5))]
+    if rng.random() < 0.7:
+        profile["isVerified"] = rng.random() < 0.5
+    if rng.random() < 0.7:
+        profile["likesReceived"] = rng.randint(0, 500)
+    return profile
+
+
+def random_user(rng):
+    user = {"city": rng.choice(CITIES), "birthYear": str(rng.randint(1975, 2007))}
+    if rng.random() < 0.8:
+        user["goals"] = [rng.choice(GOALS) for _ in range(rng.randint(0, 4))]
+    if rng.random() < 0.7:
+        user["trustScore"] = rng.randint(0, 100)
+    return user
+
+
+@pytest.fixture(scope="module")
+def booster():
+    return lgb.Booster(model_file=rank_profiles.model_path)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_features_match_legacy(booster, seed):
+    rng = random.Random(seed)
+    user = random_user(rng)
+    profiles = [random_profile(rng, i) for i in range(rng.randint(1, 300))]
+
+    legacy = legacy_features(profiles, user)
+    features = rank_profiles.compute_features(profiles, user)
+
+    assert list(legacy.columns) == rank_profiles.FEATURE_NAMES
+    np.testing.assert_array_equal(features, legacy.to_numpy(dtype=np.float32))
+    np.testing.assert_array_equal(booster.predict(features), booster.predict(legacy))
+
+
+def test_duplicate_goals_and_missing_fields(booster):
+    user = {"city": "Москва", "birthYear": "2000", "goals": ["секс", "секс", "общение"]}
+    profiles = [
+        {"id": "dup", "city": "Москва", "birthYear": "1999", "goals": ["секс", "секс", "секс", "общение"]},
+        {"id": "bare", "city": "Казань", "birthYear": "2003"},
+        {"id": "empty", "city": "Москва", "birthYear": "2000", "goals": [], "isVerified": False,
+         "likesReceived": 0},
+        {"id": "foreign", "city": "Сочи", "birthYear": "1990", "goals": ["фото", "фото"], "isVerified": True},
+    ]
+
+    legacy = legacy_features(profiles, user)
+    features = rank_profiles.compute_features(profiles, user)
+
+    np.testing.assert_array_equal(features[:, 2], [2, 0, 0, 0])
+    np.testing.assert_array_equal(features[:, 3], [40] * 4)
+    np.testing.assert_array_equal(features, legacy.to_numpy(dtype=np.float32))
+    np.testing.assert_array_equal(booster.predict(features), booster.predict(legacy))
+
+
+def test_batch_pairs_match_legacy(booster):
+    rng = random.Random(7)
+    profiles = [random_profile(rng, i) for i in range(120)]
+    users = [random_user(rng) for _ in range(6)]
+    candidates = [rng.sample(range(len(profiles)), rng.randint(0, 60)) for _ in users]
+
+    user_index = np.repeat(np.arange(len(users)), [len(c) for c in candidates])
+    profile_index = np.array([i for c in candidates for i in c], dtype=np.intp)
+    features = rank_profiles.compute_pair_features(profiles, users, user_index, profile_index)
+
+    start = 0
+    for user, indices in zip(users, candidates):
+        if not indices:
+            continue
+        legacy = legacy_features([profiles[i] for i in indices], user)
+        block = features[start:start + len(indices)]
+        np.testing.assert_array_equal(block, legacy.to_numpy(dtype=np.float32))
+        np.testing.assert_array_equal(booster.predict(block), booster.predict(legacy))
+        start += len(indices)
+
+
+def test_binary_columns_match_legacy(booster):
+    rng = random.Random(11)
+    user = random_user(rng)
+    profiles = [random_profile(rng, i) for i in range(200)]
+
+    header, columns = binary_format.decode_request(binary_format.encode_request(profiles, user))
+    features = rank_profiles.compute_column_features(header, columns)
+    legacy = legacy_features(profiles, user)
+
+    np.testing.assert_array_equal(features, legacy.to_numpy(dtype=np.float32))
+    np.testing.assert_array_equal(booster.predict(features), booster.predict(legacy))
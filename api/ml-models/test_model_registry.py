@@ -0,0 +1,149 @@
+"""
+Переключение версий в model_registry.py: закрепление через activate(), откат и
+согласованность с разовыми запусками, которые читают models/.rejected через load_latest().
+
+    python3 -m pytest test_model_registry.py
+"""
+import os
+
+import numpy as np
+import pytest
+
+from model_registry import BUILTIN_VERSION, MODEL_FILE, ModelRegistry, load_latest, publish, read_rejected
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+
+    def predict(self, features):
+        return np.zeros(len(features))
+
+
+def fake_load(path):
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    if content == "broken":
+        raise ValueError("битая модель")
+    return FakeModel(content)
+
+
+@pytest.fixture
+def models(tmp_path):
+    models_dir = str(tmp_path / "models")
+    builtin = tmp_path / "builtin.txt"
+    builtin.write_text(BUILTIN_VERSION, encoding="utf-8")
+
+    def add(version, content=None):
+        source = tmp_path / f"{version}.txt"
+        source.write_text(content or version, encoding="utf-8")
+        publish(str(source), models_dir, version)
+
+    def registry():
+        return ModelRegistry(fake_load, models_dir, builtin_path=str(builtin), log=lambda message: None)
+
+    def one_shot():
+        return load_latest(fake_load, models_dir, str(builtin))[0]
+
+    return models_dir, add, registry, one_shot
+
+
+def test_activate_older_version_survives_check(models):
+    models_dir, add, registry, one_shot = models
+    add("v1")
+    add("v2")
+    reg = registry()
+    assert reg.start().version == "v2"
+
+    reg.activate("v1")
+    assert reg.check() is None
+    assert reg.active.version == "v1"
+    assert read_rejected(models_dir) == {"v2"}
+    assert one_shot() == "v1"
+
+    # Перезапущенный процесс тоже остаётся на закреплённой версии
+    assert registry().start().version == "v1"
+
+    # Версия новее всех, что были при закреплении, снова подхватывается
+    add("v3")
+    assert reg.check() == "v3"
+    assert one_shot() == "v3"
+
+
+def test_activate_clears_pin(models):
+    models_dir, add, registry, one_shot = models
+    add("v1")
+    add("v2")
+    reg = registry()
+    reg.start()
+    reg.activate("v1")
+
+    reg.activate("v2")
+    assert reg.active.version == "v2"
+    assert read_rejected(models_dir) == set()
+    assert reg.check() is None
+    assert one_shot() == "v2"
+
+
+def test_rollback_twice(models):
+    models_dir, add, registry, one_shot = models
+    add("v1")
+    reg = registry()
+    reg.start()
+    add("v2")
+    assert reg.check() == "v2"
+
+    assert reg.rollback().version == "v1"
+    assert reg.previous is None
+    with pytest.raises(RuntimeError):
+        reg.rollback()
+
+    assert reg.active.version == "v1"
+    assert read_rejected(models_dir) == {"v2"}
+    assert reg.check() is None
+    assert one_shot() == "v1"
+
+
+def test_no_rollback_onto_version_rejected_by_pin(models):
+    models_dir, add, registry, one_shot = models
+    add("v1")
+    reg = registry()
+    reg.start()
+    add("v2")
+    reg.check()
+
+    # v2 становится предыдущей, но закрепление v1 её отклонило
+    reg.activate("v1")
+    with pytest.raises(RuntimeError):
+        reg.rollback()
+    assert reg.active.version == "v1"
+    assert one_shot() == "v1"
+
+
+def test_broken_version_is_skipped_everywhere(models):
+    models_dir, add, registry, one_shot = models
+    add("v1")
+    add("v2", content="broken")
+    reg = registry()
+    assert reg.start().version == "v1"
+    assert read_rejected(models_dir) == {"v2"}
+    assert one_shot() == "v1"
+
+    add("v3", content="broken")
+    assert reg.check() is None
+    assert reg.active.version == "v1"
+    assert one_shot() == "v1"
+    assert read_rejected(models_dir) == {"v2", "v3"}
+
+
+def test_activate_builtin_pins_over_published(models):
+    models_dir, add, registry, one_shot = models
+    add("v1")
+    reg = registry()
+    reg.start()
+
+    reg.activate(BUILTIN_VERSION)
+    assert reg.active.model.name == BUILTIN_VERSION
+    assert reg.check() is None
+    assert one_shot() == BUILTIN_VERSION
+    assert os.path.isfile(os.path.join(models_dir, "v1", MODEL_FILE))
@@ -0,0 +1,115 @@
+"""
+Инференс tree_ensemble.py против lgb.Booster.predict на случайных признаках,
+включая значения вне диапазона обучения и NaN. Кроме model.txt проверяются
+модели с missing_type=Zero и NaN (путь _predict_missing), обученные на лету.
+
+    python3 -m pytest test_tree_ensemble.py
+"""
+import os
+
+import lightgbm as lgb
+import numpy as np
+import pytest
+
+import rank_profiles
+from tree_ensemble import MISSING_NAN, MISSING_NONE, MISSING_ZERO, TreeEnsemble, load_ensemble
+
+N_FEATURES = len(rank_profiles.FEATURE_NAMES)
+
+
+def random_features(rng, rows):
+    """Признаки в обычном диапазоне, далеко за ним, точные нули и NaN."""
+    features = np.column_stack([
+        rng.integers(0, 2, rows),
+        rng.integers(0, 30, rows),
+        rng.integers(0, 4, rows),
+        rng.integers(0, 100, rows),
+        rng.integers(0, 2, rows),
+        rng.exponential(50, rows),
+    ]).astype(np.float64)
+    out_of_range = rng.random(features.shape) < 0.05
+    features[out_of_range] = rng.choice([-1e6, -5.0, 1e3, 1e9], out_of_range.sum())
+    features[rng.random(features.shape) < 0.05] = 0.0
+    features[rng.random(features.shape) < 0.05] = np.nan
+    return features.astype(np.float32)
+
+
+def assert_matches_booster(path, features):
+    booster = lgb.Booster(model_file=path)
+    expected = booster.predict(features)
+    np.testing.assert_allclose(TreeEnsemble.from_model_file(path).predict(features), expected,
+                               rtol=1e-9, atol=1e-9)
+    return expected
+
+
+def train_model(path, zero_as_missing, seed=0):
+    rng = np.random.default_rng(seed)
+    features = random_features(rng, 4000)
+    target = (np.nan_to_num(features[:, 2]) + np.isnan(features[:, 5]) + (features[:, 1] == 0)
+              + rng.normal(0, 0.5, len(features)))
+    params = {
+        "objective": "regression",
+        "num_leaves": 15,
+        "min_data_in_leaf": 5,
+        "zero_as_missing": zero_as_missing,
+        "use_missing": True,
+        "verbose": -1,
+        "seed": seed,
+        "deterministic": True,
+        "num_threads": 1,
+    }
+    booster = lgb.train(params, lgb.Dataset(features, target, feature_name=rank_profiles.FEATURE_NAMES),
+                        num_boost_round=30)
+    booster.save_model(path)
+    return path
+
+
+def missing_types(path):
+    model = TreeEnsemble.from_model_file(path)
+    return set(model._missing_type[model._valid_node].tolist())
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_model_txt_matches_booster(seed):
+    rng = np.random.default_rng(seed)
+    assert_matches_booster(rank_profiles.model_path, random_features(rng, 5000))
+
+
+def test_model_txt_edge_values():
+    thresholds = TreeEnsemble.from_model_file(rank_profiles.model_path).threshold
+    edges = np.unique(np.concatenate([thresholds[np.isfinite(thresholds)], [0.0, -0.0, 1e-36, -1e-36]]))
+    edges = np.concatenate([edges, np.nextafter(edges, np.inf), np.nextafter(edges, -np.inf), [np.nan]])
+    features = np.repeat(edges.astype(np.float32)[:, None], N_FEATURES, axis=1)
+    assert_matches_booster(rank_profiles.model_path, features)
+
+
+@pytest.mark.parametrize("zero_as_missing, expected_type", [(False, MISSING_NAN), (True, MISSING_ZERO)])
+def test_missing_types_match_booster(tmp_path, zero_as_missing, expected_type):
+    path = train_model(str(tmp_path / "model.txt"), zero_as_missing)
+    model = TreeEnsemble.from_model_file(path)
+    assert model._has_missing
+    assert expected_type in missing_types(path)
+
+    rng = np.random.default_rng(1)
+    features = random_features(rng, 5000)
+    assert_matches_booster(path, features)
+
+    # Только NaN и только нули — все строки идут по веткам по умолчанию
+    for fill in (np.nan, 0.0):
+        assert_matches_booster(path, np.full((64, N_FEATURES), fill, dtype=np.float32))
+
+
+def test_snapshot_matches_model_file(tmp_path):
+    for zero_as_missing in (False, True):
+        path = train_model(str(tmp_path / f"model-{zero_as_missing}.txt"), zero_as_missing, seed=3)
+        snapshot = os.path.splitext(path)[0] + ".npz"
+        features = random_features(np.random.default_rng(2), 3000)
+        expected = assert_matches_booster(path, features)
+        load_ensemble(path, snapshot)
+        assert os.path.exists(snapshot)
+        np.testing.assert_allclose(load_ensemble(path, snapshot).predict(features), expected, rtol=1e-9, atol=1e-9)
+
+
+def test_model_txt_has_no_missing_splits():
+    # model.txt идёт быстрым путём _predict_prefix; если это изменится, тесты выше покроют и его
+    assert missing_types(rank_profiles.model_path) == {MISSING_NONE}
@@ -0,0 +1,288 @@
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+# Порог, ниже которого LightGBM считает значение нулём (kZeroThreshold)
+ZERO_THRESHOLD = 1e-35
+
+# Биты decision_type в model.txt
+CATEGORICAL_MASK = 1
+DEFAULT_LEFT_MASK = 2
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+
+# Сколько строк считаем за один проход, чтобы промежуточные массивы (строки × деревья) помещались в кэш
+CHUNK_ROWS = 2048
+
+# Версия формата .npz снимка; меняется вместе с набором сохраняемых массивов
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_ARRAYS = [
+    "split_feature", "threshold", "decision_type", "left_child", "right_child", "leaf_value", "num_leaves",
+    "_node_mask", "_valid_node", "_ordered_leaf_value",
+]
+
+
+def _parse_trees(path):
+    """Читает model.txt и возвращает заголовок и список словарей с полями деревьев."""
+    header = {}
+    trees = []
+    current = None
+
+    with open(path, encoding="utf-8") as f:
+        for raw in f:
+            line = raw.strip()
+            if line == "end of trees":
+                break
+            if line.startswith("Tree="):
+                current = {}
+                trees.append(current)
+                continue
+            if "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            (current if current is not None else header)[key] = value
+
+    return header, trees
+
+
+def _lowest_bit_index(words):
+    """Номер младшего установленного бита для массива беззнаковых целых."""
+    lowest = words & (~words + words.dtype.type(1))
+    return np.log2(lowest).astype(np.intp)
+
+
+class TreeEnsemble:
+    """
+    Инференс LightGBM модели (только числовые сплиты) на чистом NumPy.
+
+    Деревья хранятся в плоских массивах формы (деревья, узлы), дополненных до
+    максимального числа узлов; листья закодированы как отрицательные индексы
+    потомков (~leaf), как и в model.txt.
+
+    Предсказание считается битовыми векторами (QuickScorer): у каждого дерева
+    листья пронумерованы слева направо, каждый узел хранит маску листьев, которые
+    остаются достижимыми, если условие узла ложно, а выходной лист — самый левый
+    бит в AND масок всех ложных узлов. Для модели без обработки пропусков ложные
+    узлы одного признака — это префикс узлов, отсортированных по порогу, поэтому
+    AND масок заранее накоплен по префиксам и строка считается за один
+    searchsorted и одну выборку на признак.
+    """
+
+    def __init__(self, split_feature, threshold, decision_type, left_child, right_child, leaf_value,
+                 num_leaves, num_features):
+        self.split_feature = split_feature
+        self.threshold = threshold
+        self.decision_type = decision_type
+        self.left_child = left_child
+        self.right_child = right_child
+        self.leaf_value = leaf_value
+        self.num_leaves = num_leaves
+        self.num_features = num_features
+        self._init_layout()
+
+        self._build_bitvectors()
+        if not self._has_missing:
+            self._build_prefix_tables()
+
+    def _init_layout(self):
+        self.num_trees = self.leaf_value.shape[0]
+        max_leaves = self.leaf_value.shape[1]
+        if max_leaves > 64:
+            raise ValueError(f"Trees with more than 64 leaves are not supported (got {max_leaves})")
+        self._word = np.uint32 if max_leaves <= 32 else np.uint64
+        self._tree_index = np.arange(self.num_trees)
+
+        missing_type = (self.decision_type >> 2) & 3
+        self._missing_type = missing_type
+        self._default_left = (self.decision_type & DEFAULT_LEFT_MASK) != 0
+        self._has_missing = bool((missing_type != MISSING_NONE).any())
+
+    @classmethod
+    def from_model_file(cls, path):
+        header, trees = _parse_trees(path)
+        if not trees:
+            raise ValueError(f"No trees found in {path}")
+
+        num_leaves = np.array([int(t["num_leaves"]) for t in trees], dtype=np.int32)
+        max_leaves = int(num_leaves.max())
+        shape = (len(trees), max(max_leaves - 1, 1))
+
+        split_feature = np.zeros(shape, dtype=np.int32)
+        threshold = np.zeros(shape, dtype=np.float64)
+        decision_type = np.zeros(shape, dtype=np.int8)
+        left_child = np.full(shape, -1, dtype=np.int32)
+        right_child = np.full(shape, -1, dtype=np.int32)
+        leaf_value = np.zeros((len(trees), max_leaves), dtype=np.float64)
+
+        for i, tree in enumerate(trees):
+            if int(tree.get("num_cat", 0)) or int(tree.get("is_linear", 0)):
+                raise ValueError(f"Tree {i}: categorical and linear trees are not supported")
+
+            leaf_value[i, :num_leaves[i]] = np.array(tree["leaf_value"].split(), dtype=np.float64)
+            if num_leaves[i] == 1:
+                continue
+
+            decisions = np.array(tree["decision_type"].split(), dtype=np.int8)
+            if (decisions & CATEGORICAL_MASK).any():
+                raise ValueError(f"Tree {i}: categorical splits are not supported")
+
+            n = num_leaves[i] - 1
+            split_feature[i, :n] = np.array(tree["split_feature"].split(), dtype=np.int32)
+            threshold[i, :n] = np.array(tree["threshold"].split(), dtype=np.float64)
+            decision_type[i, :n] = decisions
+            left_child[i, :n] = np.array(tree["left_child"].split(), dtype=np.int32)
+            right_child[i, :n] = np.array(tree["right_child"].split(), dtype=np.int32)
+
+        return cls(split_feature, threshold, decision_type, left_child, right_child, leaf_value,
+                   num_leaves=num_leaves, num_features=int(header["max_feature_idx"]) + 1)
+
+    def save_snapshot(self, path, source_hash):
+        """Сохраняет все массивы, включая предрасчитанные битовые маски, в .npz (атомарно)."""
+        arrays = {name.lstrip("_"): getattr(self, name) for name in _SNAPSHOT_ARRAYS}
+        if not self._has_missing:
+            for feature in range(self.num_features):
+                arrays[f"sorted_thresholds_{feature}"] = self._sorted_thresholds[feature]
+                arrays[f"prefix_masks_{feature}"] = self._prefix_masks[feature]
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, version=SNAPSHOT_VERSION, source_hash=source_hash, num_features=self.num_features, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_snapshot(cls, path, source_hash):
+        """Загружает .npz снимок; None, если он собран из другой версии model.txt или в старом формате."""
+        with np.load(path) as data:
+            if int(data["version"]) != SNAPSHOT_VERSION or str(data["source_hash"]) != source_hash:
+                return None
+
+            model = cls.__new__(cls)
+            for name in _SNAPSHOT_ARRAYS:
+                setattr(model, name, data[name.lstrip("_")])
+            model.num_features = int(data["num_features"])
+            model._init_layout()
+
+            if not model._has_missing:
+                model._sorted_thresholds = [data[f"sorted_thresholds_{f}"] for f in range(model.num_features)]
+                model._prefix_masks = [data[f"prefix_masks_{f}"] for f in range(model.num_features)]
+        return model
+
+    def _build_bitvectors(self):
+        all_leaves = np.iinfo(self._word).max
+        self._node_mask = np.full(self.threshold.shape, all_leaves, dtype=self._word)
+        self._valid_node = np.zeros(self.threshold.shape, dtype=bool)
+        # Значения листьев в порядке слева направо
+        self._ordered_leaf_value = np.zeros_like(self.leaf_value)
+
+        for t in range(self.num_trees):
+            if self.num_leaves[t] == 1:
+                self._ordered_leaf_value[t, 0] = self.leaf_value[t, 0]
+                continue
+
+            # Обход слева направо: узел снимается со стека дважды — до и после левого поддерева
+            position = 0
+            first_leaf = {}
+            stack = [0]
+            while stack:
+                child = stack.pop()
+                if child < 0:
+                    self._ordered_leaf_value[t, position] = self.leaf_value[t, ~child]
+                    position += 1
+                elif child in first_leaf:
+                    # Левое поддерево пройдено: его листья — биты [first_leaf, position)
+                    start = first_leaf[child]
+                    left_bits = ((1 << position) - 1) ^ ((1 << start) - 1)
+                    self._node_mask[t, child] = self._word(int(all_leaves) & ~left_bits)
+                    self._valid_node[t, child] = True
+                    stack.append(int(self.right_child[t, child]))
+                else:
+                    first_leaf[child] = position
+                    stack.append(child)
+                    stack.append(int(self.left_child[t, child]))
+
+    def _build_prefix_tables(self):
+        all_leaves = np.iinfo(self._word).max
+        self._sorted_thresholds = []
+        self._prefix_masks = []
+
+        for feature in range(self.num_features):
+            trees, nodes = np.nonzero(self._valid_node & (self.split_feature == feature))
+            order = np.argsort(self.threshold[trees, nodes], kind="stable")
+            trees, nodes = trees[order], nodes[order]
+
+            # table[k] — AND масок первых k узлов (по возрастанию порога) для каждого дерева
+            table = np.full((len(order) + 1, self.num_trees), all_leaves, dtype=self._word)
+            for k, (t, node) in enumerate(zip(trees, nodes), start=1):
+                table[k] = table[k - 1]
+                table[k, t] &= self._node_mask[t, node]
+
+            self._sorted_thresholds.append(self.threshold[trees, nodes])
+            self._prefix_masks.append(table)
+
+    def predict(self, features):
+        """Сырые скоры (без преобразования objective) для матрицы признаков (n, num_features)."""
+        features = np.asarray(features, dtype=np.float64)
+        if features.ndim != 2 or features.shape[1] != self.num_features:
+            raise ValueError(f"Expected a (n, {self.num_features}) feature matrix, got {features.shape}")
+
+        predict_chunk = self._predict_missing if self._has_missing else self._predict_prefix
+        scores = np.empty(features.shape[0], dtype=np.float64)
+        for start in range(0, features.shape[0], CHUNK_ROWS):
+            chunk = features[start:start + CHUNK_ROWS]
+            scores[start:start + len(chunk)] = self._leaf_sum(predict_chunk(chunk))
+        return scores
+
+    def _leaf_sum(self, leaf_bits):
+        return self._ordered_leaf_value[self._tree_index, _lowest_bit_index(leaf_bits)].sum(axis=1)
+
+    def _predict_prefix(self, features):
+        # При missing_type=None LightGBM заменяет NaN на 0
+        features = np.where(np.isnan(features), 0.0, features)
+
+        leaf_bits = None
+        for feature in range(self.num_features):
+            # Узел ложен, когда значение строго больше порога
+            false_count = np.searchsorted(self._sorted_thresholds[feature], features[:, feature], side="left")
+            masks = self._prefix_masks[feature][false_count]
+            leaf_bits = masks if leaf_bits is None else leaf_bits & masks
+        return leaf_bits
+
+    def _predict_missing(self, features):
+        # Общий путь: решение считается для каждого узла с учётом missing_type и default_left
+        values = features[:, self.split_feature]
+        is_nan = np.isnan(values)
+        values = np.where(is_nan & (self._missing_type != MISSING_NAN), 0.0, values)
+
+        go_left = values <= self.threshold
+        use_default = (is_nan & (self._missing_type == MISSING_NAN)) | (
+            (self._missing_type == MISSING_ZERO) & (np.abs(values) <= ZERO_THRESHOLD)
+        )
+        go_left = np.where(use_default, self._default_left, go_left) | ~self._valid_node
+
+        all_leaves = np.iinfo(self._word).max
+        masks = np.where(go_left, self._word(all_leaves), self._node_mask)
+        return np.bitwise_and.reduce(masks, axis=2)
+
+
+def load_ensemble(model_path, snapshot_path):
+    """
+    Загружает модель из .npz снимка рядом с model.txt. Снимок привязан к SHA-256 содержимого
+    model.txt и пересобирается, если модель изменилась или снимка ещё нет.
+    """
+    with open(model_path, "rb") as f:
+        source_hash = hashlib.sha256(f.read()).hexdigest()
+
+    try:
+        model = TreeEnsemble.load_snapshot(snapshot_path, source_hash)
+        if model is not None:
+            return model
+    except (OSError, ValueError, KeyError):
+        pass
+
+    model = TreeEnsemble.from_model_file(model_path)
+    try:
+        model.save_snapshot(snapshot_path, source_hash)
+    except OSError as e:
+        print(f"[tree_ensemble] Не удалось сохранить снимок модели: {e}", file=sys.stderr)
+    return model
@@ -0,0 +1,10 @@
+-- CreateTable
+CREATE TABLE "AdTrackBatch" (
+    "id" TEXT NOT NULL,
+    "createdAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+    CONSTRAINT "AdTrackBatch_pkey" PRIMARY KEY ("id")
+);
+
+-- CreateIndex
+CREATE INDEX "AdTrackBatch_createdAt_idx" ON "AdTrackBatch"("createdAt");
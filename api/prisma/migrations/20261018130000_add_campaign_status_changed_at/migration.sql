@@ -0,0 +1,8 @@
+-- AlterTable
+ALTER TABLE "AdCampaign" ADD COLUMN "statusChangedAt" TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+-- Существующие кампании: последнее изменение строки — лучшая оценка смены статуса
+UPDATE "AdCampaign" SET "statusChangedAt" = "updatedAt";
+
+-- CreateIndex
+CREATE INDEX "AdCampaign_statusChangedAt_idx" ON "AdCampaign"("statusChangedAt");
@@ -308,7 +308,7 @@ router.post("/campaigns/:campaignId/status", authMiddleware, requireAdvertiser,
 
     const updatedCampaign = await prisma.adCampaign.update({
       where: { id: campaignId },
-      data: { status: newStatus }
+      data: { status: newStatus, statusChangedAt: new Date() }
     });
 
     res.json({ campaign: updatedCampaign });
@@ -567,6 +567,49 @@ router.get("/serve", async (req: any, res: Response) => {
   }
 });
 
+// Все кампании, которые сейчас можно показывать, — для локального кэша рекламы в боте.
+// Бот сам выбирает кампанию по весам и исключает кликнутые пользователем.
+router.get("/serve/campaigns", async (req: any, res: Response) => {
+  try {
+    const now = new Date();
+    const campaigns = await prisma.adCampaign.findMany({
+      where: {
+        status: { in: ["active", "approved"] },
+        OR: [
+          { startDate: null },
+          { startDate: { lte: now } }
+        ],
+        AND: [
+          {
+            OR: [
+              { endDate: null },
+              { endDate: { gte: now } }
+            ]
+          }
+        ]
+      },
+      orderBy: { weight: "desc" }
+    });
+
+    res.json({
+      campaigns: campaigns.map(campaign => ({
+        id: campaign.id,
+        title: campaign.adTitle,
+        description: campaign.adDescription,
+        imageUrl: campaign.adImageUrl,
+        buttonText: campaign.buttonText,
+        buttonUrl: campaign.buttonUrl,
+        weight: campaign.weight,
+        startDate: campaign.startDate,
+        endDate: campaign.endDate
+      }))
+    });
+  } catch (error) {
+    console.error("[ADVERTISING] Error listing campaigns to serve:", error);
+    res.status(500).json({ error: "Ошибка получения кампаний" });
+  }
+});
+
 // Получить конкретную рекламу по ID
 router.get("/campaign/:campaignId/ad", async (req: any, res: Response) => {
   try {
@@ -695,11 +738,136 @@ router.post("/track/click", async (req: any, res: Response) => {
   }
 });
 
+// Пакетный трекинг показов и кликов: { batchId, events: [{ type: "impression" | "click", campaignId, userId }] }.
+// Счётчики агрегируются по кампании, поэтому на пакет — один upsert аналитики на кампанию.
+// Весь пакет применяется одной транзакцией; batchId записывается в той же транзакции, и повтор
+// пакета с тем же batchId (бот повторяет отправку после ошибки или таймаута) ничего не меняет.
+const TRACK_BATCH_MAX_EVENTS = 1000;
+const TRACK_BATCH_ID_MAX_LENGTH = 64;
+// Сколько хранить batchId: бот повторяет пакет в пределах минут
+const TRACK_BATCH_RETENTION_MS = 24 * 60 * 60 * 1000;
+
+router.post("/track/batch", async (req: any, res: Response) => {
+  try {
+    const events = Array.isArray(req.body?.events) ? req.body.events : null;
+    if (!events || events.length > TRACK_BATCH_MAX_EVENTS) {
+      res.status(400).json({ error: `Ожидается массив events до ${TRACK_BATCH_MAX_EVENTS} событий` });
+      return;
+    }
+    const batchId = req.body.batchId === undefined ? null : req.body.batchId;
+    if (batchId !== null && (typeof batchId !== "string" || !batchId || batchId.length > TRACK_BATCH_ID_MAX_LENGTH)) {
+      res.status(400).json({ error: `batchId — непустая строка до ${TRACK_BATCH_ID_MAX_LENGTH} символов` });
+      return;
+    }
+
+    const counters = new Map<string, { impressions: number; clicks: number }>();
+    const clickPairs = new Map<string, { userId: string; campaignId: string }>();
+    for (const event of events) {
+      if (!event?.campaignId || (event.type !== "impression" && event.type !== "click")) continue;
+      const campaignId = String(event.campaignId);
+      const counter = counters.get(campaignId) ?? { impressions: 0, clicks: 0 };
+      if (event.type === "impression") {
+        counter.impressions += 1;
+      } else {
+        counter.clicks += 1;
+        if (event.userId) {
+          const userId = String(event.userId);
+          clickPairs.set(`${userId}:${campaignId}`, { userId, campaignId });
+        }
+      }
+      counters.set(campaignId, counter);
+    }
+
+    // Кампании, которых уже нет, пропускаем, чтобы одна удалённая кампания не роняла весь пакет
+    const existing = await prisma.adCampaign.findMany({
+      where: { id: { in: [...counters.keys()] } },
+      select: { id: true }
+    });
+    const existingIds = new Set(existing.map(campaign => campaign.id));
+
+    // Клики сохраняем только для существующих пользователей, как в /track/click
+    const clickUserIds = [...new Set([...clickPairs.values()].map(pair => pair.userId))];
+    const users = clickUserIds.length
+      ? await prisma.user.findMany({ where: { id: { in: clickUserIds } }, select: { id: true } })
+      : [];
+    const userIds = new Set(users.map(user => user.id));
+    const clicks = [...clickPairs.values()].filter(
+      pair => userIds.has(pair.userId) && existingIds.has(pair.campaignId)
+    );
+
+    const date = new Date(new Date().setUTCHours(0,0,0,0));
+    // Одинаковый порядок строк во всех транзакциях, чтобы параллельные пакеты не взаимоблокировались
+    const campaignCounters = [...counters]
+      .filter(([campaignId]) => existingIds.has(campaignId))
+      .sort(([a], [b]) => (a < b ? -1 : a > b ? 1 : 0));
+
+    const applied = await prisma.$transaction(async (tx) => {
+      if (batchId) {
+        // Параллельный повтор того же пакета ждёт здесь коммита первого и получает count = 0
+        const { count } = await tx.adTrackBatch.createMany({ data: [{ id: batchId }], skipDuplicates: true });
+        if (!count) return false;
+      }
+      if (clicks.length) {
+        await tx.adUserClick.createMany({ data: clicks, skipDuplicates: true });
+      }
+      for (const [campaignId, { impressions, clicks }] of campaignCounters) {
+        await tx.adAnalytic.upsert({
+          where: { campaignId_date: { campaignId, date } },
+          update: { impressions: { increment: impressions }, clicks: { increment: clicks } },
+          create: { campaignId, date, impressions, clicks, uniqueViews: 0 }
+        });
+        await tx.adCampaign.update({
+          where: { id: campaignId },
+          data: { impressions: { increment: impressions }, clicks: { increment: clicks } }
+        });
+      }
+      return true;
+    });
+
+    // Старые batchId чистим изредка, не задерживая ответ
+    if (applied && Math.random() < 0.01) {
+      prisma.adTrackBatch.deleteMany({ where: { createdAt: { lt: new Date(Date.now() - TRACK_BATCH_RETENTION_MS) } } })
+        .catch(error => console.error("[ADVERTISING] Error cleaning track batches:", error));
+    }
+
+    res.json({ accepted: events.length, campaigns: existingIds.size, duplicate: !applied });
+  } catch (error) {
+    console.error("[ADVERTISING] Error tracking batch:", error);
+    res.status(500).json({ error: "Ошибка пакетного трекинга" });
+  }
+});
+
 // ===== АДМИНСКИЕ ЭНДПОИНТЫ =====
 
-// Получить все кампании для админа
+// Получить все кампании для админа.
+// ?updatedSince=<ISO> — только созданные или сменившие статус с этого момента, в кратком виде
+// (id, title, status, statusChangedAt), для инкрементального обновления снимка в боте. updatedAt
+// для этого не подходит: его двигает каждый учёт показов и кликов. total — сколько кампаний всего: по нему бот
+// замечает удалённые и перечитывает список целиком. serverTime — курсор для следующего запроса.
 router.get("/admin/campaigns", authMiddleware, requireAdmin, async (req: any, res: Response) => {
   try {
+    const { updatedSince } = req.query;
+    if (updatedSince !== undefined) {
+      const since = new Date(String(updatedSince));
+      if (Number.isNaN(since.getTime())) {
+        res.status(400).json({ error: "invalid updatedSince" });
+        return;
+      }
+
+      const serverTime = new Date();
+      const [changed, total] = await Promise.all([
+        prisma.adCampaign.findMany({
+          where: { statusChangedAt: { gte: since } },
+          select: { id: true, title: true, status: true, statusChangedAt: true },
+          orderBy: { statusChangedAt: "asc" }
+        }),
+        prisma.adCampaign.count()
+      ]);
+
+      res.json({ campaigns: changed, total, serverTime });
+      return;
+    }
+
     const campaigns = await prisma.adCampaign.findMany({
       include: {
         advertiser: {
@@ -756,6 +924,7 @@ router.post("/admin/campaigns/:campaignId/moderate", authMiddleware, requireAdmi
       where: { id: campaignId },
       data: { 
         status: newStatus,
+        statusChangedAt: new Date(),
         // Можно добавить поле moderationComment в схему БД если нужно
       }
     });
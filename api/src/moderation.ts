@@ -3,6 +3,7 @@ import { Router, Response, NextFunction } from "express";
 import { prisma } from "./prisma.ts";
 import { authMiddleware } from "./middleware/auth.ts";
 import { sendTG } from "./notify.ts";
+import { invalidateRankingCache } from "./search.ts";
 
 const router = Router();
 
@@ -355,6 +356,7 @@ router.post("/profiles/:profileId/verify", authMiddleware, requireModerator, asy
         user: { select: { telegramId: true, firstName: true } }
       }
     });
+    invalidateRankingCache([profile.id]);
 
     // Логируем действие
     await prisma.moderatorAction.create({
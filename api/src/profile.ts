@@ -7,6 +7,7 @@ import axios from "axios";
 import { v4 as uuidv4 } from "uuid";
 import { checkImageNsfw } from "./nsfw.ts";
 import { changeTrustScore, TrustChangeReason, checkProfileCompleteness, checkNsfwContent } from "./trust.ts";
+import { invalidateRankingCache } from "./search.ts";
 
 const profileRouter = Router();
 
@@ -334,6 +335,7 @@ profileRouter.post("/profile/update", authMiddleware, async (req, res): Promise<
     }
 
     const updated = await prisma.profile.update({ where: { id: existing.id }, data: dataToUpdate });
+    invalidateRankingCache([updated.id]);
     res.json({ profile: updated });
   } catch (err) {
     console.error("[API] update profile error", err);
@@ -429,6 +431,7 @@ profileRouter.post("/profile/migrate-city", authMiddleware, async (req, res): Pr
       }
     });
 
+    invalidateRankingCache([updatedProfile.id]);
     console.log(`[PROFILE] City migrated for user ${userId}: "${trimmedCity}"`);
 
     res.json({
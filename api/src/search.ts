@@ -4,27 +4,120 @@ import { IncomingMessage } from "http";
 import jwt from "jsonwebtoken";
 import { prisma } from "./prisma.ts";
 import { checkMassLikes } from "./trust.ts";
-import { spawn } from "child_process";
+import { spawn, ChildProcess } from "child_process";
 import path from "path";
 import { fileURLToPath } from "url";
 
-// Функция для ранжирования профилей с помощью ML модели
-async function rankProfiles(profiles: any[], user: any): Promise<any[]> {
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = path.dirname(__filename);
+
+// Используем Python из venv
+const isWin = process.platform === "win32";
+const pythonPath = isWin
+  ? path.join(__dirname, "..", "ml-models", "venv", "Scripts", "python.exe")
+  : path.join(__dirname, "../ml-models/vnev/bin/python3");
+const scriptPath = path.join(__dirname, "../ml-models/rank_profiles.py");
+
+// Таймаут ответа постоянного ML процесса, после которого используем разовый запуск
+const RANKER_TIMEOUT_MS = 5000;
+
+// Сколько лучших анкет просим у ML модели (показываем по одной)
+const RECOMMENDATIONS_TOP_K = 1;
+
+// Постоянный ML процесс (rank_profiles.py --serve): модель загружается один раз
+let ranker: ChildProcess | null = null;
+let rankerBuffer = "";
+let rankerSeq = 0;
+const rankerPending = new Map<number, { resolve: (data: any[]) => void; reject: (err: Error) => void }>();
+// Версия модели из последнего ответа: процесс сам подхватывает новые версии из ml-models/models
+let rankerModelVersion: string | null = null;
+
+function failPending(err: Error) {
+  for (const { reject } of rankerPending.values()) reject(err);
+  rankerPending.clear();
+}
+
+function getRanker(): ChildProcess {
+  if (ranker) return ranker;
+
+  const py = spawn(pythonPath, [scriptPath, "--serve"]);
+  rankerBuffer = "";
+
+  py.stdout!.on("data", (chunk) => {
+    rankerBuffer += chunk;
+    let newline: number;
+    while ((newline = rankerBuffer.indexOf("\n")) !== -1) {
+      const line = rankerBuffer.slice(0, newline);
+      rankerBuffer = rankerBuffer.slice(newline + 1);
+      if (!line.trim()) continue;
+
+      try {
+        const message = JSON.parse(line);
+        if (message.model?.version && message.model.version !== rankerModelVersion) {
+          console.log(`[ML] Ranking model version: ${message.model.version}`);
+          rankerModelVersion = message.model.version;
+        }
+        const pending = rankerPending.get(message.id);
+        if (!pending) continue;
+        rankerPending.delete(message.id);
+        if (message.error) pending.reject(new Error(message.error));
+        else pending.resolve(message.result);
+      } catch (e) {
+        console.error("[ML] Failed to parse server reply:", e);
+      }
+    }
+  });
+
+  py.stderr!.on("data", (err) => console.error("[ML ERROR]", err.toString()));
+  py.stdin!.on("error", (err) => console.error("[ML] Ranking server stdin error:", err));
+
+  py.on("error", (err) => {
+    console.error("[ML] Ranking server failed:", err);
+    if (ranker === py) ranker = null;
+    failPending(err);
+  });
+
+  py.on("close", (code) => {
+    console.error("[ML] Ranking server exited with code", code);
+    if (ranker === py) ranker = null;
+    failPending(new Error(`Ranking server exited with code ${code}`));
+  });
+
+  ranker = py;
+  return py;
+}
+
+function rankProfilesViaServer(profiles: any[], user: any, topK?: number): Promise<any[]> {
   return new Promise((resolve, reject) => {
-    // Используем Python из venv
+    const py = getRanker();
+    const id = ++rankerSeq;
 
-    const __filename = fileURLToPath(import.meta.url);
-    const __dirname = path.dirname(__filename);
+    const timer = setTimeout(() => {
+      rankerPending.delete(id);
+      reject(new Error("Ranking server timeout"));
+    }, RANKER_TIMEOUT_MS);
 
-    const isWin = process.platform === "win32";
-    const pythonPath = isWin
-      ? path.join(__dirname, "..", "ml-models", "venv", "Scripts", "python.exe")
-      : path.join(__dirname, "../ml-models/vnev/bin/python3");
-    const scriptPath = path.join(__dirname, "../ml-models/rank_profiles.py");
-    
+    rankerPending.set(id, {
+      resolve: (data) => { clearTimeout(timer); resolve(data); },
+      reject: (err) => { clearTimeout(timer); reject(err); },
+    });
+
+    py.stdin!.write(JSON.stringify({ id, profiles, user, top_k: topK }) + "\n");
+  });
+}
+
+// Сообщает постоянному ML процессу, что анкеты изменились и их закэшированные скоры устарели
+export function invalidateRankingCache(profileIds: string[]) {
+  if (!ranker || profileIds.length === 0) return;
+  ranker.stdin!.write(JSON.stringify({ invalidate: { profileIds } }) + "\n");
+}
+
+// Разовый запуск скрипта на один запрос (запасной вариант)
+function rankProfilesOneShot(profiles: any[], user: any, topK?: number): Promise<any[]> {
+  return new Promise((resolve, reject) => {
     const py = spawn(pythonPath, [scriptPath]);
 
-    const input = JSON.stringify({ profiles, user });
+    const input = JSON.stringify({ profiles, user, top_k: topK });
 
     let result = "";
     let errorOutput = "";
@@ -60,6 +153,17 @@ async function rankProfiles(profiles: any[], user: any): Promise<any[]> {
   });
 }
 
+// Функция для ранжирования профилей с помощью ML модели.
+// С topK модель возвращает только лучшие анкеты, уже отсортированные по убыванию скора.
+async function rankProfiles(profiles: any[], user: any, topK?: number): Promise<any[]> {
+  try {
+    return await rankProfilesViaServer(profiles, user, topK);
+  } catch (e) {
+    console.error("[ML] Ranking server unavailable, falling back to one-shot:", e);
+    return rankProfilesOneShot(profiles, user, topK);
+  }
+}
+
 export async function startWebSocketServer(ws: WebSocket, req: IncomingMessage) {
   let userId: string;
   try {
@@ -169,7 +273,12 @@ export async function startWebSocketServer(ws: WebSocket, req: IncomingMessage)
         birthYear: p.birthYear,
         goals: p.goals,
         isVerified: p.isVerified || false,
-        likesReceived: 0 // Пока не реализовано в базе
+        likesReceived: 0, // Пока не реализовано в базе
+        // Пользовательские настройки как множитель к ML скору:
+        // localFirst — +20% локальным анкетам, trust score — бонус до 10% (trustScore / 1000)
+        scoreMultiplier:
+          (settings?.localFirst && p.city === userProfile.city ? 1.2 : 1) *
+          (1 + (p.user.trustScore || 40) / 1000)
       }));
 
       const userForML = {
@@ -179,27 +288,10 @@ export async function startWebSocketServer(ws: WebSocket, req: IncomingMessage)
         trustScore: userWithSettings.trustScore || 40
       };
 
-      const ranked = await rankProfiles(profilesForML, userForML);
-      const mlScores = new Map(ranked.map((r) => [r.id, r.score]));
-      
-      // Применяем пользовательские настройки как модификаторы к ML скорам
-      profiles.sort((a, b) => {
-        let scoreA = mlScores.get(a.id) ?? 0;
-        let scoreB = mlScores.get(b.id) ?? 0;
-        
-        // Применяем пользовательские настройки как модификаторы
-        if (settings?.localFirst) {
-          // Увеличиваем скор локальных анкет на 20%
-          if (a.city === userProfile.city) scoreA *= 1.2;
-          if (b.city === userProfile.city) scoreB *= 1.2;
-        }
-        
-        // Дополнительный бонус за высокий trust score (до 10% от ML скора)
-        scoreA += scoreA * ((a.user.trustScore || 40) / 1000);
-        scoreB += scoreB * ((b.user.trustScore || 40) / 1000);
-        
-        return scoreB - scoreA;
-      });
+      // Модель сама выбирает top-K с учётом модификаторов, полная сортировка пула не нужна
+      const ranked = await rankProfiles(profilesForML, userForML, RECOMMENDATIONS_TOP_K);
+      const profilesById = new Map(profiles.map((p) => [p.id, p]));
+      profiles = ranked.map((r) => profilesById.get(r.id)).filter(Boolean);
     } catch (err) {
       console.error("[ML] Ошибка ранжирования, используем fallback сортировку:", err);
       
@@ -229,7 +321,7 @@ export async function startWebSocketServer(ws: WebSocket, req: IncomingMessage)
     }
 
     // Возвращаем только первый профиль
-    return profiles.slice(0, 1);
+    return profiles.slice(0, RECOMMENDATIONS_TOP_K);
   };
 
   const sendNextProfile = async () => {
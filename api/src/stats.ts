@@ -60,19 +60,52 @@ statsRouter.get("/stats/me", authMiddleware, async (req, res) => {
   }
 });
 
-// Админ-метрика: все пользователи
+const ALL_USERS_MAX_PAGE = 5000;
+
+// Админ-метрика: все пользователи.
+// С ?limit= отдаёт страницу по возрастанию telegramId и nextCursor (последний telegramId страницы),
+// следующая страница — ?cursor=<nextCursor>. Без limit и cursor — весь список, как раньше.
 statsRouter.get("/stats/all-users", async (req, res): Promise<void> => {
   try {
+    const { limit, cursor } = req.query;
+    const paginated = limit !== undefined || cursor !== undefined;
+
+    let take: number | undefined;
+    let after: bigint | undefined;
+    if (paginated) {
+      take = Math.min(Math.max(Number(limit) || 1000, 1), ALL_USERS_MAX_PAGE);
+      if (cursor !== undefined) {
+        if (typeof cursor !== "string" || !/^\d+$/.test(cursor)) {
+          res.status(400).json({ error: "invalid cursor" });
+          return;
+        }
+        after = BigInt(cursor);
+      }
+    }
+
     const raw = await prisma.user.findMany({
       select: { id: true, telegramId: true },
+      ...(paginated
+        ? {
+            where: after !== undefined ? { telegramId: { gt: after } } : undefined,
+            orderBy: { telegramId: "asc" as const },
+            take: take! + 1,
+          }
+        : {}),
     });
 
-    const users = raw.map((u) => ({
+    const hasMore = paginated && raw.length > take!;
+    const page = hasMore ? raw.slice(0, take) : raw;
+    const users = page.map((u) => ({
       id: u.id,
       telegramId: u.telegramId.toString(),
     }));
 
-    res.json({ users });
+    if (!paginated) {
+      res.json({ users });
+      return;
+    }
+    res.json({ users, nextCursor: hasMore ? users[users.length - 1].telegramId : null });
   } catch (err) {
     console.error("[STATS] all-users", err);
     res.status(500).json({ error: "internal" });
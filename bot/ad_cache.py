@@ -0,0 +1,130 @@
+# Локальный кэш рекламы: выбор кампании без запроса к API на каждый показ
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+# Поля объявления, которые отдаёт /advertising/serve
+AD_FIELDS = ("id", "title", "description", "imageUrl", "buttonText", "buttonUrl")
+
+
+def _parse_date(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+
+
+class _Campaign:
+    __slots__ = ("ad", "weight", "start", "end")
+
+    def __init__(self, data: dict):
+        self.ad = {field: data[field] for field in AD_FIELDS if field in data}
+        self.weight = data.get("weight") or 0
+        self.start = _parse_date(data.get("startDate"))
+        self.end = _parse_date(data.get("endDate"))
+
+    def running(self, now: datetime) -> bool:
+        return (self.start is None or self.start <= now) and (self.end is None or self.end >= now)
+
+
+class AdCache:
+    """Список показываемых кампаний, который периодически обновляется с API.
+
+    Кампания выбирается локально тем же взвешенным случайным выбором, что и в
+    /advertising/serve, с исключением кампаний, по которым пользователь уже
+    кликал в боте (небольшой LRU по пользователям). Если список не удалось
+    обновить дольше max_stale секунд, показ идёт через API (serve_remote).
+    """
+
+    def __init__(
+        self,
+        load_campaigns: Callable[[], Awaitable[list[dict]]],
+        serve_remote: Callable[[int], Awaitable[dict | None]],
+        refresh_interval: float = 60.0,
+        max_stale: float = 300.0,
+        max_users: int = 10_000,
+    ):
+        self.load_campaigns = load_campaigns
+        self.serve_remote = serve_remote
+        self.refresh_interval = refresh_interval
+        self.max_stale = max_stale
+        self.max_users = max_users
+
+        self._campaigns: list[_Campaign] = []
+        self._by_id: dict[str, _Campaign] = {}
+        self._clicked: OrderedDict[int, set[str]] = OrderedDict()
+        self._refreshed_at: float | None = None
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    @property
+    def fresh(self) -> bool:
+        return self._refreshed_at is not None and time.monotonic() - self._refreshed_at <= self.max_stale
+
+    async def refresh(self) -> None:
+        campaigns = [_Campaign(data) for data in await self.load_campaigns()]
+        self._campaigns = campaigns
+        self._by_id = {c.ad["id"]: c for c in campaigns}
+        self._refreshed_at = time.monotonic()
+        self.refreshes += 1
+
+    async def run(self) -> None:
+        """Фоновое обновление списка кампаний каждые refresh_interval секунд."""
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"Ошибка обновления кэша рекламы: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def serve(self, user_id: int) -> dict | None:
+        if not self.fresh:
+            self.misses += 1
+            return await self.serve_remote(user_id)
+
+        self.hits += 1
+        now = datetime.now(timezone.utc)
+        clicked = self._clicked.get(user_id, ())
+        suitable = [c for c in self._campaigns if c.ad["id"] not in clicked and c.running(now)]
+        if not suitable:
+            return None
+
+        # Как в /advertising/serve: первая кампания, на которой обнулится случайный вес
+        remaining = random.random() * sum(c.weight for c in suitable)
+        for campaign in suitable:
+            remaining -= campaign.weight
+            if remaining <= 0:
+                return dict(campaign.ad)
+        return dict(suitable[0].ad)
+
+    def by_id(self, campaign_id: str) -> dict | None:
+        """Объявление кампании из кэша; None, если её нет в кэше (тогда нужен запрос к API)."""
+        campaign = self._by_id.get(campaign_id) if self.fresh else None
+        return dict(campaign.ad) if campaign is not None else None
+
+    def mark_clicked(self, user_id: int, campaign_id: str) -> None:
+        self._clicked.setdefault(user_id, set()).add(campaign_id)
+        self._clicked.move_to_end(user_id)
+        while len(self._clicked) > self.max_users:
+            self._clicked.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "campaigns": len(self._campaigns),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / total if total else None,
+            "refreshes": self.refreshes,
+            "refreshErrors": self.refresh_errors,
+            "refreshInterval": self.refresh_interval,
+            "lastRefreshAgo": time.monotonic() - self._refreshed_at if self._refreshed_at is not None else None,
+        }
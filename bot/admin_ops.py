@@ -0,0 +1,193 @@
+# Массовые админские операции над кампаниями: снимок статусов и пул воркеров для модерации
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Iterable
+
+# Курсор «с начала времён» — полная загрузка снимка
+EPOCH = "1970-01-01T00:00:00.000Z"
+
+
+class CampaignSnapshot:
+    """Локальная копия кампаний (id, title, status, statusChangedAt) для админских команд.
+
+    load(since, token) возвращает ответ GET /advertising/admin/campaigns?updatedSince=since:
+    созданные или сменившие статус кампании (учёт показов и кликов их не задевает),
+    общее число и serverTime для следующего курсора. Первый refresh() загружает
+    всё, дальше приходят только изменения. Удалённые кампании
+    в изменения не попадают, поэтому снимок перечитывается целиком, если после
+    слияния число кампаний разошлось с total на сервере, и в любом случае не реже
+    раза в full_reload_interval секунд — так удаление, совпавшее с созданием
+    другой кампании, не задерживается в снимке. Данные моложе max_age секунд не
+    перезапрашиваются.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str, str], Awaitable[dict]],
+        max_age: float = 5.0,
+        full_reload_interval: float = 300.0,
+    ):
+        self.load = load
+        self.max_age = max_age
+        self.full_reload_interval = full_reload_interval
+        self._campaigns: dict[str, dict] = {}
+        self._cursor = EPOCH
+        self._refreshed_at: float | None = None
+        self._full_loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+        self.full_loads = 0
+        self.delta_loads = 0
+
+    async def refresh(self, token: str, force: bool = False) -> None:
+        async with self._lock:
+            if not force and self._fresh():
+                return
+            if self._full_reload_due():
+                data = await self._load_full(token)
+            else:
+                data = await self.load(self._cursor, token)
+                self.delta_loads += 1
+                for campaign in data.get("campaigns", []):
+                    self._campaigns[campaign["id"]] = campaign
+                if len(self._campaigns) != data.get("total", len(self._campaigns)):
+                    data = await self._load_full(token)
+            self._cursor = data.get("serverTime") or EPOCH
+            self._refreshed_at = time.monotonic()
+
+    def update(self, campaign_id: str, status: str) -> None:
+        """Отмечает результат модерации сразу, не дожидаясь следующего refresh()."""
+        campaign = self._campaigns.get(campaign_id)
+        if campaign is not None:
+            campaign["status"] = status
+
+    def summary(self) -> Counter:
+        return Counter(c.get("status", "unknown") for c in self._campaigns.values())
+
+    def with_status(self, status: str) -> list[dict]:
+        return [c for c in self._campaigns.values() if c.get("status") == status]
+
+    def __len__(self) -> int:
+        return len(self._campaigns)
+
+    async def _load_full(self, token: str) -> dict:
+        data = await self.load(EPOCH, token)
+        self._campaigns = {c["id"]: c for c in data.get("campaigns", [])}
+        self._full_loaded_at = time.monotonic()
+        self.full_loads += 1
+        return data
+
+    def _full_reload_due(self) -> bool:
+        return (
+            self._cursor == EPOCH
+            or self._full_loaded_at is None
+            or time.monotonic() - self._full_loaded_at >= self.full_reload_interval
+        )
+
+    def _fresh(self) -> bool:
+        return self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.max_age
+
+
+class RetryableError(Exception):
+    """Временная ошибка (сеть, 5xx, 429): операцию можно повторить."""
+
+
+class BulkStats:
+    __slots__ = ("total", "ok", "skipped", "failed", "retried", "started_at", "finished_at")
+
+    def __init__(self, total: int):
+        self.total = total
+        self.ok = 0
+        self.skipped = 0
+        self.failed = 0
+        self.retried = 0
+        self.started_at = time.monotonic()
+        self.finished_at: float | None = None
+
+    @property
+    def done(self) -> int:
+        return self.ok + self.skipped + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def as_text(self) -> str:
+        return (
+            f"Обработано: {self.done}/{self.total}\n"
+            f"Успешно: {self.ok}, пропущено: {self.skipped}, ошибок: {self.failed}\n"
+            f"Повторов: {self.retried}, прошло {self.elapsed:.1f} с"
+        )
+
+
+async def run_bulk(
+    items: Iterable[str],
+    action: Callable[[str], Awaitable[bool]],
+    concurrency: int = 10,
+    max_retries: int = 3,
+    backoff: float = 0.5,
+    on_progress: Callable[[BulkStats], Awaitable[None]] | None = None,
+    progress_interval: float = 2.0,
+    on_result: Callable[[str, str], None] | None = None,
+) -> BulkStats:
+    """Выполняет action для каждого элемента, не больше concurrency одновременно.
+
+    action возвращает True при успехе и False, если элемент пропущен (например,
+    кампанию уже промодерировали). RetryableError повторяется с экспоненциальной
+    паузой до max_retries раз; прочие исключения сразу считаются ошибкой.
+    on_result(элемент, исход) вызывается с исходом ok, skipped или failed.
+    """
+    items = list(items)
+    stats = BulkStats(len(items))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(item: str) -> None:
+        async with semaphore:
+            outcome = await _attempt(item, action, max_retries, backoff, stats)
+        setattr(stats, outcome, getattr(stats, outcome) + 1)
+        if on_result:
+            on_result(item, outcome)
+
+    reporter = asyncio.create_task(_report(stats, on_progress, progress_interval)) if on_progress else None
+    try:
+        await asyncio.gather(*(run_one(item) for item in items))
+    finally:
+        if reporter:
+            reporter.cancel()
+            await asyncio.gather(reporter, return_exceptions=True)
+        stats.finished_at = time.monotonic()
+
+    if on_progress:
+        await _notify(stats, on_progress)
+    return stats
+
+
+async def _attempt(item: str, action, max_retries: int, backoff: float, stats: BulkStats) -> str:
+    for attempt in range(max_retries + 1):
+        try:
+            return "ok" if await action(item) else "skipped"
+        except RetryableError as e:
+            if attempt == max_retries:
+                print(f"Операция над {item} не удалась после {attempt + 1} попыток: {e}")
+                break
+            stats.retried += 1
+            await asyncio.sleep(backoff * 2 ** attempt)
+        except Exception as e:
+            print(f"Ошибка операции над {item}: {e}")
+            break
+    return "failed"
+
+
+async def _report(stats: BulkStats, on_progress, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        await _notify(stats, on_progress)
+
+
+async def _notify(stats: BulkStats, on_progress) -> None:
+    try:
+        await on_progress(stats)
+    except Exception as e:
+        print(f"Ошибка отчёта о массовой операции: {e}")
@@ -5,14 +5,28 @@ from __future__ import annotations
 import os
 import asyncio
 import uuid
-from collections import defaultdict
 from datetime import datetime, time
-from typing import Dict, List
+from typing import List
 from dotenv import load_dotenv
 
+from ad_cache import AdCache
+from admin_ops import BulkStats, CampaignSnapshot, RetryableError, run_bulk
+from broadcast import Broadcaster, BroadcastStats, RateLimiter
+from broadcast_jobs import BroadcastJob, JobStore
+from http_client import ApiClient
+from media_cache import MediaCache
+from media_groups import MediaGroupAggregator
+from metrics import HandlerMetricsMiddleware, Metrics, TelegramMetricsMiddleware, start_metrics_server
+from profile_cache import ProfileCache
+from state_store import make_store, sweep_forever
+from tracking import TrackingQueue
+from webhook import run_webhook
+
 import aiohttp
 from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode, ContentType
 from aiogram.filters import CommandStart, Command
 from aiogram.types import (
@@ -21,7 +35,6 @@ from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
     ReplyKeyboardRemove,
-    InputMediaPhoto,
     Message,
     WebAppInfo,
     PhotoSize,
@@ -31,11 +44,25 @@ load_dotenv()
 
 # === CONFIG ===
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Свой сервер Bot API (local bot-api или фейковый Telegram из loadtest.py); по умолчанию api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
 API_BASE = os.getenv("api_url") or "https://spectrmod.ru/api"
 WEBAPP_URL = "https://kash-dev-reflex.vercel.app/"  # открывается через Web-App кнопку
 SUPPORT_USERNAME = "spectrmod"  # @spectrmod
 INTRO_PICTURE = "https://s.iimg.su/s/18/3dr82mIVRK6ojKvPQH2OBcYEM4pStJ0zrTo2USQ6.png"
 
+# Режим получения апдейтов: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный URL webhook; если задан, бот сам регистрирует его в Telegram при старте
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH") or "/telegram/webhook"
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST") or "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT") or 8080)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Prometheus-метрики на http://METRICS_HOST:METRICS_PORT/metrics; METRICS_PORT=0 отключает сервер
+METRICS_HOST = os.getenv("METRICS_HOST") or "127.0.0.1"
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 9100)
+
 # Admins who can run maintenance commands
 ADMIN_IDS = {8072408248, 7001269338, 8186814795}
 
@@ -44,35 +71,90 @@ PROFILE_BY_TG_URL = f"{API_BASE}/profile/by-telegram/{{telegram_id}}"
 UPLOAD_URL = f"{API_BASE}/profile/add-media"
 # Рекламные эндпоинты
 AD_SERVE_URL = f"{API_BASE}/advertising/serve"
-AD_IMPRESSION_URL = f"{API_BASE}/advertising/track/impression"
-AD_CLICK_URL = f"{API_BASE}/advertising/track/click"
+AD_TRACK_BATCH_URL = f"{API_BASE}/advertising/track/batch"
+AD_CAMPAIGNS_URL = f"{API_BASE}/advertising/serve/campaigns"
+ALL_USERS_URL = f"{API_BASE}/stats/all-users"
+ADMIN_CAMPAIGNS_URL = f"{API_BASE}/advertising/admin/campaigns"
+
+# Сколько запросов модерации /approveall отправляет одновременно
+ADMIN_BULK_CONCURRENCY = int(os.getenv("ADMIN_BULK_CONCURRENCY") or 10)
+# Сколько получателей рассылки обрабатывается одновременно
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS") or 20)
+# Общий лимит рассылки, сообщений в секунду (у Telegram по умолчанию ~30)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE") or 25)
+# SQLite с file_id отправленных картинок
+MEDIA_CACHE_PATH = os.getenv("MEDIA_CACHE_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "media_cache.sqlite3"
+)
+# Как часто обновлять локальный список рекламных кампаний, секунды
+AD_REFRESH_INTERVAL = float(os.getenv("AD_REFRESH_INTERVAL") or 60)
+# Redis для общего состояния пользователей между процессами бота; без него — память процесса
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL")
+# Размер страницы при переборе пользователей для рассылки
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE") or 1000)
+# SQLite с заданиями рассылки; в контейнере должен лежать на постоянном томе
+BROADCAST_DB_PATH = os.getenv("BROADCAST_DB_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "broadcast_jobs.sqlite3"
+)
 
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+bot = Bot(
+    token=BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
+    default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+)
 dp = Dispatcher()
+# Задержки обработчиков, вызовов API и Bot API
+metrics = Metrics()
+bot.session.middleware(TelegramMetricsMiddleware(metrics))
+dp.message.middleware(HandlerMetricsMiddleware(metrics, "message"))
+dp.callback_query.middleware(HandlerMetricsMiddleware(metrics, "callback_query"))
+# Общая сессия с пулом keep-alive соединений для всех запросов к API
+api = ApiClient(metrics=metrics)
+broadcast_jobs = JobStore(BROADCAST_DB_PATH)
+# Картинки, отправленные однажды по URL, дальше шлём по file_id
+media_cache = MediaCache(MEDIA_CACHE_PATH)
+# Задания рассылки выполняются по одному
+broadcast_lock = asyncio.Lock()
 
 # --- Runtime storage for multi-step image uploads ---
 class UploadState:
+    __slots__ = ("mode", "images")
     mode: str  # "upload"
     images: List[str]
-    def __init__(self):
-        self.mode = "upload"
-        self.images = []
+    def __init__(self, mode: str = "upload", images: List[str] | None = None):
+        self.mode = mode
+        self.images = images or []
 
-user_states: Dict[int, UploadState] = {}
-media_groups: defaultdict[str, List[Message]] = defaultdict(list)
+    def to_dict(self) -> dict:
+        return {"mode": self.mode, "images": self.images}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> UploadState:
+        return cls(data["mode"], data["images"])
+
+# Незавершённая загрузка живёт полчаса с последнего действия
+user_states = make_store(
+    "upload", ttl=30 * 60, max_entries=10_000, redis_url=STATE_REDIS_URL,
+    encode=UploadState.to_dict, decode=UploadState.from_dict,
+)
 
 # Счетчик действий пользователей для показа рекламы в поиске
-user_actions: defaultdict[int, int] = defaultdict(int)
+user_actions = make_store("actions", ttl=6 * 3600, max_entries=100_000, redis_url=STATE_REDIS_URL)
 
 # === Helpers ===
+async def load_profile(tg_id: int) -> dict | None:
+    """Запрашивает профиль у API; None, если профиля нет. Ошибки сети пробрасываются."""
+    url = PROFILE_BY_TG_URL.format(telegram_id=tg_id)
+    async with api.session.get(url, timeout=aiohttp.ClientTimeout(total=5)) as resp:
+        data = await resp.json()
+        return data.get("profile") if data.get("exists") else None
+
+profile_cache = ProfileCache(load_profile)
+
 async def fetch_profile(tg_id: int) -> dict | None:
     """Возвращает профиль пользователя (минимальный), либо None."""
-    url = PROFILE_BY_TG_URL.format(telegram_id=tg_id)
     try:
-        async with aiohttp.ClientSession() as sess:
-            async with sess.get(url, timeout=aiohttp.ClientTimeout(total=5)) as resp:
-                data = await resp.json()
-                return data.get("profile") if data.get("exists") else None
+        return await profile_cache.get(tg_id)
     except Exception:
         return None
 
@@ -91,57 +173,110 @@ async def create_webapp_session(tg_id: int) -> str:
     # POST запрос на создание сессии убран
     return token
 
+# === Модерация кампаний ===
+async def load_campaign_changes(since: str, token: str) -> dict:
+    """Кампании, изменённые с момента since, в кратком виде — для снимка статусов."""
+    async with api.session.get(
+        ADMIN_CAMPAIGNS_URL,
+        params={"updatedSince": since},
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=aiohttp.ClientTimeout(total=10)
+    ) as resp:
+        resp.raise_for_status()
+        return await resp.json()
+
+campaign_snapshot = CampaignSnapshot(load_campaign_changes)
+
+async def moderate_campaign(campaign_id: str, action: str, token: str, comment: str | None = None) -> bool:
+    """
+    Одобряет или отклоняет кампанию. False — кампания уже промодерирована или удалена;
+    сетевые ошибки, 429 и 5xx можно повторить (RetryableError).
+    """
+    try:
+        async with api.session.post(
+            f"{ADMIN_CAMPAIGNS_URL}/{campaign_id}/moderate",
+            json={"action": action, "comment": comment},
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=aiohttp.ClientTimeout(total=10)
+        ) as resp:
+            if resp.status == 200:
+                return True
+            if resp.status in (400, 404):
+                return False
+            if resp.status == 429 or resp.status >= 500:
+                raise RetryableError(f"HTTP {resp.status}")
+            raise RuntimeError(f"HTTP {resp.status}: {await resp.text()}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise RetryableError(str(e) or type(e).__name__) from e
+
 # === Реклама ===
 async def get_advertisement(user_id: int) -> dict | None:
+    """Выбирает рекламу для пользователя из локального кэша кампаний (или через API, если кэш устарел)."""
+    return await ad_cache.serve(user_id)
+
+async def fetch_advertisement(user_id: int) -> dict | None:
     """Получает рекламу для пользователя с API."""
     try:
-        async with aiohttp.ClientSession() as sess:
-            async with sess.get(
-                AD_SERVE_URL, 
-                params={"userId": user_id},
-                timeout=aiohttp.ClientTimeout(total=5)
-                          ) as resp:
-                  data = await resp.json()
-                  print(f"[DEBUG] Реклама для пользователя {user_id}: {data}")
-                  return data.get("ad") if data.get("ad") else None
+        async with api.session.get(
+            AD_SERVE_URL, 
+            params={"userId": user_id},
+            timeout=aiohttp.ClientTimeout(total=5)
+        ) as resp:
+            data = await resp.json()
+            print(f"[DEBUG] Реклама для пользователя {user_id}: {data}")
+            return data.get("ad") if data.get("ad") else None
     except Exception as e:
         print(f"Ошибка получения рекламы: {e}")
         return None
 
 async def get_advertisement_by_id(campaign_id: str) -> dict | None:
     """Получает конкретную рекламу по ID кампании."""
+    ad = ad_cache.by_id(campaign_id)
+    if ad is not None:
+        return ad
     try:
-        async with aiohttp.ClientSession() as sess:
-            async with sess.get(
-                f"{API_BASE}/advertising/campaign/{campaign_id}/ad",
-                timeout=aiohttp.ClientTimeout(total=5)
-            ) as resp:
-                data = await resp.json()
-                return data.get("ad") if data.get("ad") else None
+        async with api.session.get(
+            f"{API_BASE}/advertising/campaign/{campaign_id}/ad",
+            timeout=aiohttp.ClientTimeout(total=5)
+        ) as resp:
+            data = await resp.json()
+            return data.get("ad") if data.get("ad") else None
     except Exception as e:
         print(f"Ошибка получения рекламы по ID: {e}")
         return None
 
-async def track_ad_impression(campaign_id: str, user_id: int):
-    """Отправляет трекинг показа рекламы."""
-    try:
-        payload = {"campaignId": campaign_id, "userId": user_id}
-        async with aiohttp.ClientSession() as sess:
-            await sess.post(AD_IMPRESSION_URL, json=payload, timeout=aiohttp.ClientTimeout(total=3))
-    except Exception as e:
-        print(f"Ошибка трекинга показа: {e}")
+async def fetch_ad_campaigns() -> List[dict]:
+    """Все кампании, которые сейчас можно показывать (для AdCache)."""
+    async with api.session.get(AD_CAMPAIGNS_URL, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+        resp.raise_for_status()
+        data = await resp.json()
+    return data.get("campaigns", [])
 
-async def track_ad_click(campaign_id: str, user_id: int):
-    """Отправляет трекинг клика по рекламе."""
-    try:
-        payload = {"campaignId": campaign_id, "userId": user_id}
-        async with aiohttp.ClientSession() as sess:
-            await sess.post(AD_CLICK_URL, json=payload, timeout=aiohttp.ClientTimeout(total=3))
-    except Exception as e:
-        print(f"Ошибка трекинга клика: {e}")
+ad_cache = AdCache(fetch_ad_campaigns, fetch_advertisement, refresh_interval=AD_REFRESH_INTERVAL)
+
+async def send_tracking_batch(batch_id: str, events: List[dict]):
+    payload = {"batchId": batch_id, "events": events}
+    async with api.session.post(AD_TRACK_BATCH_URL, json=payload, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+        resp.raise_for_status()
+
+# Показы и клики копятся в очереди и уходят в API пачками, не задерживая отправку сообщений
+ad_tracking = TrackingQueue(send_tracking_batch)
+
+def track_ad_impression(campaign_id: str, user_id: int):
+    """Ставит показ рекламы в очередь трекинга."""
+    ad_tracking.add("impression", campaign_id, user_id)
+
+def track_ad_click(campaign_id: str, user_id: int):
+    """Ставит клик по рекламе в очередь трекинга."""
+    ad_tracking.add("click", campaign_id, user_id)
 
-async def send_advertisement(chat_id: int, user_id: int):
-    """Отправляет рекламу пользователю в чат."""
+async def send_advertisement(chat_id: int, user_id: int, limiter: RateLimiter | None = None):
+    """Отправляет рекламу пользователю в чат.
+
+    При рассылке передаётся limiter: отправка ждёт его лимитов, а любые ошибки
+    отправки (flood-wait, блокировка бота, сеть, BadRequest) пробрасываются
+    наружу, чтобы Broadcaster учёл их как повтор, blocked или failed.
+    """
     ad = await get_advertisement(user_id)
     if not ad:
         return False
@@ -158,10 +293,13 @@ async def send_advertisement(chat_id: int, user_id: int):
         ])
         
         # Отправляем рекламу
+        if limiter is not None:
+            await limiter.acquire(chat_id)
         if ad.get("imageUrl"):
-            await bot.send_photo(
-                chat_id=chat_id,
-                photo=ad["imageUrl"],
+            await media_cache.send_photo(
+                bot,
+                chat_id,
+                ad["imageUrl"],
                 caption=f"🎯 <b>{ad.get('title', '')}</b>\n\n{ad.get('description', '')}",
                 reply_markup=keyboard
             )
@@ -173,10 +311,12 @@ async def send_advertisement(chat_id: int, user_id: int):
             )
         
         # Трекаем показ
-        await track_ad_impression(ad["id"], user_id)
+        track_ad_impression(ad["id"], user_id)
         return True
         
     except Exception as e:
+        if limiter is not None:
+            raise
         print(f"Ошибка отправки рекламы: {e}")
         return True
 
@@ -192,7 +332,7 @@ async def cmd_start(msg: Message):
 
     # Legacy quick entry to upload flow
     if arg in {"upload", "media"}:
-        user_states[tg_id] = UploadState()
+        await user_states.set(tg_id, UploadState())
         await msg.answer("📸 Отправьте до 5 изображений для анкеты. После — нажмите ✅ Завершить.")
         return
 
@@ -226,7 +366,7 @@ async def cmd_start(msg: Message):
         )
 
     # 1) Отправляем превью с inline-кнопкой
-    await bot.send_photo(chat_id=msg.chat.id, photo=INTRO_PICTURE, caption=caption, reply_markup=inline_kb)
+    await media_cache.send_photo(bot, msg.chat.id, INTRO_PICTURE, caption=caption, reply_markup=inline_kb)
 
     # 2) Следом — сервисное сообщение, которое показывает Reply-клавиатуру-меню
     await msg.answer("Меню", reply_markup=reply_kb)
@@ -259,10 +399,10 @@ async def menu_upload(msg: Message):
     # Показываем нынешние фото (альбомом, если >1)
     try:
         if len(images) > 1:
-            media = [InputMediaPhoto(media=url) for url in images[:10]]  # телеграм ограничивает 10 на альбом
-            await bot.send_media_group(chat_id=msg.chat.id, media=media)  # type: ignore[arg-type]
+            # телеграм ограничивает 10 на альбом
+            await media_cache.send_media_group(bot, msg.chat.id, images[:10])
         elif images:
-            await bot.send_photo(chat_id=msg.chat.id, photo=images[0])
+            await media_cache.send_photo(bot, msg.chat.id, images[0])
     except Exception:
         # Если случилось что-то при отправке изображений — пропускаем, не критично.
         pass
@@ -298,7 +438,7 @@ async def start_upload_flow(msg: Message):
         await msg.answer("У вас уже 5 фото — сначала удалите лишние в приложении.")
         return
 
-    user_states[tg_id] = UploadState()
+    await user_states.set(tg_id, UploadState())
     await msg.answer(
         f"📸 Отправьте до {remaining} изображений. После — нажмите ✅ Завершить.",
         reply_markup=ReplyKeyboardRemove(),
@@ -334,26 +474,37 @@ async def handle_photos(msg: Message):
     # Показываем рекламу иногда во время загрузки фото
     await maybe_show_search_ad(msg.chat.id, tg_id)
     
-    if tg_id not in user_states:
+    state = await user_states.get(tg_id)
+    if state is None:
         await msg.answer("Сначала нажмите «📸 Загрузить фото».")
         return
 
-    state = user_states.get(tg_id)
-    if not state or state.mode != "upload":
+    if state.mode != "upload":
         return  # not in upload mode
 
-    # Collect media groups so we process the album once
+    # Альбом обработает агрегатор один раз, когда придут все фото
     if msg.media_group_id:
-        media_groups[msg.media_group_id].append(msg)
-        # Wait a moment for the group to complete
-        await asyncio.sleep(1.2)
-        if media_groups[msg.media_group_id]:
-            group = media_groups.pop(msg.media_group_id)
-            for m in group:
-                await _save_photo(m, state)
-    else:
-        await _save_photo(msg, state)
+        media_albums.add(msg)
+        return
+
+    await _save_photos([msg], state)
+    await _report_upload(msg, state)
+
 
+async def handle_album(group: List[Message]):
+    msg = group[0]
+    state = await user_states.get(msg.from_user.id)
+    if not state or state.mode != "upload":
+        return
+
+    await _save_photos(group, state)
+    await _report_upload(msg, state)
+
+
+media_albums = MediaGroupAggregator(handle_album)
+
+
+async def _report_upload(msg: Message, state: UploadState):
     count = len(state.images)
     await msg.answer(f"✅ Загружено {count}/5 фото")
 
@@ -370,7 +521,7 @@ async def handle_photos(msg: Message):
 @dp.message(F.text == "✅ Завершить")
 async def finish_manual(msg: Message):
     tg_id = msg.from_user.id
-    state = user_states.get(tg_id)
+    state = await user_states.get(tg_id)
     if not state or not state.images:
         await msg.answer("Сначала загрузите хотя бы одну фотографию.")
         return
@@ -378,29 +529,51 @@ async def finish_manual(msg: Message):
     await _finish_upload(msg, state)
 
 
-async def _save_photo(msg: Message, state: UploadState):
-    if len(state.images) >= 5:
+async def _upload_photo(msg: Message) -> str | None:
+    """Загружает фото из сообщения в анкету; URL фото или None, если API его не принял."""
+    photo: PhotoSize = msg.photo[-1]
+    file = await bot.get_file(photo.file_id)
+    url = bot.session.api.file_url(BOT_TOKEN, file.file_path)
+
+    async with api.session.post(UPLOAD_URL, json={
+        "telegramId": str(msg.from_user.id),
+        "imageUrl": url,
+    }) as resp:
+        return url if resp.status == 200 else None
+
+
+async def _save_photos(messages: List[Message], state: UploadState):
+    """Загружает фото одновременно, не больше, чем осталось мест в анкете."""
+    msg = messages[0]
+    tg_id = msg.from_user.id
+
+    # API проверяет лимит до загрузки, поэтому параллельные запросы могли бы его превысить
+    profile = await fetch_profile(tg_id)
+    taken = max(len(state.images), len(profile.get("images", [])) if profile else 0)
+    slots = max(0, 5 - taken)
+    if slots == 0:
         await msg.answer("🚫 Достигнут лимит 5 фотографий.")
         return
 
-    photo: PhotoSize = msg.photo[-1]
-    file = await bot.get_file(photo.file_id)
-    url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file.file_path}"
-
-    async with aiohttp.ClientSession() as sess:
-        resp = await sess.post(UPLOAD_URL, json={
-            "telegramId": str(msg.from_user.id),
-            "imageUrl": url,
-        })
-        if resp.status == 200:
-            state.images.append(url)
-        else:
-            await msg.answer("❌ Не удалось загрузить фото, попробуйте ещё раз.")
+    results = await asyncio.gather(*(_upload_photo(m) for m in messages[:slots]), return_exceptions=True)
+    uploaded = [url for url in results if isinstance(url, str)]
+    failed = len(results) - len(uploaded)
+
+    state.images.extend(uploaded)
+    if uploaded:
+        await user_states.set(tg_id, state)
+        # В профиле появились новые фото — следующий fetch_profile должен их увидеть
+        profile_cache.invalidate(tg_id)
+    if failed:
+        await msg.answer("❌ Не удалось загрузить фото, попробуйте ещё раз." if failed == 1 else
+                         f"❌ Не удалось загрузить {failed} фото, попробуйте ещё раз.")
+    if len(messages) > slots:
+        await msg.answer("🚫 Достигнут лимит 5 фотографий.")
 
 
 async def _finish_upload(msg: Message, state: UploadState):
     tg_id = msg.from_user.id
-    user_states.pop(tg_id, None)
+    await user_states.delete(tg_id)
 
     # Вернём пользователя к меню
     await back_to_main(msg)
@@ -457,30 +630,43 @@ async def cmd_broadcast_ads(msg: Message):
         await msg.answer("Недостаточно прав.")
         return
 
-    await msg.answer("🚀 Начинаю рассылку рекламы...")
-    
+    if broadcast_lock.locked():
+        await msg.answer("⏳ Уже идёт рассылка, статус: /broadcasts")
+        return
+
+    status = await msg.answer("🚀 Начинаю рассылку рекламы...")
+
+    async def report(stats: BroadcastStats):
+        await status.edit_text(f"🚀 Рассылка рекламы\n\n{stats.as_text()}")
+
     try:
-        url = f"{API_BASE}/stats/all-users"
-        async with aiohttp.ClientSession() as sess:
-            async with sess.get(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-                data = await resp.json()
-                users = data.get("users", [])
-        
-        sent_count = 0
-        for user in users:
-            try:
-                tg_id = int(user.get("telegramId"))
-                if await send_advertisement(tg_id, tg_id):
-                    sent_count += 1
-                await asyncio.sleep(0.1)
-            except Exception:
-                continue
-        
-        await msg.answer(f"✅ Рассылка завершена. Отправлено: {sent_count} реклам")
+        stats = await start_ad_broadcast("manual", on_progress=report)
+        await msg.answer(f"✅ Рассылка завершена. Отправлено: {stats.sent} реклам")
         
     except Exception as e:
         await msg.answer(f"❌ Ошибка рассылки: {e}")
 
+@dp.message(Command("broadcasts"))
+async def cmd_broadcasts(msg: Message):
+    """
+    Админская команда: статус последних заданий рассылки или одного задания по ID.
+    """
+    if msg.from_user.id not in ADMIN_IDS:
+        await msg.answer("Недостаточно прав.")
+        return
+
+    parts = (msg.text or "").split(maxsplit=1)
+    if len(parts) > 1:
+        status = broadcast_jobs.status(parts[1].strip())
+        statuses = [status] if status else []
+    else:
+        statuses = broadcast_jobs.recent()
+
+    if not statuses:
+        await msg.answer("❌ Заданий рассылки не найдено")
+        return
+    await msg.answer("📨 Рассылки:\n\n" + "\n\n".join(format_job_status(s) for s in statuses))
+
 @dp.message(Command("checkcampaigns"))
 async def cmd_check_campaigns(msg: Message):
     """
@@ -495,30 +681,17 @@ async def cmd_check_campaigns(msg: Message):
         if not token:
             await msg.answer("❌ Ошибка авторизации")
             return
-            
-        url = f"{API_BASE}/advertising/admin/campaigns"
-        async with aiohttp.ClientSession() as sess:
-            async with sess.get(
-                url, 
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as resp:
-                data = await resp.json()
-                campaigns = data.get("campaigns", [])
-        
-        if not campaigns:
+
+        await campaign_snapshot.refresh(token)
+        if not len(campaign_snapshot):
             await msg.answer("❌ Нет кампаний в системе")
             return
-        
-        status_counts = {}
-        for campaign in campaigns:
-            status = campaign.get("status", "unknown")
-            status_counts[status] = status_counts.get(status, 0) + 1
-        
-        status_text = "\n".join([f"• {status}: {count}" for status, count in status_counts.items()])
-        
-        await msg.answer(f"📊 Статистика кампаний:\n{status_text}\n\nВсего: {len(campaigns)}")
-        
+
+        status_text = "\n".join(
+            f"• {status}: {count}" for status, count in campaign_snapshot.summary().most_common()
+        )
+        await msg.answer(f"📊 Статистика кампаний:\n{status_text}\n\nВсего: {len(campaign_snapshot)}")
+
     except Exception as e:
         await msg.answer(f"❌ Ошибка получения кампаний: {e}")
 
@@ -536,48 +709,82 @@ async def cmd_approve_all(msg: Message):
         if not token:
             await msg.answer("❌ Ошибка авторизации")
             return
-            
-        # Получаем все кампании
-        url = f"{API_BASE}/advertising/admin/campaigns"
-        async with aiohttp.ClientSession() as sess:
-            async with sess.get(
-                url, 
-                headers={"Authorization": f"Bearer {token}"},
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as resp:
-                data = await resp.json()
-                campaigns = data.get("campaigns", [])
-        
-        pending_campaigns = [c for c in campaigns if c.get("status") == "pending"]
-        
-        if not pending_campaigns:
+
+        await campaign_snapshot.refresh(token, force=True)
+        pending_ids = [c["id"] for c in campaign_snapshot.with_status("pending")]
+        if not pending_ids:
             await msg.answer("❌ Нет кампаний на модерации")
             return
-        
-        await msg.answer(f"🔄 Одобряю {len(pending_campaigns)} кампаний...")
-        
-        approved_count = 0
-        for campaign in pending_campaigns:
-            try:
-                moderate_url = f"{API_BASE}/advertising/admin/campaigns/{campaign['id']}/moderate"
-                async with aiohttp.ClientSession() as sess:
-                    async with sess.post(
-                        moderate_url, 
-                        json={"action": "approve", "comment": "Автоодобрение"},
-                        headers={"Authorization": f"Bearer {token}"},
-                        timeout=aiohttp.ClientTimeout(total=10)
-                    ) as resp:
-                        if resp.status == 200:
-                            approved_count += 1
-            except Exception as e:
-                print(f"Ошибка одобрения кампании {campaign['id']}: {e}")
-                continue
-        
-        await msg.answer(f"✅ Одобрено кампаний: {approved_count}")
-        
+
+        status = await msg.answer(f"🔄 Одобряю {len(pending_ids)} кампаний...")
+
+        async def report(stats: BulkStats):
+            await status.edit_text(f"🔄 Одобрение кампаний\n\n{stats.as_text()}")
+
+        def remember(campaign_id: str, outcome: str):
+            if outcome == "ok":
+                campaign_snapshot.update(campaign_id, "active")
+
+        stats = await run_bulk(
+            pending_ids,
+            lambda campaign_id: moderate_campaign(campaign_id, "approve", token, comment="Автоодобрение"),
+            concurrency=ADMIN_BULK_CONCURRENCY,
+            on_progress=report,
+            on_result=remember,
+        )
+        await msg.answer(f"✅ Одобрено кампаний: {stats.ok}")
+
     except Exception as e:
         await msg.answer(f"❌ Ошибка одобрения: {e}")
 
+@dp.message(Command("apistats"))
+async def cmd_api_stats(msg: Message):
+    """
+    Админская команда: статистика HTTP-соединений к API.
+    """
+    if msg.from_user.id not in ADMIN_IDS:
+        await msg.answer("Недостаточно прав.")
+        return
+
+    stats = api.stats()
+    profiles = profile_cache.stats()
+    media = media_cache.stats()
+    states = {store.name: store.size() for store in (user_states, user_actions)}
+    await msg.answer(
+        f"🔌 Запросов к API: {stats['requests']}\n"
+        f"Новых соединений: {stats['connectionsCreated']}\n"
+        f"Переиспользовано: {stats['connectionsReused']}\n\n"
+        f"👤 Кэш профилей: {profiles['entries']} записей, попаданий {profiles['hits']}, "
+        f"запросов {profiles['misses']}, объединено {profiles['coalesced']}\n"
+        f"🖼 Кэш file_id: {media['entries']} картинок, по file_id {media['hits']}, "
+        f"по URL {media['misses']}, отвергнуто {media['rejected']}\n"
+        f"🧠 Состояние: загрузок {states['upload'] if states['upload'] is not None else '—'}, "
+        f"счётчиков действий {states['actions'] if states['actions'] is not None else '—'}, "
+        f"альбомов в сборке {media_albums.pending()}"
+    )
+
+@dp.message(Command("adcache"))
+async def cmd_ad_cache(msg: Message):
+    """
+    Админская команда: состояние локального кэша рекламы и очереди трекинга.
+    """
+    if msg.from_user.id not in ADMIN_IDS:
+        await msg.answer("Недостаточно прав.")
+        return
+
+    stats = ad_cache.stats()
+    tracking = ad_tracking.stats()
+    hit_rate = f"{stats['hitRate']:.0%}" if stats["hitRate"] is not None else "—"
+    refreshed = f"{stats['lastRefreshAgo']:.0f} с назад" if stats["lastRefreshAgo"] is not None else "ещё не было"
+    await msg.answer(
+        f"📦 Кампаний в кэше: {stats['campaigns']}\n"
+        f"Показов из кэша: {stats['hits']}, через API: {stats['misses']} (hit rate {hit_rate})\n"
+        f"Обновление: каждые {stats['refreshInterval']:.0f} с, последнее {refreshed}, "
+        f"ошибок: {stats['refreshErrors']}\n\n"
+        f"📈 Трекинг: отправлено {tracking['sent']} событий в {tracking['batches']} пачках, "
+        f"в очереди {tracking['pending']}, повторов {tracking['retries']}, потеряно {tracking['dropped']}"
+    )
+
 # === Обработчик кликов по рекламе ===
 @dp.callback_query(F.data.startswith("ad_click:"))
 async def handle_ad_click(callback):
@@ -588,8 +795,9 @@ async def handle_ad_click(callback):
         
         print(f"[DEBUG] Клик по рекламе: campaign_id={campaign_id}, user_id={user_id}")
         
-        # Трекаем клик
-        await track_ad_click(campaign_id, user_id)
+        # Трекаем клик; кампания больше не показывается этому пользователю
+        track_ad_click(campaign_id, user_id)
+        ad_cache.mark_clicked(user_id, campaign_id)
         
         # Получаем информацию о конкретной рекламе по ID
         ad = await get_advertisement_by_id(campaign_id)
@@ -612,12 +820,94 @@ async def handle_ad_click(callback):
 # === Функция для показа рекламы в поиске ===
 async def maybe_show_search_ad(chat_id: int, user_id: int):
     """Показывает рекламу в поиске каждые 5 действий."""
-    user_actions[user_id] += 1
+    actions = await user_actions.incr(user_id)
     
     # Показываем рекламу каждые 5 действий
-    if user_actions[user_id] % 5 == 0:
+    if actions % 5 == 0:
         await send_advertisement(chat_id, user_id)
 
+# === Рассылка рекламы ===
+async def fetch_users_page(cursor: str | None) -> tuple[List[int], str | None]:
+    """Одна страница пользователей по возрастанию telegramId и курсор следующей (None — последняя)."""
+    params = {"limit": USERS_PAGE_SIZE}
+    if cursor:
+        params["cursor"] = cursor
+    async with api.session.get(ALL_USERS_URL, params=params, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+        resp.raise_for_status()
+        data = await resp.json()
+
+    chat_ids = []
+    for user in data.get("users", []):
+        try:
+            chat_ids.append(int(user.get("telegramId")))
+        except (TypeError, ValueError):
+            continue
+    return chat_ids, data.get("nextCursor")
+
+async def iter_broadcast_users(after: str | None = None):
+    """Telegram ID пользователей с telegramId > after, постранично.
+
+    Следующая страница запрашивается, пока отдаются текущие, поэтому рассылка
+    не ждёт API между страницами, а в памяти держится не больше двух страниц.
+    """
+    page = asyncio.create_task(fetch_users_page(after))
+    try:
+        while page is not None:
+            chat_ids, next_cursor = await page
+            page = asyncio.create_task(fetch_users_page(next_cursor)) if next_cursor else None
+            for chat_id in chat_ids:
+                yield chat_id
+    finally:
+        if page is not None:
+            page.cancel()
+
+async def broadcast_recipients(cursor: str | None):
+    """Пары (chat_id, курсор) по возрастанию ID; курсор — последний пройденный ID."""
+    async for chat_id in iter_broadcast_users(cursor):
+        yield chat_id, str(chat_id)
+
+async def run_ad_broadcast(job: BroadcastJob, on_progress=None) -> BroadcastStats:
+    """Рассылает рекламу по заданию пулом воркеров в пределах лимитов Telegram."""
+    limiter = RateLimiter(rate=BROADCAST_RATE)
+    broadcaster = Broadcaster(
+        lambda chat_id: send_advertisement(chat_id, chat_id, limiter=limiter),
+        limiter=limiter,
+        workers=BROADCAST_WORKERS,
+    )
+    async with broadcast_lock:
+        stats = await broadcaster.run(
+            job.recipients(broadcast_recipients(job.cursor)),
+            on_progress=on_progress,
+            on_result=job.record,
+        )
+        job.finish()
+    return stats
+
+async def start_ad_broadcast(kind: str, on_progress=None) -> BroadcastStats:
+    job = BroadcastJob(broadcast_jobs, broadcast_jobs.create(kind))
+    print(f"Рассылка {job.id} запущена")
+    return await run_ad_broadcast(job, on_progress)
+
+async def resume_broadcasts():
+    """Продолжает рассылки, прерванные перезапуском бота, с места остановки."""
+    for status in broadcast_jobs.unfinished():
+        print(f"Продолжаю рассылку {status['id']}: уже обработано {status['counts']}")
+        try:
+            stats = await run_ad_broadcast(BroadcastJob(broadcast_jobs, status["id"]))
+            print(f"Рассылка {status['id']} завершена. Отправлено: {stats.sent} реклам")
+        except Exception as e:
+            print(f"Ошибка возобновления рассылки {status['id']}: {e}")
+
+def format_job_status(status: dict) -> str:
+    counts = status["counts"]
+    started = datetime.fromtimestamp(status["createdAt"]).strftime("%d.%m %H:%M")
+    state = "✅ завершена" if status["status"] == "done" else "⏳ идёт"
+    return (
+        f"<code>{status['id']}</code> — {state}, начата {started}\n"
+        f"отправлено {counts['sent']}, без рекламы {counts['skipped']}, "
+        f"заблокировали {counts['blocked']}, ошибок {counts['failed']}"
+    )
+
 # === Ежедневная рассылка рекламы ===
 async def daily_ad_broadcast():
     """Ежедневная рассылка рекламы в 15:00."""
@@ -635,29 +925,10 @@ async def daily_ad_broadcast():
         
         await asyncio.sleep(wait_seconds)
         
-        # Получаем список всех пользователей
         try:
-            url = f"{API_BASE}/stats/all-users"
-            async with aiohttp.ClientSession() as sess:
-                async with sess.get(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-                    data = await resp.json()
-                    users = data.get("users", [])
-            
-            print(f"[DEBUG] Найдено пользователей для рассылки: {len(users)}")
-            
-            sent_count = 0
-            for user in users:
-                try:
-                    tg_id = int(user.get("telegramId"))
-                    if await send_advertisement(tg_id, tg_id):
-                        sent_count += 1
-                    # Небольшая задержка между отправками
-                    await asyncio.sleep(0.1)
-                except Exception as e:
-                    print(f"Ошибка отправки рекламы пользователю {user.get('telegramId')}: {e}")
-                    continue
-            
-            print(f"Ежедневная рассылка завершена. Отправлено: {sent_count} реклам")
+            # Ход рассылки виден в /broadcasts, в лог — только итог
+            stats = await start_ad_broadcast("daily")
+            print(f"Ежедневная рассылка завершена: {stats.as_dict()}")
             
         except Exception as e:
             print(f"Ошибка ежедневной рассылки: {e}")
@@ -665,14 +936,52 @@ async def daily_ad_broadcast():
         # Ждем 24 часа до следующей рассылки
         await asyncio.sleep(86400)
 
+def register_gauges() -> None:
+    metrics.gauge("bot_upload_states", "Users with an unfinished photo upload.", user_states.size)
+    metrics.gauge("bot_action_counters", "Users with a search action counter.", user_actions.size)
+    metrics.gauge("bot_pending_albums", "Photo albums still being collected.", media_albums.pending)
+    metrics.gauge("bot_tracking_pending", "Ad tracking events waiting to be sent.", lambda: ad_tracking.stats()["pending"])
+    metrics.gauge("bot_tracking_dropped_total", "Ad tracking events dropped after retries.", lambda: ad_tracking.stats()["dropped"], kind="counter")
+    metrics.gauge("bot_ad_campaigns", "Active ad campaigns in the local cache.", lambda: ad_cache.stats()["campaigns"])
+    metrics.gauge("bot_ad_cache_age_seconds", "Seconds since the ad cache was refreshed.", lambda: ad_cache.stats()["lastRefreshAgo"])
+    metrics.gauge("bot_api_connections_created_total", "Connections opened to the API.", lambda: api.stats()["connectionsCreated"], kind="counter")
+    metrics.gauge("bot_api_connections_reused_total", "Requests served over a kept-alive API connection.", lambda: api.stats()["connectionsReused"], kind="counter")
+
 # === Main ===
 async def main():
-    print("🤖 Reflex Bot starting...")
+    print(f"🤖 Reflex Bot starting ({BOT_MODE})...")
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+        raise SystemExit("WEBHOOK_SECRET обязателен в режиме webhook")
+    await api.start()
+    register_gauges()
+    metrics_runner = await start_metrics_server(metrics, METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
     
-    # Запускаем планировщик ежедневной рассылки рекламы
+    ad_tracking.start()
+    asyncio.create_task(sweep_forever([user_states, user_actions]))
+    asyncio.create_task(ad_cache.run())
+    # Досылаем прерванные рассылки и запускаем планировщик ежедневной
+    asyncio.create_task(resume_broadcasts())
     asyncio.create_task(daily_ad_broadcast())
     
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(
+                dp, bot,
+                host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET, public_url=WEBHOOK_URL,
+            )
+        else:
+            await dp.start_polling(bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await media_albums.close()
+        await user_states.close()
+        await user_actions.close()
+        await ad_tracking.close()
+        await api.close()
+        broadcast_jobs.close()
+        media_cache.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,221 @@
+# Массовые рассылки: пул воркеров, лимиты Telegram и обработка flood-wait
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import AsyncIterable, Awaitable, Callable, Iterable
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+# Лимиты Bot API: ~30 сообщений в секунду суммарно и ~1 сообщение в секунду в один чат
+GLOBAL_RATE = 25.0
+PER_CHAT_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity про запас."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def take(self) -> float:
+        """Забирает токен; возвращает 0 или сколько секунд подождать до следующей попытки."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Общий лимит на бота плюс минимальный интервал между сообщениями в один чат.
+
+    pause() останавливает все отправки, когда Telegram ответил RetryAfter:
+    flood control действует на бота целиком, а не на одного воркера.
+    """
+
+    def __init__(self, rate: float = GLOBAL_RATE, per_chat_interval: float = PER_CHAT_INTERVAL):
+        self.bucket = TokenBucket(rate, capacity=max(1.0, rate))
+        self.per_chat_interval = per_chat_interval
+        self._last_sent: dict[int, float] = {}
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, chat_id: int) -> None:
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if wait <= 0:
+                    wait = self._last_sent.get(chat_id, 0.0) + self.per_chat_interval - now
+                if wait <= 0:
+                    wait = self.bucket.take()
+                if wait <= 0:
+                    self._last_sent[chat_id] = now
+                    self._prune(now)
+                    return
+            await asyncio.sleep(wait)
+
+    def _prune(self, now: float) -> None:
+        # Чаты, в которые давно не писали, больше не ограничены — не держим их в памяти
+        if len(self._last_sent) > 10_000:
+            deadline = now - self.per_chat_interval
+            self._last_sent = {chat: at for chat, at in self._last_sent.items() if at > deadline}
+
+
+class BroadcastStats:
+    __slots__ = ("queued", "sent", "skipped", "blocked", "failed", "retried", "started_at", "finished_at")
+
+    def __init__(self):
+        self.queued = 0
+        self.sent = 0
+        self.skipped = 0
+        self.blocked = 0
+        self.failed = 0
+        self.retried = 0
+        self.started_at = time.monotonic()
+        self.finished_at: float | None = None
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.skipped + self.blocked + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def rate(self) -> float:
+        """Обработанных получателей в секунду."""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "queued": self.queued,
+            "done": self.done,
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "blocked": self.blocked,
+            "failed": self.failed,
+            "retried": self.retried,
+            "elapsed": round(self.elapsed, 1),
+            "rate": round(self.rate, 1),
+        }
+
+    def as_text(self) -> str:
+        return (
+            f"Обработано: {self.done}/{self.queued}\n"
+            f"Отправлено: {self.sent}, без рекламы: {self.skipped}, "
+            f"заблокировали бота: {self.blocked}, ошибок: {self.failed}\n"
+            f"Повторов после flood-wait: {self.retried}\n"
+            f"Скорость: {self.rate:.1f}/с, прошло {self.elapsed:.0f} с"
+        )
+
+
+class Broadcaster:
+    """Рассылка по списку чатов пулом из workers корутин.
+
+    send(chat_id) возвращает True, если сообщение ушло, и False, если отправлять
+    нечего. Сама отправка в Telegram должна ждать limiter.acquire(chat_id) —
+    так лимит не тратится на чаты, для которых нечего отправить.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[int], Awaitable[bool]],
+        limiter: RateLimiter | None = None,
+        workers: int = 20,
+        max_retries: int = 3,
+        progress_interval: float = 5.0,
+    ):
+        self.send = send
+        self.limiter = limiter or RateLimiter()
+        self.workers = workers
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+
+    async def run(
+        self,
+        chat_ids: Iterable[int] | AsyncIterable[int],
+        on_progress: Callable[[BroadcastStats], Awaitable[None]] | None = None,
+        on_result: Callable[[int, str], None] | None = None,
+    ) -> BroadcastStats:
+        """Рассылает по chat_ids; on_result(chat_id, исход) вызывается для каждого чата после отправки."""
+        stats = BroadcastStats()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 4)
+
+        workers = [asyncio.create_task(self._worker(queue, stats, on_result)) for _ in range(self.workers)]
+        reporter = asyncio.create_task(self._report(stats, on_progress)) if on_progress else None
+        try:
+            if isinstance(chat_ids, AsyncIterable):
+                async for chat_id in chat_ids:
+                    await queue.put(chat_id)
+                    stats.queued += 1
+            else:
+                for chat_id in chat_ids:
+                    await queue.put(chat_id)
+                    stats.queued += 1
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            if reporter:
+                reporter.cancel()
+            await asyncio.gather(*workers, *([reporter] if reporter else []), return_exceptions=True)
+            stats.finished_at = time.monotonic()
+
+        if on_progress:
+            await self._notify(stats, on_progress)
+        return stats
+
+    async def _worker(self, queue: asyncio.Queue, stats: BroadcastStats, on_result) -> None:
+        while True:
+            chat_id = await queue.get()
+            try:
+                outcome = await self._deliver(chat_id, stats)
+                setattr(stats, outcome, getattr(stats, outcome) + 1)
+                if on_result:
+                    on_result(chat_id, outcome)
+            except Exception as e:
+                print(f"Ошибка учёта рассылки в чат {chat_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def _deliver(self, chat_id: int, stats: BroadcastStats) -> str:
+        """Отправляет в один чат с повторами; возвращает исход: sent, skipped, blocked или failed."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return "sent" if await self.send(chat_id) else "skipped"
+            except TelegramRetryAfter as e:
+                self.limiter.pause(e.retry_after)
+                if attempt == self.max_retries:
+                    break
+                stats.retried += 1
+            except TelegramForbiddenError:
+                return "blocked"
+            except Exception as e:
+                print(f"Ошибка рассылки в чат {chat_id}: {e}")
+                break
+        return "failed"
+
+    async def _report(self, stats: BroadcastStats, on_progress) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            await self._notify(stats, on_progress)
+
+    @staticmethod
+    async def _notify(stats: BroadcastStats, on_progress) -> None:
+        try:
+            await on_progress(stats)
+        except Exception as e:
+            print(f"Ошибка отчёта о рассылке: {e}")
@@ -0,0 +1,188 @@
+# Персистентные задания рассылки: переживают перезапуск бота и не шлют повторно
+from __future__ import annotations
+
+import sqlite3
+import time
+import uuid
+from typing import AsyncIterable, AsyncIterator
+
+# Исходы, после которых чат повторно не получает рассылку этого задания; failed пробуем снова при возобновлении
+FINAL_OUTCOMES = ("sent", "skipped", "blocked")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    cursor TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    job_id TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, chat_id)
+);
+"""
+
+
+class JobStore:
+    """SQLite-хранилище заданий рассылки.
+
+    jobs — задание: вид (daily/manual), статус (running/done), курсор источника
+    получателей. deliveries — исход по каждому чату. Каждый исход коммитится
+    сразу после отправки, поэтому после падения повторно может уйти максимум
+    сообщение, отправленное в момент падения.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def create(self, kind: str) -> str:
+        job_id = f"{kind}-{time.strftime('%Y%m%d-%H%M')}-{uuid.uuid4().hex[:6]}"
+        now = time.time()
+        self._db.execute(
+            "INSERT INTO jobs (id, kind, status, cursor, created_at, updated_at) VALUES (?, ?, 'running', NULL, ?, ?)",
+            (job_id, kind, now, now),
+        )
+        return job_id
+
+    def unfinished(self) -> list[dict]:
+        rows = self._db.execute("SELECT id FROM jobs WHERE status = 'running' ORDER BY created_at").fetchall()
+        return [self.status(job_id) for job_id, in rows]
+
+    def finish(self, job_id: str) -> None:
+        self._db.execute("UPDATE jobs SET status = 'done', updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def record(self, job_id: str, chat_id: int, outcome: str, cursor: str | None = None) -> None:
+        now = time.time()
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT OR REPLACE INTO deliveries (job_id, chat_id, outcome, updated_at) VALUES (?, ?, ?, ?)",
+                (job_id, chat_id, outcome, now),
+            )
+            if cursor is not None:
+                self._db.execute("UPDATE jobs SET cursor = ?, updated_at = ? WHERE id = ?", (cursor, now, job_id))
+            else:
+                self._db.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+
+    def delivered_chats(self, job_id: str, after: int | None = None) -> set[int]:
+        """Чаты с окончательным исходом и ID больше after: до курсора всё и так пройдено."""
+        placeholders = ", ".join("?" * len(FINAL_OUTCOMES))
+        rows = self._db.execute(
+            f"SELECT chat_id FROM deliveries WHERE job_id = ? AND chat_id > ? AND outcome IN ({placeholders})",
+            (job_id, after if after is not None else -(2 ** 63), *FINAL_OUTCOMES),
+        )
+        return {chat_id for chat_id, in rows}
+
+    def failed_chats(self, job_id: str, up_to: int) -> list[int]:
+        """Чаты до курсора включительно, отправка в которые не удалась: источник их больше не выдаст."""
+        rows = self._db.execute(
+            "SELECT chat_id FROM deliveries WHERE job_id = ? AND chat_id <= ? AND outcome = 'failed' ORDER BY chat_id",
+            (job_id, up_to),
+        )
+        return [chat_id for chat_id, in rows]
+
+    def status(self, job_id: str) -> dict | None:
+        row = self._db.execute(
+            "SELECT id, kind, status, cursor, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        counts = dict(self._db.execute(
+            "SELECT outcome, COUNT(*) FROM deliveries WHERE job_id = ? GROUP BY outcome", (job_id,)
+        ).fetchall())
+        return {
+            "id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "cursor": row[3],
+            "createdAt": row[4],
+            "updatedAt": row[5],
+            "counts": {outcome: counts.get(outcome, 0) for outcome in (*FINAL_OUTCOMES, "failed")},
+        }
+
+    def recent(self, limit: int = 5) -> list[dict]:
+        rows = self._db.execute("SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self.status(job_id) for job_id, in rows]
+
+
+class BroadcastJob:
+    """Одно задание рассылки поверх JobStore.
+
+    recipients() пропускает уже обработанные чаты и отдаёт остальные в
+    Broadcaster, record() сохраняет исход. Источник выдаёт пары (chat_id, cursor)
+    по возрастанию chat_id, где cursor — ID чата строкой: с него можно продолжить
+    перебор после этого чата (или None). В задании сохраняется курсор последнего
+    чата, до которого включительно обработано всё: воркеры завершают отправки
+    не по порядку.
+
+    Курсор сдвигается и за неудачными отправками, поэтому при возобновлении
+    failed-чаты до курсора отдаются заново перед продолжением перебора. Из
+    истории загружаются только чаты после курсора — память не растёт с числом
+    уже обработанных получателей.
+    """
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.id = job_id
+        self.cursor = (store.status(job_id) or {}).get("cursor")
+        after = int(self.cursor) if self.cursor is not None else None
+        self._done_chats = store.delivered_chats(job_id, after)
+        self._retry_chats = store.failed_chats(job_id, after) if after is not None else []
+        self._retrying: set[int] = set()
+        self._pending: dict[int, int] = {}
+        self._cursors: dict[int, str] = {}
+        self._completed: set[int] = set()
+        self._next_seq = 0
+        self._watermark = 0
+
+    async def recipients(self, source: AsyncIterable[tuple[int, str | None]]) -> AsyncIterator[int]:
+        # Повторы неудачных отправок не участвуют в курсоре: он уже за ними
+        for chat_id in self._retry_chats:
+            self._retrying.add(chat_id)
+            yield chat_id
+        self._retry_chats = []
+
+        async for chat_id, cursor in source:
+            seq = self._next_seq
+            self._next_seq += 1
+            if cursor is not None:
+                self._cursors[seq] = cursor
+            if chat_id in self._done_chats or chat_id in self._pending:
+                # Источник идёт по возрастанию ID, так что этот чат больше не встретится
+                self._done_chats.discard(chat_id)
+                self._advance(seq)
+                continue
+            self._pending[chat_id] = seq
+            yield chat_id
+
+    def record(self, chat_id: int, outcome: str) -> None:
+        if chat_id in self._retrying:
+            self._retrying.discard(chat_id)
+            self.store.record(self.id, chat_id, outcome)
+            return
+        self.store.record(self.id, chat_id, outcome, self._advance(self._pending.pop(chat_id)))
+
+    def finish(self) -> None:
+        self.store.finish(self.id)
+
+    def _advance(self, seq: int) -> str | None:
+        """Отмечает seq обработанным; возвращает новый курсор, если граница сдвинулась."""
+        self._completed.add(seq)
+        cursor = None
+        while self._watermark in self._completed:
+            self._completed.remove(self._watermark)
+            cursor = self._cursors.pop(self._watermark, cursor)
+            self._watermark += 1
+        return cursor
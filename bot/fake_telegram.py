@@ -0,0 +1,102 @@
+"""
+Фейковый клиент Telegram для локальной проверки режима webhook: собирает апдейты
+в формате Bot API и отправляет их POST-запросами с секретным заголовком, как это делает Telegram.
+
+    BOT_MODE=webhook WEBHOOK_SECRET=dev python bot.py
+    python fake_telegram.py --url http://127.0.0.1:8080/telegram/webhook --secret dev --text /start --count 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import time
+
+import aiohttp
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": "ru"}
+
+
+def message_update(user_id: int, text: str | None = None, photo_file_id: str | None = None,
+                   media_group_id: str | None = None) -> dict:
+    """Апдейт с личным сообщением: текст или фото (фото можно сгруппировать в альбом)."""
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+        "from": _user(user_id),
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if photo_file_id is not None:
+        message["photo"] = [{"file_id": photo_file_id, "file_unique_id": photo_file_id[-16:],
+                             "width": 1280, "height": 1280}]
+    if media_group_id is not None:
+        message["media_group_id"] = media_group_id
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def callback_update(user_id: int, data: str) -> dict:
+    """Апдейт с нажатием inline-кнопки (например, ad_click:<campaignId>)."""
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": next(_message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+                "text": "ad",
+            },
+        },
+    }
+
+
+async def post_updates(url: str, secret: str | None, updates: list[dict], concurrency: int = 10) -> list[tuple[int, float]]:
+    """Отправляет апдейты на webhook; возвращает (HTTP-статус, время ответа в секундах) для каждого."""
+    headers = {SECRET_HEADER: secret} if secret else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession() as session:
+        async def post(update: dict) -> tuple[int, float]:
+            async with semaphore:
+                start = time.perf_counter()
+                async with session.post(url, json=update, headers=headers) as resp:
+                    await resp.read()
+                    return resp.status, time.perf_counter() - start
+        return await asyncio.gather(*(post(update) for update in updates))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отправить фейковые апдейты на webhook бота")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/telegram/webhook")
+    parser.add_argument("--secret")
+    parser.add_argument("--text", default="/start")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--user-id", type=int, default=100000, help="первый Telegram ID; у каждого апдейта свой")
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    updates = [message_update(args.user_id + i, text=args.text) for i in range(args.count)]
+    results = asyncio.run(post_updates(args.url, args.secret, updates, args.concurrency))
+
+    statuses: dict[int, int] = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    slowest = max(seconds for _, seconds in results) * 1000
+    print(f"Отправлено {len(results)} апдейтов, статусы: {statuses}, самый долгий ответ {slowest:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
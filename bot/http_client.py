@@ -0,0 +1,112 @@
+# Общий HTTP-клиент бота к Reflex API
+from __future__ import annotations
+
+import time
+
+import aiohttp
+
+from metrics import Metrics, endpoint_label
+
+
+class ApiClient:
+    """Одна aiohttp-сессия на всё время работы бота.
+
+    TCPConnector держит keep-alive соединения к API_BASE и кэширует DNS,
+    поэтому запросы хелперов не делают новый TCP+TLS handshake.
+    Счётчики соединений и, если передан metrics, задержки по эндпоинтам
+    собираются через aiohttp TraceConfig.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 50,
+        keepalive_timeout: float = 60,
+        dns_cache_ttl: int = 300,
+        timeout: float = 10,
+        metrics: Metrics | None = None,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = timeout
+        self.metrics = metrics
+        self._session: aiohttp.ClientSession | None = None
+
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    async def start(self) -> None:
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._on_request_start)
+        trace.on_request_end.append(self._on_request_end)
+        trace.on_request_exception.append(self._on_request_exception)
+        trace.on_connection_create_end.append(self._on_connection_created)
+        trace.on_connection_reuseconn.append(self._on_connection_reused)
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            trace_configs=[trace],
+        )
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Сессия для запросов; создаётся при первом обращении, если start() ещё не вызывали."""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "connectionsCreated": self.connections_created,
+            "connectionsReused": self.connections_reused,
+        }
+
+    async def _on_request_start(self, session, ctx, params) -> None:
+        self.requests += 1
+        if self.metrics is not None:
+            ctx.series = self.metrics.upstream("api", endpoint_label(params.method, params.url.path))
+            ctx.series.in_flight += 1
+            ctx.started_at = time.perf_counter()
+
+    async def _on_request_end(self, session, ctx, params) -> None:
+        self._finish_request(ctx, failed=params.response.status >= 500)
+
+    async def _on_request_exception(self, session, ctx, params) -> None:
+        self._finish_request(ctx, failed=True)
+
+    @staticmethod
+    def _finish_request(ctx, failed: bool) -> None:
+        series = getattr(ctx, "series", None)
+        if series is None:
+            return
+        series.in_flight -= 1
+        series.latency.observe(time.perf_counter() - ctx.started_at)
+        if failed:
+            series.errors += 1
+
+    async def _on_connection_created(self, session, ctx, params) -> None:
+        self.connections_created += 1
+
+    async def _on_connection_reused(self, session, ctx, params) -> None:
+        self.connections_reused += 1
@@ -0,0 +1,408 @@
+"""
+Нагрузочный прогон бота без продакшена: поднимает фейковый Telegram Bot API и заглушку
+Reflex API на localhost, направляет на них bot.py и прогоняет синтетический поток апдейтов
+(/start, альбомы фото, клики по рекламе) и/или рассылку рекламы. В конце печатает
+пропускную способность и перцентили времени обработки.
+
+    python loadtest.py --updates 2000 --concurrency 100 --mix start=1,album=2,click=5
+    python loadtest.py --updates 0 --broadcast-users 5000 --broadcast-rate 1000 --tg-latency 30
+    python loadtest.py --updates 1000 --api-latency 80 --api-error-rate 0.05 --tg-flood-rate 0.01
+
+Задержки задаются в миллисекундах, доли ошибок — от 0 до 1.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+from aiohttp import web
+
+import fake_telegram
+
+BOT_TOKEN = "123456:LOADTEST"
+INTRO_FILE_ID = "AgACAgIAAxkBAAIBloadtest"
+
+
+class Latency:
+    """Сырые замеры в секундах; перцентили считаются в конце прогона."""
+
+    def __init__(self):
+        self.samples: list[float] = []
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    def summary(self) -> str:
+        if not self.samples:
+            return "нет замеров"
+        ms = lambda seconds: f"{seconds * 1000:.1f}"
+        return (
+            f"p50 {ms(self.percentile(0.5))} мс, p90 {ms(self.percentile(0.9))} мс, "
+            f"p99 {ms(self.percentile(0.99))} мс, max {ms(max(self.samples))} мс"
+        )
+
+
+async def inject_latency(latency_ms: float) -> None:
+    # Экспоненциальное распределение: в среднем latency_ms, с редкими длинными хвостами
+    if latency_ms:
+        await asyncio.sleep(random.expovariate(1 / latency_ms) / 1000)
+
+
+def faults_middleware(latency_ms: float, error_rate: float, calls: Counter):
+    """Задержка и случайные 500 для каждого запроса к заглушке; считает вызовы по маршрутам."""
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        calls[f"{request.method} {route}"] += 1
+        await inject_latency(latency_ms)
+        if error_rate and random.random() < error_rate:
+            return web.json_response({"error": "injected"}, status=500)
+        return await handler(request)
+    return middleware
+
+
+class FakeTelegram:
+    """Заглушка Bot API: POST /bot<token>/<method> с ответами в формате Telegram.
+
+    error_rate — доля ответов 500, flood_rate — доля ответов 429 с retry_after,
+    blocked_rate — доля чатов, «заблокировавших бота» (403 на любую отправку в этот чат).
+    """
+
+    def __init__(self, latency_ms: float = 0, error_rate: float = 0, flood_rate: float = 0, blocked_rate: float = 0):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.flood_rate = flood_rate
+        self.blocked_rate = blocked_rate
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        data = await request.post()
+        chat_id = int(data.get("chat_id") or 0)
+
+        await inject_latency(self.latency_ms)
+        if self.error_rate and random.random() < self.error_rate:
+            return _error(500, "Internal Server Error")
+        if self.flood_rate and random.random() < self.flood_rate:
+            return _error(429, "Too Many Requests: retry after 1", parameters={"retry_after": 1})
+        if chat_id and self.blocked_rate and (chat_id * 2654435761) % 1000 < self.blocked_rate * 1000:
+            return _error(403, "Forbidden: bot was blocked by the user")
+
+        if method in ("sendMessage", "editMessageText"):
+            return _ok(self._message(chat_id, text=data.get("text", "")))
+        if method == "sendPhoto":
+            return _ok(self._message(chat_id, photo=True))
+        if method == "sendMediaGroup":
+            count = max(1, str(data.get("media", "")).count('"type"'))
+            return _ok([self._message(chat_id, photo=True) for _ in range(count)])
+        if method == "getFile":
+            file_id = data.get("file_id", "")
+            return _ok({"file_id": file_id, "file_unique_id": file_id[-16:], "file_path": f"photos/{file_id}.jpg"})
+        if method == "getMe":
+            return _ok({"id": int(BOT_TOKEN.split(":")[0]), "is_bot": True, "first_name": "Reflex", "username": "reflex_load_bot"})
+        return _ok(True)
+
+    def _message(self, chat_id: int, text: str | None = None, photo: bool = False) -> dict:
+        message_id = next(self._message_ids)
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if text is not None:
+            message["text"] = text
+        if photo:
+            file_id = f"{INTRO_FILE_ID}{message_id}"
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id[-16:], "width": 1280, "height": 1280}]
+        return message
+
+
+def _ok(result) -> web.Response:
+    return web.json_response({"ok": True, "result": result})
+
+
+def _error(code: int, description: str, **extra) -> web.Response:
+    return web.json_response({"ok": False, "error_code": code, "description": description, **extra}, status=code)
+
+
+class FakeReflexApi:
+    """Заглушка эндпоинтов Reflex API, которые вызывает бот."""
+
+    def __init__(self, users: int, campaigns: int = 5, latency_ms: float = 0, error_rate: float = 0):
+        # Сколько пользователей отдаёт /stats/all-users, то есть получателей рассылки;
+        # профили по telegramId отвечают для любого ID
+        self.users = users
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.calls: Counter = Counter()
+        self.campaigns = [
+            {
+                "id": f"c{i:024d}",
+                "title": f"Кампания {i}",
+                "description": "Нагрузочный тест",
+                "imageUrl": f"https://example.com/ads/{i}.jpg" if i % 2 == 0 else None,
+                "buttonText": "Узнать больше",
+                "buttonUrl": f"https://example.com/{i}",
+                "weight": i + 1,
+                "startDate": None,
+                "endDate": None,
+            }
+            for i in range(campaigns)
+        ]
+        self.tracked = 0
+        self.track_batches: set[str] = set()
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[faults_middleware(self.latency_ms, self.error_rate, self.calls)])
+        app.router.add_get("/profile/by-telegram/{telegram_id}", self.profile)
+        app.router.add_post("/profile/add-media", self.add_media)
+        app.router.add_get("/advertising/serve", self.serve)
+        app.router.add_get("/advertising/serve/campaigns", self.serve_campaigns)
+        app.router.add_get("/advertising/campaign/{campaign_id}/ad", self.campaign_ad)
+        app.router.add_post("/advertising/track/batch", self.track_batch)
+        app.router.add_get("/advertising/admin/campaigns", self.admin_campaigns)
+        app.router.add_post("/advertising/admin/campaigns/{campaign_id}/moderate", self.moderate)
+        app.router.add_get("/stats/all-users", self.all_users)
+        return app
+
+    async def profile(self, request: web.Request) -> web.Response:
+        telegram_id = int(request.match_info["telegram_id"])
+        # Каждый третий пользователь ещё не прошёл регистрацию
+        if telegram_id % 3 == 0:
+            return web.json_response({"exists": False})
+        images = [f"https://example.com/u/{telegram_id}/{i}.jpg" for i in range(telegram_id % 3)]
+        return web.json_response({"exists": True, "profile": {"telegramId": str(telegram_id), "images": images}})
+
+    async def add_media(self, request: web.Request) -> web.Response:
+        await request.json()
+        return web.json_response({"success": True})
+
+    async def serve(self, request: web.Request) -> web.Response:
+        return web.json_response({"ad": random.choice(self.campaigns) if self.campaigns else None})
+
+    async def serve_campaigns(self, request: web.Request) -> web.Response:
+        return web.json_response({"campaigns": self.campaigns})
+
+    async def campaign_ad(self, request: web.Request) -> web.Response:
+        ad = next((c for c in self.campaigns if c["id"] == request.match_info["campaign_id"]), None)
+        return web.json_response({"ad": ad})
+
+    async def track_batch(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        events = body.get("events", [])
+        # Как и API, повтор пачки с тем же batchId не учитывается
+        duplicate = body.get("batchId") in self.track_batches
+        if not duplicate:
+            self.track_batches.add(body.get("batchId"))
+            self.tracked += len(events)
+        return web.json_response({"accepted": len(events), "duplicate": duplicate})
+
+    async def admin_campaigns(self, request: web.Request) -> web.Response:
+        brief = [{"id": c["id"], "title": c["title"], "status": "pending", "statusChangedAt": None} for c in self.campaigns]
+        return web.json_response({"campaigns": brief, "total": len(brief), "serverTime": "2100-01-01T00:00:00.000Z"})
+
+    async def moderate(self, request: web.Request) -> web.Response:
+        return web.json_response({"message": "ok"})
+
+    async def all_users(self, request: web.Request) -> web.Response:
+        limit = min(int(request.query.get("limit") or 1000), 5000)
+        after = int(request.query.get("cursor") or 0)
+        first = max(after + 1, 1)
+        last = min(first + limit - 1, self.users)
+        users = [{"telegramId": str(telegram_id)} for telegram_id in range(first, last + 1)]
+        return web.json_response({"users": users, "nextCursor": str(last) if last < self.users else None})
+
+
+async def start_server(app: web.Application) -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"неизвестный сценарий {name!r}, доступны: {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def start_updates(user_id: int, campaigns: list[dict]) -> list[dict]:
+    return [fake_telegram.message_update(user_id, text="/start")]
+
+
+def album_updates(user_id: int, campaigns: list[dict]) -> list[dict]:
+    # Сначала вход в режим загрузки, затем альбом из 2–4 фото
+    updates = [fake_telegram.message_update(user_id, text="/start upload")]
+    group_id = f"album{user_id}{random.randrange(10 ** 6)}"
+    for i in range(random.randint(2, 4)):
+        updates.append(fake_telegram.message_update(user_id, photo_file_id=f"AgACAgIAAxkBphoto{user_id}x{i}",
+                                                    media_group_id=group_id))
+    return updates
+
+
+def click_updates(user_id: int, campaigns: list[dict]) -> list[dict]:
+    campaign = random.choice(campaigns)
+    return [fake_telegram.callback_update(user_id, f"ad_click:{campaign['id']}")]
+
+
+SCENARIOS = {"start": start_updates, "album": album_updates, "click": click_updates}
+
+
+async def replay_updates(bot_module, streams: list[list[dict]], concurrency: int) -> tuple[Latency, float, int]:
+    """Прогоняет потоки апдейтов через dispatcher; апдейты одного потока идут по порядку.
+
+    Возвращает замеры на апдейт, общее время и число апдейтов, упавших с исключением.
+    """
+    from aiogram.types import Update
+
+    dp, bot = bot_module.dp, bot_module.bot
+    latency = Latency()
+    failures = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(stream: list[dict]) -> None:
+        nonlocal failures
+        async with semaphore:
+            for raw in stream:
+                update = Update.model_validate(raw, context={"bot": bot})
+                start = time.perf_counter()
+                try:
+                    await dp.feed_update(bot, update)
+                except Exception:
+                    failures += 1
+                latency.add(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(stream) for stream in streams))
+    # Альбомы дорабатываются агрегатором уже после возврата из обработчиков
+    while bot_module.media_albums.pending():
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.1)
+    return latency, time.perf_counter() - started, failures
+
+
+def print_calls(title: str, calls: Counter) -> None:
+    print(f"{title}: " + (", ".join(f"{name} {count}" for name, count in calls.most_common()) or "нет"))
+
+
+async def run(args) -> None:
+    telegram = FakeTelegram(args.tg_latency, args.tg_error_rate, args.tg_flood_rate, args.blocked_rate)
+    reflex = FakeReflexApi(args.broadcast_users, args.campaigns, args.api_latency, args.api_error_rate)
+    telegram_runner, telegram_url = await start_server(telegram.app())
+    reflex_runner, reflex_url = await start_server(reflex.app())
+
+    workdir = tempfile.mkdtemp(prefix="reflex-loadtest-")
+    os.environ.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "TELEGRAM_API_URL": telegram_url,
+        "api_url": reflex_url,
+        "BROADCAST_DB_PATH": os.path.join(workdir, "broadcast_jobs.sqlite3"),
+        "MEDIA_CACHE_PATH": os.path.join(workdir, "media_cache.sqlite3"),
+        "BROADCAST_RATE": str(args.broadcast_rate),
+        "BROADCAST_WORKERS": str(args.broadcast_workers),
+        "METRICS_PORT": "0",
+    })
+    os.environ.pop("STATE_REDIS_URL", None)
+    # bot.py читает настройки при импорте — импортируем после подготовки окружения
+    import bot as bot_module
+
+    # Бот пишет отладочный вывод на каждое действие; в отчёт он не нужен
+    bot_output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with bot_output:
+            await bot_module.api.start()
+            bot_module.ad_tracking.start()
+            await bot_module.ad_cache.refresh()
+
+            if args.updates:
+                names = list(args.mix)
+                weights = [args.mix[name] for name in names]
+                streams = []
+                for i in range(args.updates):
+                    scenario = SCENARIOS[random.choices(names, weights)[0]]
+                    streams.append(scenario(random.randint(1, args.users), reflex.campaigns))
+                updates_latency, updates_elapsed, failures = await replay_updates(bot_module, streams, args.concurrency)
+
+            if args.broadcast_users:
+                broadcast = await bot_module.start_ad_broadcast("loadtest")
+
+            await bot_module.ad_tracking.close()
+    finally:
+        await bot_module.media_albums.close()
+        await bot_module.api.close()
+        await bot_module.bot.session.close()
+        bot_module.broadcast_jobs.close()
+        bot_module.media_cache.close()
+        await telegram_runner.cleanup()
+        await reflex_runner.cleanup()
+
+    if args.updates:
+        total = len(updates_latency.samples)
+        print(f"Апдейтов: {total} в {len(streams)} потоках, параллельно {args.concurrency}, ошибок {failures}")
+        print(f"Пропускная способность: {total / updates_elapsed:.1f} апдейтов/с за {updates_elapsed:.1f} с")
+        print(f"Время обработки апдейта: {updates_latency.summary()}")
+        for event, name in sorted(bot_module.metrics.handlers):
+            series = bot_module.metrics.handlers[(event, name)]
+            mean = series.latency.total / series.latency.count * 1000 if series.latency.count else 0
+            print(f"  {event}/{name}: {series.latency.count} вызовов, в среднем {mean:.1f} мс, ошибок {series.errors}")
+    if args.broadcast_users:
+        print(f"Рассылка на {args.broadcast_users} пользователей, лимит {args.broadcast_rate}/с, "
+              f"воркеров {args.broadcast_workers}:")
+        print("  " + broadcast.as_text().replace("\n", "\n  "))
+    print_calls("Вызовы Bot API", telegram.calls)
+    print_calls("Вызовы Reflex API", reflex.calls)
+    print(f"Событий трекинга доставлено: {reflex.tracked}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота против фейковых Telegram и Reflex API")
+    parser.add_argument("--updates", type=int, default=500, help="сколько синтетических сценариев прогнать")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("start=1,album=1,click=3"),
+                        help="веса сценариев: start, album, click")
+    parser.add_argument("--concurrency", type=int, default=50, help="сколько сценариев выполняется одновременно")
+    parser.add_argument("--users", type=int, default=1000, help="сколько разных пользователей шлют апдейты")
+    parser.add_argument("--campaigns", type=int, default=5)
+    parser.add_argument("--broadcast-users", type=int, default=0, help="прогнать рассылку на столько пользователей")
+    parser.add_argument("--broadcast-rate", type=float, default=25.0)
+    parser.add_argument("--broadcast-workers", type=int, default=20)
+    parser.add_argument("--tg-latency", type=float, default=20.0, help="средняя задержка Bot API, мс")
+    parser.add_argument("--tg-error-rate", type=float, default=0.0, help="доля ответов 500 от Bot API")
+    parser.add_argument("--tg-flood-rate", type=float, default=0.0, help="доля ответов 429 с retry_after=1")
+    parser.add_argument("--blocked-rate", type=float, default=0.0, help="доля чатов, заблокировавших бота")
+    parser.add_argument("--api-latency", type=float, default=20.0, help="средняя задержка Reflex API, мс")
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="доля ответов 500 от Reflex API")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--verbose", action="store_true", help="не скрывать вывод бота")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Кэш Telegram file_id для картинок, которые бот отправляет по URL
+from __future__ import annotations
+
+import sqlite3
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputMediaPhoto, Message
+
+
+class MediaCache:
+    """Соответствие URL картинки → file_id, который Telegram вернул при первой отправке.
+
+    Повторная отправка по file_id не заставляет Telegram заново скачивать
+    картинку. Соответствия хранятся в SQLite и переживают перезапуск. Если
+    Telegram отверг file_id (другой токен бота, файл удалён), запись
+    забывается и картинка уходит по URL, а новый file_id сохраняется.
+    """
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS media (url TEXT PRIMARY KEY, file_id TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def close(self) -> None:
+        self._db.close()
+
+    def get(self, url: str) -> str | None:
+        row = self._db.execute("SELECT file_id FROM media WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def remember(self, url: str, file_id: str) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO media (url, file_id, updated_at) VALUES (?, ?, ?)", (url, file_id, time.time())
+        )
+
+    def forget(self, *urls: str) -> None:
+        self._db.executemany("DELETE FROM media WHERE url = ?", [(url,) for url in urls])
+
+    async def send_photo(self, bot: Bot, chat_id: int, url: str, **kwargs) -> Message:
+        file_id = self.get(url)
+        if file_id is not None:
+            try:
+                message = await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+                self.hits += 1
+                return message
+            except TelegramBadRequest:
+                self.rejected += 1
+                self.forget(url)
+
+        self.misses += 1
+        message = await bot.send_photo(chat_id=chat_id, photo=url, **kwargs)
+        if message.photo:
+            self.remember(url, message.photo[-1].file_id)
+        return message
+
+    async def send_media_group(self, bot: Bot, chat_id: int, urls: list[str]) -> list[Message]:
+        file_ids = [self.get(url) for url in urls]
+        cached = [url for url, file_id in zip(urls, file_ids) if file_id is not None]
+        if cached:
+            try:
+                media = [InputMediaPhoto(media=file_id or url) for url, file_id in zip(urls, file_ids)]
+                messages = await bot.send_media_group(chat_id=chat_id, media=media)
+                self.hits += len(cached)
+                self.misses += len(urls) - len(cached)
+                self._remember_group(urls, messages, known=file_ids)
+                return messages
+            except TelegramBadRequest:
+                # По ошибке альбома не понять, какой file_id отвергнут, поэтому забываем все
+                self.rejected += len(cached)
+                self.forget(*cached)
+
+        self.misses += len(urls)
+        messages = await bot.send_media_group(chat_id=chat_id, media=[InputMediaPhoto(media=url) for url in urls])
+        self._remember_group(urls, messages)
+        return messages
+
+    def stats(self) -> dict:
+        (entries,) = self._db.execute("SELECT COUNT(*) FROM media").fetchone()
+        return {"entries": entries, "hits": self.hits, "misses": self.misses, "rejected": self.rejected}
+
+    def _remember_group(self, urls: list[str], messages: list[Message], known: list[str | None] | None = None) -> None:
+        # Сообщения альбома приходят в том же порядке, что и media
+        known = known or [None] * len(urls)
+        for url, message, file_id in zip(urls, messages, known):
+            if file_id is None and message.photo:
+                self.remember(url, message.photo[-1].file_id)
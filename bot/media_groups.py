@@ -0,0 +1,87 @@
+# Сборка альбомов: Telegram присылает каждое фото альбома отдельным апдейтом
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from aiogram.types import Message
+
+# Больше 10 фото в альбоме Telegram не бывает
+MAX_GROUP_SIZE = 10
+
+
+class _Group:
+    __slots__ = ("messages", "started_at", "deadline", "complete")
+
+    def __init__(self, now: float):
+        self.messages: list[Message] = []
+        self.started_at = now
+        self.deadline = now
+        self.complete = asyncio.Event()
+
+
+class MediaGroupAggregator:
+    """Собирает сообщения с одним media_group_id и обрабатывает альбом один раз.
+
+    На группу заводится одна таймер-задача: она ждёт idle секунд тишины после
+    последнего фото (каждое новое фото сдвигает срок) или полного альбома из
+    10 фото и вызывает process со всеми сообщениями. Обработчики апдейтов не
+    спят и сразу освобождаются. Группа, которая всё ещё дополняется через
+    max_age секунд, обрабатывается тем, что успело прийти, и удаляется.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[list[Message]], Awaitable[None]],
+        idle: float = 0.6,
+        max_age: float = 10.0,
+    ):
+        self.process = process
+        self.idle = idle
+        self.max_age = max_age
+        self._groups: dict[str, _Group] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, msg: Message) -> None:
+        now = time.monotonic()
+        group = self._groups.get(msg.media_group_id)
+        if group is None:
+            group = self._groups[msg.media_group_id] = _Group(now)
+            task = asyncio.create_task(self._flush_when_ready(msg.media_group_id, group))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        group.messages.append(msg)
+        group.deadline = now + self.idle
+        if len(group.messages) >= MAX_GROUP_SIZE:
+            group.complete.set()
+
+    def pending(self) -> int:
+        return len(self._groups)
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._groups.clear()
+
+    async def _flush_when_ready(self, group_id: str, group: _Group) -> None:
+        try:
+            while not group.complete.is_set():
+                wait = min(group.deadline, group.started_at + self.max_age) - time.monotonic()
+                if wait <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(group.complete.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._groups.pop(group_id, None)
+
+        # Апдейты могут прийти не по порядку — восстанавливаем порядок альбома
+        messages = sorted(group.messages, key=lambda m: m.message_id)
+        try:
+            await self.process(messages)
+        except Exception as e:
+            print(f"Ошибка обработки альбома {group_id}: {e}")
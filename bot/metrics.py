@@ -0,0 +1,192 @@
+# Метрики бота в текстовом формате Prometheus: обработчики апдейтов и внешние вызовы
+from __future__ import annotations
+
+import re
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+
+# Границы бакетов гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Сегменты пути, похожие на ID (числа, cuid), схлопываются, чтобы не плодить серии метрик
+_ID_SEGMENT = re.compile(r"^(\d+|c[a-z0-9]{20,}|[0-9a-f-]{32,36})$")
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class _Series:
+    """Гистограмма задержки, число выполняющихся вызовов и ошибок для одного набора меток."""
+
+    __slots__ = ("latency", "in_flight", "errors")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.in_flight = 0
+        self.errors = 0
+
+
+class Metrics:
+    """Реестр метрик процесса.
+
+    Ключи серий — кортежи меток; обновление — несколько операций над int/float
+    без блокировок (всё в одном event loop), поэтому метрики можно держать
+    включёнными в проде.
+    """
+
+    def __init__(self):
+        self.handlers: dict[tuple[str, str], _Series] = {}
+        self.upstreams: dict[tuple[str, str], _Series] = {}
+        self.gauges: dict[str, tuple[str, str, Callable[[], float | None]]] = {}
+        self.started_at = time.time()
+
+    def handler(self, event: str, name: str) -> _Series:
+        series = self.handlers.get((event, name))
+        if series is None:
+            series = self.handlers[(event, name)] = _Series()
+        return series
+
+    def upstream(self, upstream: str, endpoint: str) -> _Series:
+        series = self.upstreams.get((upstream, endpoint))
+        if series is None:
+            series = self.upstreams[(upstream, endpoint)] = _Series()
+        return series
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float | None], kind: str = "gauge") -> None:
+        """Метрика, значение которой читается при каждом запросе /metrics (kind="counter" для счётчиков)."""
+        self.gauges[name] = (help_text, kind, read)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP bot_start_time_seconds Unix time when the bot process started.",
+            "# TYPE bot_start_time_seconds gauge",
+            f"bot_start_time_seconds {self.started_at}",
+        ]
+        lines += _render_series(
+            "bot_handler", "update handler", ("event", "handler"), self.handlers
+        )
+        lines += _render_series(
+            "bot_upstream", "outbound call", ("upstream", "endpoint"), self.upstreams
+        )
+        for name, (help_text, kind, read) in self.gauges.items():
+            try:
+                value = read()
+            except Exception:
+                value = None
+            if value is None:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _render_series(prefix: str, what: str, label_names: tuple[str, ...], series: dict) -> list[str]:
+    lines = [
+        f"# HELP {prefix}_duration_seconds Latency of each {what}.",
+        f"# TYPE {prefix}_duration_seconds histogram",
+    ]
+    for key, s in series.items():
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, s.latency.counts):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f"{prefix}_duration_seconds_bucket{_labels(label_names, key, le)} {cumulative}")
+        le = 'le="+Inf"'
+        lines.append(f"{prefix}_duration_seconds_bucket{_labels(label_names, key, le)} {s.latency.count}")
+        lines.append(f"{prefix}_duration_seconds_sum{_labels(label_names, key)} {s.latency.total}")
+        lines.append(f"{prefix}_duration_seconds_count{_labels(label_names, key)} {s.latency.count}")
+
+    lines += [f"# HELP {prefix}_in_flight Number of {what}s in progress.", f"# TYPE {prefix}_in_flight gauge"]
+    lines += [f"{prefix}_in_flight{_labels(label_names, key)} {s.in_flight}" for key, s in series.items()]
+    lines += [f"# HELP {prefix}_errors_total Number of failed {what}s.", f"# TYPE {prefix}_errors_total counter"]
+    lines += [f"{prefix}_errors_total{_labels(label_names, key)} {s.errors}" for key, s in series.items()]
+    return lines
+
+
+def endpoint_label(method: str, path: str) -> str:
+    """'GET /api/profile/by-telegram/123' → 'GET /api/profile/by-telegram/:id'."""
+    segments = [":id" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/")]
+    return f"{method} {'/'.join(segments)}"
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """aiogram inner-middleware: время, параллельность и ошибки каждого обработчика."""
+
+    def __init__(self, metrics: Metrics, event: str):
+        self.metrics = metrics
+        self.event = event
+
+    async def __call__(self, handler: Callable[..., Awaitable[Any]], event: Any, data: dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        series = self.metrics.handler(self.event, name)
+        series.in_flight += 1
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            series.errors += 1
+            raise
+        finally:
+            series.in_flight -= 1
+            series.latency.observe(time.perf_counter() - start)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время каждого вызова Bot API по имени метода."""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(self, make_request, bot, method):
+        series = self.metrics.upstream("telegram", method.__api_method__)
+        series.in_flight += 1
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            series.errors += 1
+            raise
+        finally:
+            series.in_flight -= 1
+            series.latency.observe(time.perf_counter() - start)
+
+
+async def start_metrics_server(metrics: Metrics, host: str, port: int) -> web.AppRunner:
+    """Отдельный HTTP-сервер с /metrics; по умолчанию слушает только localhost."""
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Метрики: http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,86 @@
+# Кэш профилей пользователей по Telegram ID
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+
+class ProfileCache:
+    """LRU-кэш профилей с коротким TTL и объединением одновременных запросов.
+
+    Пока идёт запрос профиля, остальные обработчики того же пользователя ждут
+    его результат, а не шлют свой (single-flight). Отсутствие профиля тоже
+    кэшируется, но на меньший срок — пользователь может как раз заводить анкету
+    в приложении. Ошибки загрузки не кэшируются. invalidate() сбрасывает запись
+    и результат уже идущего запроса, который мог прочитать старые данные.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[int], Awaitable[dict | None]],
+        ttl: float = 30.0,
+        missing_ttl: float = 5.0,
+        max_entries: int = 5000,
+    ):
+        self.load = load
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.max_entries = max_entries
+
+        self._entries: OrderedDict[int, tuple[float, dict | None]] = OrderedDict()
+        self._inflight: dict[int, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, tg_id: int) -> dict | None:
+        entry = self._entries.get(tg_id)
+        if entry is not None:
+            expires_at, profile = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(tg_id)
+                self.hits += 1
+                return profile
+            del self._entries[tg_id]
+
+        inflight = self._inflight.get(tg_id)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        task = asyncio.ensure_future(self.load(tg_id))
+        self._inflight[tg_id] = task
+        task.add_done_callback(lambda done: self._finish(tg_id, done))
+        # Отмена одного обработчика не должна отменять запрос, который ждут остальные
+        return await asyncio.shield(task)
+
+    def invalidate(self, tg_id: int) -> None:
+        self._entries.pop(tg_id, None)
+        # Запрос в полёте мог прочитать профиль до изменения: его результат не сохраняем
+        self._inflight.pop(tg_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+    def _finish(self, tg_id: int, task: asyncio.Future) -> None:
+        if self._inflight.get(tg_id) is not task:
+            return
+        del self._inflight[tg_id]
+        if not task.cancelled() and task.exception() is None:
+            self._store(tg_id, task.result())
+
+    def _store(self, tg_id: int, profile: dict | None) -> None:
+        ttl = self.ttl if profile is not None else self.missing_ttl
+        self._entries[tg_id] = (time.monotonic() + ttl, profile)
+        self._entries.move_to_end(tg_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,155 @@
+# Хранилища состояния пользователей с TTL и ограничением размера
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+class _Record:
+    __slots__ = ("value", "expires_at")
+
+    def __init__(self, value: Any, expires_at: float):
+        self.value = value
+        self.expires_at = expires_at
+
+
+class MemoryStore:
+    """Состояние в памяти процесса: LRU не больше max_entries записей.
+
+    Запись живёт ttl секунд с последнего обращения. Просроченные записи
+    удаляются при чтении и периодическим sweep(), а при переполнении
+    вытесняются давно не использованные.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._records: OrderedDict[int, _Record] = OrderedDict()
+        self.expired = 0
+        self.evicted = 0
+
+    async def get(self, key: int) -> Any:
+        record = self._touch(key)
+        return record.value if record is not None else None
+
+    async def set(self, key: int, value: Any) -> None:
+        self._records[key] = _Record(value, time.monotonic() + self.ttl)
+        self._records.move_to_end(key)
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+            self.evicted += 1
+
+    async def delete(self, key: int) -> None:
+        self._records.pop(key, None)
+
+    async def incr(self, key: int) -> int:
+        record = self._touch(key)
+        value = (record.value if record is not None else 0) + 1
+        await self.set(key, value)
+        return value
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        expired = [key for key, record in self._records.items() if record.expires_at <= now]
+        for key in expired:
+            del self._records[key]
+        self.expired += len(expired)
+        return len(expired)
+
+    def size(self) -> int | None:
+        return len(self._records)
+
+    async def close(self) -> None:
+        self._records.clear()
+
+    def _touch(self, key: int) -> _Record | None:
+        record = self._records.get(key)
+        if record is None:
+            return None
+        now = time.monotonic()
+        if record.expires_at <= now:
+            del self._records[key]
+            self.expired += 1
+            return None
+        record.expires_at = now + self.ttl
+        self._records.move_to_end(key)
+        return record
+
+
+class RedisStore:
+    """То же хранилище в Redis, чтобы состояние было общим у нескольких процессов бота.
+
+    Срок жизни ключей отсчитывает сам Redis (EXPIRE), поэтому sweep() не нужен.
+    Значения сериализуются в JSON через encode/decode.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        url: str,
+        encode: Callable[[Any], Any] = lambda value: value,
+        decode: Callable[[Any], Any] = lambda value: value,
+    ):
+        import redis.asyncio as redis
+
+        self.name = name
+        self.ttl = int(ttl)
+        self.encode = encode
+        self.decode = decode
+        self._redis = redis.from_url(url)
+        self._prefix = f"reflex-bot:{name}:"
+
+    async def get(self, key: int) -> Any:
+        raw = await self._redis.getex(self._prefix + str(key), ex=self.ttl)
+        return self.decode(json.loads(raw)) if raw is not None else None
+
+    async def set(self, key: int, value: Any) -> None:
+        await self._redis.set(self._prefix + str(key), json.dumps(self.encode(value)), ex=self.ttl)
+
+    async def delete(self, key: int) -> None:
+        await self._redis.delete(self._prefix + str(key))
+
+    async def incr(self, key: int) -> int:
+        async with self._redis.pipeline() as pipe:
+            value, _ = await pipe.incr(self._prefix + str(key)).expire(self._prefix + str(key), self.ttl).execute()
+        return value
+
+    def sweep(self) -> int:
+        return 0
+
+    def size(self) -> int | None:
+        # Считать ключи в общем Redis дорого, в метриках размер не показываем
+        return None
+
+    async def close(self) -> None:
+        await self._redis.close()
+
+
+def make_store(
+    name: str,
+    ttl: float,
+    max_entries: int,
+    redis_url: str | None = None,
+    encode: Callable[[Any], Any] = lambda value: value,
+    decode: Callable[[Any], Any] = lambda value: value,
+) -> MemoryStore | RedisStore:
+    """Redis, если задан redis_url, иначе память процесса."""
+    if redis_url:
+        return RedisStore(name, ttl, redis_url, encode=encode, decode=decode)
+    return MemoryStore(name, ttl, max_entries)
+
+
+async def sweep_forever(stores: list, interval: float = 60.0) -> None:
+    """Периодически удаляет просроченные записи из всех хранилищ."""
+    while True:
+        await asyncio.sleep(interval)
+        for store in stores:
+            try:
+                store.sweep()
+            except Exception as e:
+                print(f"Ошибка очистки состояния {store.name}: {e}")
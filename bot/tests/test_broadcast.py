@@ -0,0 +1,115 @@
+"""
+Лимиты рассылки в broadcast.py и учёт исходов в Broadcaster. Запуск из bot/:
+
+    python3 -m pytest tests/test_broadcast.py
+"""
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+import broadcast
+from broadcast import Broadcaster, RateLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1024.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(broadcast, "time", clock)
+    return clock
+
+
+def elapsed(coro):
+    started = time.monotonic()
+    asyncio.run(coro)
+    return time.monotonic() - started
+
+
+def test_token_bucket_burst_then_rate(clock):
+    bucket = TokenBucket(rate=8, capacity=3)
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() == 0.125
+
+    clock.now += 0.0625
+    assert bucket.take() == 0.0625
+    clock.now += 0.0625
+    assert bucket.take() == 0.0
+    assert bucket.take() == 0.125
+
+
+def test_token_bucket_does_not_bank_above_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    clock.now += 60
+    assert [bucket.take() for _ in range(2)] == [0.0, 0.0]
+    assert bucket.take() > 0
+
+
+def test_rate_limiter_global_rate():
+    limiter = RateLimiter(rate=20, per_chat_interval=0)
+
+    async def send_all():
+        for chat_id in range(30):
+            await limiter.acquire(chat_id)
+
+    # 20 токенов в запасе, остальные 10 приходят со скоростью 20 в секунду
+    assert elapsed(send_all()) >= 0.45
+
+
+def test_rate_limiter_per_chat_interval():
+    limiter = RateLimiter(rate=1000, per_chat_interval=0.2)
+
+    async def send_twice():
+        await limiter.acquire(1)
+        await limiter.acquire(2)
+        await limiter.acquire(1)
+
+    assert elapsed(send_twice()) >= 0.18
+
+
+def test_rate_limiter_pause_stops_all_chats():
+    limiter = RateLimiter(rate=1000, per_chat_interval=0)
+
+    async def send_after_pause():
+        limiter.pause(0.2)
+        limiter.pause(0.05)
+        await asyncio.gather(limiter.acquire(1), limiter.acquire(2))
+
+    assert elapsed(send_after_pause()) >= 0.18
+
+
+def test_broadcaster_outcomes():
+    calls = {}
+
+    async def send(chat_id):
+        calls[chat_id] = calls.get(chat_id, 0) + 1
+        method = SendMessage(chat_id=chat_id, text="реклама")
+        if chat_id == 1:
+            return True
+        if chat_id == 2:
+            return False
+        if chat_id == 3:
+            raise TelegramForbiddenError(method=method, message="bot was blocked by the user")
+        if chat_id == 4 and calls[chat_id] == 1:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+        if chat_id == 4:
+            return True
+        raise RuntimeError("сеть недоступна")
+
+    results = {}
+    broadcaster = Broadcaster(send, RateLimiter(rate=1000, per_chat_interval=0), workers=3)
+    stats = asyncio.run(broadcaster.run(range(1, 6), on_result=results.__setitem__))
+
+    assert results == {1: "sent", 2: "skipped", 3: "blocked", 4: "sent", 5: "failed"}
+    assert (stats.queued, stats.sent, stats.skipped, stats.blocked, stats.failed, stats.retried) == (5, 2, 1, 1, 1, 1)
+    # Обычная ошибка не повторяется, повтор только после flood-wait
+    assert calls == {1: 1, 2: 1, 3: 1, 4: 2, 5: 1}
@@ -0,0 +1,111 @@
+"""
+Возобновление заданий рассылки из broadcast_jobs.py после падения процесса. Запуск из bot/:
+
+    python3 -m pytest tests/test_broadcast_jobs.py
+"""
+import asyncio
+
+from broadcast import Broadcaster, RateLimiter
+from broadcast_jobs import BroadcastJob, JobStore
+
+CHATS = list(range(1, 11))
+
+
+async def source(cursor):
+    """Получатели по возрастанию ID после курсора, как broadcast_recipients в bot.py."""
+    after = int(cursor) if cursor is not None else 0
+    for chat_id in CHATS:
+        if chat_id > after:
+            yield chat_id, str(chat_id)
+
+
+async def take(recipients, count):
+    chat_ids = []
+    async for chat_id in recipients:
+        chat_ids.append(chat_id)
+        if len(chat_ids) == count:
+            break
+    return chat_ids
+
+
+async def drain(recipients):
+    return [chat_id async for chat_id in recipients]
+
+
+def test_resume_after_crash(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = JobStore(path)
+    job_id = store.create("daily")
+    job = BroadcastJob(store, job_id)
+
+    assert asyncio.run(take(job.recipients(source(job.cursor)), 6)) == [1, 2, 3, 4, 5, 6]
+    # Воркеры завершают отправки не по порядку; в 4 процесс падает посреди отправки
+    job.record(3, "sent")
+    job.record(1, "sent")
+    job.record(5, "blocked")
+    job.record(2, "failed")
+    job.record(6, "sent")
+    assert store.status(job_id)["cursor"] == "3"
+    store.close()
+
+    store = JobStore(path)
+    assert [job["id"] for job in store.unfinished()] == [job_id]
+    job = BroadcastJob(store, job_id)
+    # Сначала неудачная отправка до курсора, затем всё после курсора, кроме уже обработанных 5 и 6
+    chat_ids = asyncio.run(drain(job.recipients(source(job.cursor))))
+    assert chat_ids == [2, 4, 7, 8, 9, 10]
+    for chat_id in chat_ids:
+        job.record(chat_id, "sent")
+    job.finish()
+
+    status = store.status(job_id)
+    assert status["status"] == "done"
+    assert status["cursor"] == "10"
+    assert status["counts"] == {"sent": 9, "skipped": 0, "blocked": 1, "failed": 0}
+    assert store.unfinished() == []
+    store.close()
+
+
+def test_resume_through_broadcaster_sends_each_chat_once(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    sent = []
+
+    async def run(fail_on=None, crash_after=None):
+        store = JobStore(path)
+        unfinished = store.unfinished()
+        job = BroadcastJob(store, unfinished[0]["id"] if unfinished else store.create("manual"))
+        crashed = asyncio.Event()
+
+        async def send(chat_id):
+            await asyncio.sleep(0)
+            if chat_id == fail_on:
+                raise RuntimeError("сеть недоступна")
+            sent.append(chat_id)
+            if len(sent) == crash_after:
+                crashed.set()
+            return True
+
+        broadcaster = Broadcaster(send, RateLimiter(rate=1000, per_chat_interval=0), workers=3)
+        task = asyncio.create_task(broadcaster.run(job.recipients(source(job.cursor)), on_result=job.record))
+        waiter = asyncio.create_task(crashed.wait())
+        await asyncio.wait([task, waiter], return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        if not task.done():
+            # Падение процесса: задание не завершено, в store остаётся то, что успели записать
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            store.close()
+            return None
+        job.finish()
+        status = store.status(job.id)
+        store.close()
+        return status
+
+    assert asyncio.run(run(fail_on=3, crash_after=5)) is None
+    assert 3 not in sent
+    status = asyncio.run(run())
+
+    assert sorted(sent) == CHATS
+    assert status["status"] == "done"
+    assert status["counts"]["sent"] == len(CHATS)
+    assert status["counts"]["failed"] == 0
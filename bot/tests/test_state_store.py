@@ -0,0 +1,84 @@
+"""
+TTL и вытеснение в MemoryStore из state_store.py. Время подменяется, чтобы не ждать TTL. Запуск из bot/:
+
+    python3 -m pytest tests/test_state_store.py
+"""
+import asyncio
+
+import pytest
+
+import state_store
+from state_store import MemoryStore, make_store
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(state_store, "time", clock)
+    return clock
+
+
+def test_entry_expires_after_ttl(clock):
+    store = MemoryStore("test", ttl=10, max_entries=100)
+    asyncio.run(store.set(1, "a"))
+
+    clock.now += 9
+    assert asyncio.run(store.get(1)) == "a"
+    # Чтение продлевает жизнь записи
+    clock.now += 9
+    assert asyncio.run(store.get(1)) == "a"
+
+    clock.now += 10
+    assert asyncio.run(store.get(1)) is None
+    assert store.expired == 1
+    assert store.size() == 0
+
+
+def test_sweep_removes_only_expired(clock):
+    store = MemoryStore("test", ttl=10, max_entries=100)
+    asyncio.run(store.set(1, "old"))
+    clock.now += 5
+    asyncio.run(store.set(2, "new"))
+
+    clock.now += 6
+    assert store.sweep() == 1
+    assert store.size() == 1
+    assert store.expired == 1
+    assert asyncio.run(store.get(2)) == "new"
+
+
+def test_incr_restarts_after_expiry(clock):
+    store = MemoryStore("test", ttl=10, max_entries=100)
+    assert [asyncio.run(store.incr(1)) for _ in range(3)] == [1, 2, 3]
+    clock.now += 10
+    assert asyncio.run(store.incr(1)) == 1
+
+
+def test_lru_eviction(clock):
+    store = MemoryStore("test", ttl=10, max_entries=3)
+
+    async def scenario():
+        for key in (1, 2, 3):
+            await store.set(key, key)
+        await store.get(1)
+        await store.set(4, 4)
+        return [await store.get(key) for key in (1, 2, 3, 4)]
+
+    # Вытесняется давно не использованная 2, а не первая записанная 1
+    assert asyncio.run(scenario()) == [1, None, 3, 4]
+    assert store.evicted == 1
+    assert store.size() == 3
+
+
+def test_make_store_without_redis():
+    store = make_store("test", ttl=10, max_entries=5)
+    assert isinstance(store, MemoryStore)
+    assert store.max_entries == 5
@@ -0,0 +1,142 @@
+"""
+Фоновая отправка событий трекинга из tracking.py: пачки, повторы с тем же batch_id
+и досылка при остановке. Запуск из bot/:
+
+    python3 -m pytest tests/test_tracking.py
+"""
+import asyncio
+
+from tracking import TrackingQueue
+
+
+class FakeApi:
+    """send_batch, который падает первые failures вызовов и учитывает пачку один раз по batch_id."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self.applied = {}
+
+    async def send_batch(self, batch_id, events):
+        self.calls.append(batch_id)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("API недоступен")
+        self.applied.setdefault(batch_id, list(events))
+
+    def events(self):
+        return [event["userId"] for batch in self.applied.values() for event in batch]
+
+
+def add_events(queue, count, start=0):
+    for user_id in range(start, start + count):
+        queue.add("impression", "c1", user_id)
+
+
+def test_flush_full_batches_then_drain_on_close():
+    api = FakeApi()
+
+    async def scenario():
+        queue = TrackingQueue(api.send_batch, max_batch=3, flush_interval=60)
+        queue.start()
+        add_events(queue, 7)
+        await asyncio.sleep(0.05)
+        # Полные пачки уходят сразу, не дожидаясь flush_interval
+        assert len(api.applied) == 2
+        assert queue.stats()["pending"] == 1
+        await queue.close()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert api.events() == list(range(7))
+    assert stats == {"pending": 0, "sent": 7, "batches": 3, "retries": 0, "dropped": 0}
+
+
+def test_flush_by_interval():
+    api = FakeApi()
+
+    async def scenario():
+        queue = TrackingQueue(api.send_batch, max_batch=100, flush_interval=0.05)
+        queue.start()
+        add_events(queue, 2)
+        await asyncio.sleep(0.2)
+        assert api.events() == [0, 1]
+        await queue.close()
+
+    asyncio.run(scenario())
+
+
+def test_retry_keeps_batch_id():
+    api = FakeApi(failures=2)
+
+    async def scenario():
+        queue = TrackingQueue(api.send_batch, max_batch=5, flush_interval=60, backoff=0.001)
+        queue.start()
+        add_events(queue, 5)
+        await asyncio.sleep(0.1)
+        await queue.close()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert len(api.calls) == 3
+    assert len(set(api.calls)) == 1
+    assert api.events() == list(range(5))
+    assert stats == {"pending": 0, "sent": 5, "batches": 1, "retries": 2, "dropped": 0}
+
+
+def test_batch_dropped_after_max_retries():
+    api = FakeApi(failures=3)
+
+    async def scenario():
+        queue = TrackingQueue(api.send_batch, max_batch=4, flush_interval=60, max_retries=2, backoff=0.001)
+        queue.start()
+        add_events(queue, 4)
+        await asyncio.sleep(0.1)
+        add_events(queue, 1, start=4)
+        await queue.close()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert api.calls.count(api.calls[0]) == 3
+    assert api.events() == [4]
+    assert stats == {"pending": 0, "sent": 1, "batches": 1, "retries": 2, "dropped": 4}
+
+
+def test_close_resends_interrupted_batch_with_same_id():
+    calls = []
+
+    async def scenario():
+        hang = asyncio.Event()
+
+        async def send_batch(batch_id, events):
+            calls.append((batch_id, len(events)))
+            if len(calls) == 1:
+                # Первая отправка зависает, пока close() не отменит фоновую задачу
+                await hang.wait()
+
+        queue = TrackingQueue(send_batch, max_batch=3, flush_interval=60)
+        queue.start()
+        add_events(queue, 4)
+        await asyncio.sleep(0.05)
+        assert queue.stats()["pending"] == 4
+        await queue.close()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert calls[0] == calls[1] == (calls[0][0], 3)
+    assert calls[2][0] != calls[0][0] and calls[2][1] == 1
+    assert stats["pending"] == 0 and stats["sent"] == 4 and stats["dropped"] == 0
+
+
+def test_overflow_drops_oldest():
+    api = FakeApi()
+
+    async def scenario():
+        queue = TrackingQueue(api.send_batch, max_batch=100, max_queue=3)
+        add_events(queue, 5)
+        await queue.close()
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert api.events() == [2, 3, 4]
+    assert stats["dropped"] == 2
@@ -0,0 +1,114 @@
+# Очередь событий трекинга рекламы: показы и клики уходят в API пачками в фоне
+from __future__ import annotations
+
+import asyncio
+import uuid
+from collections import deque
+from typing import Awaitable, Callable
+
+
+class TrackingQueue:
+    """Буфер событий {"type", "campaignId", "userId"} с фоновой отправкой.
+
+    add() не ждёт сеть. Пачка уходит, как только набралось max_batch событий
+    или прошло flush_interval секунд с прошлой отправки. Ошибку отправки
+    повторяем с экспоненциальной задержкой; пачка, не ушедшая за max_retries
+    попыток, отбрасывается. Буфер ограничен max_queue: при переполнении
+    вытесняются самые старые события, чтобы недоступный API не съел память.
+
+    send_batch(batch_id, events) получает один и тот же batch_id при всех
+    повторах пачки: ответ мог потеряться после того, как API учёл пачку, и
+    API по batch_id не учитывает её второй раз.
+    """
+
+    def __init__(
+        self,
+        send_batch: Callable[[str, list[dict]], Awaitable[None]],
+        max_batch: int = 200,
+        flush_interval: float = 2.0,
+        max_queue: int = 20_000,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+    ):
+        self.send_batch = send_batch
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._events: deque[dict] = deque()
+        # Пачка, отправка которой прервана остановкой: досылается с тем же batch_id
+        self._inflight: tuple[str, list[dict]] | None = None
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        self.sent = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+
+    def add(self, event_type: str, campaign_id: str, user_id: int) -> None:
+        if len(self._events) >= self.max_queue:
+            self._events.popleft()
+            self.dropped += 1
+        self._events.append({"type": event_type, "campaignId": campaign_id, "userId": user_id})
+        if len(self._events) >= self.max_batch:
+            self._full.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Останавливает фоновую отправку и досылает всё, что осталось в буфере."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self._inflight or self._events:
+            await self._flush_batch(retries=1)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._events) + (len(self._inflight[1]) if self._inflight else 0),
+            "sent": self.sent,
+            "batches": self.batches,
+            "retries": self.retries,
+            "dropped": self.dropped,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            while self._events:
+                await self._flush_batch(self.max_retries)
+                if len(self._events) < self.max_batch:
+                    break
+
+    async def _flush_batch(self, retries: int) -> None:
+        if self._inflight is None:
+            batch = [self._events.popleft() for _ in range(min(self.max_batch, len(self._events)))]
+            self._inflight = (uuid.uuid4().hex, batch)
+        batch_id, batch = self._inflight
+        # При отмене посреди отправки пачка остаётся в _inflight, close() дошлёт её с тем же batch_id
+        for attempt in range(retries + 1):
+            try:
+                await self.send_batch(batch_id, batch)
+            except Exception as e:
+                if attempt == retries:
+                    print(f"Трекинг рекламы: не удалось отправить {len(batch)} событий: {e}")
+                    break
+                self.retries += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+            else:
+                self._inflight = None
+                self.sent += len(batch)
+                self.batches += 1
+                return
+        self._inflight = None
+        self.dropped += len(batch)
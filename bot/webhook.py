@@ -0,0 +1,85 @@
+# Режим webhook: Telegram сам присылает апдейты POST-запросами на aiohttp-сервер бота
+from __future__ import annotations
+
+import asyncio
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Отвечает Telegram сразу и обрабатывает апдейт в фоне (handle_in_background).
+
+    При остановке сначала дожидается уже принятых апдейтов, и только потом
+    закрывает сессию бота — иначе ответы на них потерялись бы.
+    """
+
+    def __init__(self, *args, drain_timeout: float = 25.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.drain_timeout = drain_timeout
+
+    async def close(self) -> None:
+        pending = set(self._background_feed_update_tasks)
+        if pending:
+            print(f"Webhook: жду обработки {len(pending)} апдейтов перед остановкой")
+            await asyncio.wait(pending, timeout=self.drain_timeout)
+        await super().close()
+
+
+def build_app(dispatcher: Dispatcher, bot: Bot, path: str, secret_token: str) -> web.Application:
+    """aiohttp-приложение с маршрутом для апдейтов и /healthz для балансировщика.
+
+    Запросы без верного заголовка X-Telegram-Bot-Api-Secret-Token получают 401.
+    """
+    async def healthz(request: web.Request) -> web.Response:
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_get("/healthz", healthz)
+    DrainingRequestHandler(dispatcher=dispatcher, bot=bot, secret_token=secret_token).register(app, path=path)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def run_webhook(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    *,
+    host: str,
+    port: int,
+    path: str,
+    secret_token: str,
+    public_url: str | None = None,
+) -> None:
+    """Слушает host:port до SIGINT/SIGTERM, затем перестаёт принимать апдейты и дорабатывает принятые.
+
+    Если задан public_url, при старте регистрирует его в Telegram через setWebhook.
+    Webhook при остановке не снимается: за балансировщиком могут работать другие экземпляры.
+    """
+    runner = web.AppRunner(build_app(dispatcher, bot, path, secret_token), handle_signals=False)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    print(f"Webhook: слушаю http://{host}:{port}{path}")
+
+    if public_url:
+        await bot.set_webhook(
+            public_url,
+            secret_token=secret_token,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+        print(f"Webhook: зарегистрирован {public_url}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        print("Webhook: остановка")
+        await runner.cleanup()